@@ -0,0 +1,75 @@
+import argparse
+import time
+import tracemalloc
+import common # Puts the repository root on sys.path
+
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.stats import count_nodes
+from blok.typechecker import TypeChecker
+
+
+NUM_FUNCTIONS = 100_000
+
+FUNCTION_TEMPLATE = """int Func{n}(int a, int b) {{
+    int total = a * 2 + b;
+    if total > 10 {{
+        total -= 3;
+    }}
+
+    for i = 0 .. b step 1 {{
+        total += i;
+    }}
+
+    return total;
+}}
+
+"""
+
+MAIN = """int Main() {
+    return Func0(1, 2);
+}
+"""
+
+
+def make_program(num_funcs):
+    return "".join(FUNCTION_TEMPLATE.format(n=n) for n in range(num_funcs)) + MAIN
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the memory of the AST and the time of the front end")
+    parser.add_argument("--functions", type=int, default=NUM_FUNCTIONS,
+                        help="number of functions in the generated program")
+    args = parser.parse_args()
+    text = make_program(args.functions)
+
+    # The memory the AST, with its tokens, keeps alive once the lexer is gone
+    tracemalloc.start()
+    ast = parse_blkprogram(Lexer(text))
+    ast_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    num_nodes = count_nodes(ast)
+    del ast
+
+    lexer = Lexer(text)
+    start_time = time.perf_counter()
+    ast = parse_blkprogram(lexer)
+    parse_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    TypeChecker(ast)
+    typecheck_time = time.perf_counter() - start_time
+    assert len(lexer.errors) == 0
+
+    print(f"functions:           {args.functions}")
+    print(f"source size:         {len(text) / (1024 * 1024):.1f} MB")
+    print(f"AST nodes:           {num_nodes}")
+    print(f"AST memory:          {ast_size / (1024 * 1024):.1f} MB")
+    print(f"bytes per node:      {ast_size / num_nodes:.1f} (tokens and lists included)")
+    print(f"lex + parse:         {parse_time:.2f}s")
+    print(f"typecheck:           {typecheck_time:.2f}s")
+    print(f"front end:           {parse_time + typecheck_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import time
+import common # Puts the repository root on sys.path
+
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.stats import count_nodes
+from blok.typechecker import TypeChecker
+
+
+NUM_FUNCTIONS = 5000
+DEEP_EXPRESSION_TERMS = 100_000
+DEEP_NESTING_DEPTH = 400
+
+FUNCTION_TEMPLATE = """int Func{n}(int a, int b) {{
+    int total = a * 2 + b;
+    if total > 10 {{
+        total -= 3;
+    }} else {{
+        total = Func{n}(a - 1, b) + 1;
+    }}
+
+    for i = 0 .. b step 1 {{
+        total += i * (a - 2);
+    }}
+
+    while total > 100 {{
+        total = total - 7;
+    }}
+
+    return total;
+}}
+
+"""
+
+MAIN = """int Main() {
+    return Func0(1, 2);
+}
+"""
+
+
+def make_program(num_funcs):
+    return "".join(FUNCTION_TEMPLATE.format(n=n) for n in range(num_funcs)) + MAIN
+
+
+def make_deep_expression(num_terms):
+    return "int Main() {\n    return " + " + ".join(["1"] * num_terms) + ";\n}\n"
+
+
+def make_deep_nesting(depth):
+    blocks = "".join(f"if a < {i + 1} {{ int b{i} = a; " for i in range(depth))
+    return f"int Main() {{\n    int a = 0;\n    {blocks}a = 1; {'} ' * depth}\n    return a;\n}}\n"
+
+
+# Times the type checker and the code generator on fresh ASTs, as both of them
+# fill in the AST. Returns the best times, or None if a pass hit the recursion
+# limit.
+def time_passes(text, iterative, num_runs):
+    best_typecheck = None
+    best_codegen = None
+    for _ in range(num_runs):
+        ast = parse_blkprogram(Lexer(text))
+        try:
+            start_time = time.perf_counter()
+            TypeChecker(ast, iterative=iterative)
+            typecheck_time = time.perf_counter() - start_time
+            codegen = CodeGenByteCode(ast, iterative=iterative)
+            start_time = time.perf_counter()
+            codegen.gen_bytecode_blkfile()
+            codegen_time = time.perf_counter() - start_time
+        except RecursionError:
+            return None
+
+        if best_typecheck == None or typecheck_time < best_typecheck:
+            best_typecheck = typecheck_time
+        if best_codegen == None or codegen_time < best_codegen:
+            best_codegen = codegen_time
+
+    return best_typecheck, best_codegen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the type checker and the bytecode "
+                                                 "generator walking the AST, recursively and "
+                                                 "with an explicit stack")
+    parser.add_argument("--functions", type=int, default=NUM_FUNCTIONS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    programs = [
+        (f"{args.functions} functions", make_program(args.functions)),
+        (f"{DEEP_EXPRESSION_TERMS} term sum", make_deep_expression(DEEP_EXPRESSION_TERMS)),
+        (f"{DEEP_NESTING_DEPTH} nested ifs", make_deep_nesting(DEEP_NESTING_DEPTH)),
+    ]
+    print(f"{'program':>20}{'nodes':>9}{'walk':>11}{'typecheck (s)':>15}{'ns/node':>9}"
+          f"{'codegen (s)':>13}{'ns/node':>9}")
+    for name, text in programs:
+        num_nodes = count_nodes(parse_blkprogram(Lexer(text)))
+        for iterative in [False, True]:
+            walk = "iterative" if iterative else "recursive"
+            times = time_passes(text, iterative, args.runs)
+            if times == None:
+                print(f"{name:>20}{num_nodes:>9}{walk:>11}{'RecursionError':>15}")
+                continue
+
+            typecheck_time, codegen_time = times
+            print(f"{name:>20}{num_nodes:>9}{walk:>11}"
+                  f"{typecheck_time:>15.3f}{typecheck_time / num_nodes * 1e9:>9.0f}"
+                  f"{codegen_time:>13.3f}{codegen_time / num_nodes * 1e9:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
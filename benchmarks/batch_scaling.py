@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+import common # Puts the repository root on sys.path
+
+from blok.batch import DEFAULT_CHUNKSIZE, run_batch
+from blok.program import compile
+
+
+# Main takes the argument, so one program runs over many inputs
+FIB_PROGRAM = """int Fib(int n) {
+    if n < 2 {
+        return n;
+    }
+
+    return Fib(n - 1) + Fib(n - 2);
+}
+
+int Main(int n) {
+    return Fib(n);
+}
+"""
+
+NUM_JOBS = 200
+# Inputs cycle through these, so the jobs take different amounts of time
+FIB_INPUTS = [12, 14, 16, 18]
+
+
+def time_serial(program, jobs):
+    start_time = time.perf_counter()
+    results = [program.run(args) for _, args in jobs]
+    return time.perf_counter() - start_time, [result.values for result in results]
+
+
+def time_batch(program, jobs, workers, chunksize):
+    start_time = time.perf_counter()
+    results = run_batch([program], jobs, workers, chunksize)
+    return time.perf_counter() - start_time, [result.values for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time running many jobs of one program in a "
+                                                 "process pool of 1 to N workers")
+    parser.add_argument("--jobs", type=int, default=NUM_JOBS)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(),
+                        help="largest pool to time, the number of cores by default")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    program = compile(FIB_PROGRAM)
+    jobs = [(0, [FIB_INPUTS[i % len(FIB_INPUTS)]]) for i in range(args.jobs)]
+    serial_time, expected = time_serial(program, jobs)
+    print(f"{os.cpu_count()} cores, {args.jobs} jobs, chunks of {args.chunksize}")
+    print(f"{'workers':>8}{'time (s)':>10}{'jobs/s':>10}{'speedup':>9}")
+    print(f"{'serial':>8}{serial_time:>10.3f}{args.jobs / serial_time:>10.0f}{1:>9.2f}")
+    for workers in range(1, args.max_workers + 1):
+        elapsed, values = time_batch(program, jobs, workers, args.chunksize)
+        assert values == expected
+        print(f"{workers:>8}{elapsed:>10.3f}{args.jobs / elapsed:>10.0f}"
+              f"{serial_time / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
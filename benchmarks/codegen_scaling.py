@@ -0,0 +1,85 @@
+import argparse
+import time
+import common # Puts the repository root on sys.path
+
+from blok.codegen_bytecode import ByteCode, CodeGenByteCode
+
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+# Builds the unoptimized bytecode for a program of roughly num_instrs
+# instructions out of small procedures with a loop, without running the
+# front end, so only the code generator's own passes are measured
+def make_codegen(num_instrs):
+    codegen = CodeGenByteCode(None)
+    codegen.bytecode = [
+        (ByteCode.CALL_PROCEDURE, "F0", 0),
+        (ByteCode.STOP,)
+    ]
+
+    num_funcs = 0
+    while len(codegen.bytecode) < num_instrs:
+        ident = f"F{num_funcs}"
+        start_label = codegen.get_new_label()
+        loop_label = codegen.get_new_label()
+        end_label = codegen.get_new_label()
+        codegen.funcident_to_label[ident] = start_label
+        codegen.bytecode += [
+            (ByteCode.LABEL, start_label),
+            (ByteCode.INCR_STACK_BY_CONST, 1),
+            (ByteCode.PUSH_CONST, 0),
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, 0),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.STORE_VALUE_AT_IDX,),
+            (ByteCode.LABEL, loop_label),
+            (ByteCode.PUSH_CONST, 10),
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, 0),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.LOAD_VALUE_AT_IDX,),
+            (ByteCode.JUMP_IF_LESS_THAN, end_label),
+            (ByteCode.PUSH_CONST, 1),
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, 0),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.LOAD_VALUE_AT_IDX,),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, 0),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.STORE_VALUE_AT_IDX,),
+            (ByteCode.INCR_STACK_BY_CONST, 0),
+            (ByteCode.JUMP, loop_label),
+            (ByteCode.LABEL, end_label),
+            (ByteCode.CALL_PROCEDURE, ident, 0),
+            (ByteCode.RETURN, 0),
+        ]
+        num_funcs += 1
+
+    return codegen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the code generator's optimization and "
+                                                 "label passes on programs of growing size")
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES,
+                        help="rough numbers of instructions of the programs to generate")
+    args = parser.parse_args()
+    print(f"{'instructions':>12}{'optimize (s)':>14}{'labels (s)':>12}{'ns/instr':>10}")
+    for size in args.sizes:
+        codegen = make_codegen(size)
+        num_instrs = len(codegen.bytecode)
+        start_time = time.perf_counter()
+        codegen.optimize_bytecode()
+        optimize_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        codegen.replace_labels_by_idx()
+        labels_time = time.perf_counter() - start_time
+        per_instr = (optimize_time + labels_time) / num_instrs * 1e9
+        print(f"{num_instrs:>12}{optimize_time:>14.3f}{labels_time:>12.3f}{per_instr:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.codegen_python import CodeGenPython
+from blok.codegen_register import CodeGenRegister
+from blok.error import CompileFailed, report_errors
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.typechecker import TypeChecker
+
+
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+# The programs the backend and interpreter comparisons run by default
+PROGRAMS = ["recursive_fib", "deep_recursion", "array_sweep", "nested_loops"]
+REPETITIONS = 5
+
+
+def program_path(name):
+    return os.path.join(PROGRAMS_DIR, f"{name}.blk")
+
+
+def parse_program(path):
+    with open(path) as blkfile:
+        text = blkfile.read()
+
+    lexer = Lexer(text)
+    try:
+        ast = parse_blkprogram(lexer)
+    except CompileFailed as err:
+        report_errors(err.errors)
+        sys.exit(1)
+
+    TypeChecker(ast)
+    if len(lexer.errors) > 0:
+        report_errors(lexer.errors)
+        sys.exit(1)
+
+    return ast
+
+
+def compile_program(path, **codegen_options):
+    ast = parse_program(path)
+    codegen = CodeGenByteCode(ast, **codegen_options)
+    bytecode = codegen.gen_bytecode()
+    return bytecode, codegen.idx_to_funcident
+
+
+def compile_register_program(path):
+    codegen = CodeGenRegister(parse_program(path))
+    code = codegen.gen_code()
+    return code, codegen.idx_to_funcident
+
+
+def compile_python_program(path):
+    return CodeGenPython(parse_program(path)).gen_source()
+
+
+# Runs the code REPETITIONS times and returns the last result and the best time
+def bench(interp, code, func_names):
+    best = None
+    for _ in range(REPETITIONS):
+        start_time = time.perf_counter()
+        result = interp(code, func_names=func_names)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best == None else min(best, elapsed)
+
+    return result, best
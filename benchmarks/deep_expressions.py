@@ -0,0 +1,60 @@
+import argparse
+import time
+import common # Puts the repository root on sys.path
+
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def make_chain(size):
+    return " - ".join(str(i % 10) for i in range(size))
+
+
+def make_parens(size):
+    return "(" * size + "1" + ")" * size
+
+
+def make_unary(size):
+    return "-" * size + "1"
+
+
+# Alternates the operator precedences, so the operator stack grows and shrinks
+def make_mixed(size):
+    return " + ".join(f"{i % 10} * ({i % 7} - 1)" for i in range(size // 3))
+
+
+SHAPES = {
+    "chain": make_chain,
+    "parens": make_parens,
+    "unary": make_unary,
+    "mixed": make_mixed,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time parsing one expression of growing size "
+                                                 "and nesting depth")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'shape':>8}{'size':>9}{'parse (s)':>12}{'us/token':>10}")
+    for name, make_expr in SHAPES.items():
+        for size in SIZES:
+            text = f"int Main() {{\n    int a = {make_expr(size)};\n    return a;\n}}\n"
+            best = None
+            for _ in range(args.runs):
+                lexer = Lexer(text)
+                start_time = time.perf_counter()
+                parse_blkprogram(lexer)
+                elapsed = time.perf_counter() - start_time
+                best = elapsed if best == None else min(best, elapsed)
+
+            per_token = best / len(lexer.kinds) * 1e6
+            print(f"{name:>8}{size:>9}{best:>12.3f}{per_token:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+import common # Puts the repository root on sys.path
+
+from ast_walk import FUNCTION_TEMPLATE, make_program
+from blok.blok_vm import lower_bytecode
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.incremental import compile_incremental
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.typechecker import TypeChecker
+
+
+NUM_FUNCTIONS = 10_000
+EDITED_FUNCTION = NUM_FUNCTIONS // 2
+
+
+def compile_full(text):
+    ast = parse_blkprogram(Lexer(text))
+    TypeChecker(ast)
+    codegen = CodeGenByteCode(ast)
+    return lower_bytecode(codegen.gen_bytecode()), "all"
+
+
+# The functions recurse without end, so the code is compared to that of a full
+# compile instead of being run
+def time_compile(name, compile_text, text, expected=None):
+    start_time = time.perf_counter()
+    code, recompiled = compile_text(text)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:<30}{elapsed:>10.3f}{recompiled:>12}")
+    if expected != None:
+        assert code == expected, name
+
+    return code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time recompiling a large file after editing "
+                                                 "one function, from scratch and with the "
+                                                 "per-function cache")
+    parser.add_argument("--functions", type=int, default=NUM_FUNCTIONS)
+    args = parser.parse_args()
+    edited = min(EDITED_FUNCTION, args.functions - 1)
+    text = make_program(args.functions)
+    function = FUNCTION_TEMPLATE.format(n=edited)
+    body_edit = text.replace(function, function.replace("total - 7", "total - 8"))
+    signature_edit = text.replace(function, function.replace("int b)", "int b, int c)")
+                                                     .replace("+ 1;", "+ c;")
+                                                     .replace(f"Func{edited}(a - 1, b)",
+                                                              f"Func{edited}(a - 1, b, 1)"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, "Main.blki")
+        def incremental(text):
+            built = compile_incremental(text, cache_path)
+            return built.code, len(built.recompiled)
+
+        print(f"{args.functions} functions, {len(text) / (1024 * 1024):.1f} MB")
+        print(f"{'compile':<30}{'time (s)':>10}{'recompiled':>12}")
+        expected = time_compile("full", compile_full, text)
+        time_compile("incremental, empty cache", incremental, text, expected)
+        time_compile("incremental, unchanged", incremental, text, expected)
+        expected = time_compile("full, body edited", compile_full, body_edit)
+        time_compile("incremental, body edited", incremental, body_edit, expected)
+        expected = compile_full(signature_edit)[0]
+        time_compile("incremental, signature edited", incremental, signature_edit, expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import mmap
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import common # Puts the repository root on sys.path
+
+from blok.lexer import Lexer, StreamLexer
+from blok.token import TokenKind
+
+
+SIZES_LINES = [250_000, 1_000_000, 2_000_000]
+# Lexing the whole text keeps every token, which takes gigabytes beyond this
+TEXT_MODE_MAX_LINES = 1_000_000
+MODES = ["text", "stream", "mmap"]
+
+LINE_TEMPLATES = [
+    "int Func{n}(int a, int b) {{",
+    "    int total = a * 3 + b;",
+    "    for i = 0 .. 100 step 1 {{",
+    "        total += i;",
+    "    }}",
+    "",
+    "    return total;",
+    "}}",
+    "",
+]
+
+
+def write_program(path, num_lines):
+    with open(path, "w") as blkfile:
+        for line_idx in range(num_lines):
+            template = LINE_TEMPLATES[line_idx % len(LINE_TEMPLATES)]
+            blkfile.write(template.format(n=line_idx // len(LINE_TEMPLATES)) + "\n")
+
+
+# Consumes the tokens the way the parser does
+def drain(lexer):
+    num_tokens = 0
+    while lexer.peek_kind() != TokenKind.EOF:
+        lexer.peek_token(1)
+        lexer.eat_next_token()
+        num_tokens += 1
+
+    return num_tokens
+
+
+# Runs in a fresh process, so ru_maxrss is the peak of this mode alone
+def lex_child(mode, path):
+    start_time = time.perf_counter()
+    if mode == "text":
+        with open(path) as blkfile:
+            num_tokens = drain(Lexer(blkfile.read()))
+    elif mode == "stream":
+        with open(path) as blkfile:
+            num_tokens = drain(StreamLexer(blkfile))
+    else:
+        with open(path, "rb") as blkfile:
+            with mmap.mmap(blkfile.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                num_tokens = drain(StreamLexer(source))
+
+    elapsed = time.perf_counter() - start_time
+    # ru_maxrss is in kilobytes on Linux
+    print(num_tokens, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def run_child(mode, path):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, path],
+                            check=True, capture_output=True, text=True).stdout
+    num_tokens, elapsed, max_rss = output.split()
+    return int(num_tokens), float(elapsed), int(max_rss) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the peak memory of lexing whole texts and streaming them")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES_LINES,
+                        help="numbers of lines of the generated programs")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child != None:
+        lex_child(*args.child)
+        return
+
+    print(f"{'lines':>10}{'size (MB)':>11}{'mode':>8}{'tokens':>10}{'time (s)':>10}{'peak RSS (MB)':>15}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for num_lines in args.sizes:
+            path = os.path.join(tmpdir, f"generated_{num_lines}.blk")
+            write_program(path, num_lines)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            for mode in MODES:
+                if mode == "text" and num_lines > TEXT_MODE_MAX_LINES:
+                    continue
+
+                num_tokens, elapsed, max_rss = run_child(mode, path)
+                print(f"{num_lines:>10}{size_mb:>11.1f}{mode:>8}{num_tokens:>10}"
+                      f"{elapsed:>10.2f}{max_rss:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import tempfile
+import time
+import common # Puts the repository root on sys.path
+
+from blok.lexer import Lexer
+from blok.token import TokenKind
+
+
+SIZES_MB = [1, 4]
+REPETITIONS = 3
+
+FUNCTION_TEMPLATE = """int Func{n}(int a, int b) {{
+    int total = 0x1C + b;
+    for i = 0 .. 1000 step 2 {{
+        if i * a >= total {{
+            total -= i;
+        }} else {{
+            total += Func{prev}(i, b) * 3;
+        }}
+    }}
+
+    while total != 0 {{
+        total = total - 1;
+    }}
+
+    return total;
+}}
+
+"""
+
+
+# Writes a .blk file of at least size_mb megabytes out of similar functions
+def write_program(path, size_mb):
+    size = 0
+    n = 0
+    with open(path, "w") as blkfile:
+        while size < size_mb * 1024 * 1024:
+            size += blkfile.write(FUNCTION_TEMPLATE.format(n=n, prev=max(n - 1, 0)))
+            n += 1
+
+
+def lex(text, fast):
+    lexer = Lexer(text, fast)
+    while len(lexer.kinds) == 0 or lexer.kinds[-1] != TokenKind.EOF:
+        lexer.read_token()
+
+    return lexer
+
+
+def best_time(text, fast):
+    best = None
+    for _ in range(REPETITIONS):
+        start_time = time.perf_counter()
+        lexer = lex(text, fast)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best == None else min(best, elapsed)
+
+    return lexer, best
+
+
+def same_tokens(lexer1, lexer2):
+    return lexer1.kinds == lexer2.kinds and lexer1.lines == lexer2.lines and \
+           lexer1.values == lexer2.values
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of the regex and the character by character lexer")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES_MB,
+                        help="sizes in megabytes of the generated programs")
+    args = parser.parse_args()
+    print(f"{'size (MB)':>10}{'tokens':>10}{'by char (MB/s)':>16}{'regex (MB/s)':>14}{'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size_mb in args.sizes:
+            path = os.path.join(tmpdir, f"generated_{size_mb}mb.blk")
+            write_program(path, size_mb)
+            with open(path) as blkfile:
+                text = blkfile.read()
+
+            megabytes = len(text.encode()) / (1024 * 1024)
+            char_lexer, char_time = best_time(text, False)
+            fast_lexer, fast_time = best_time(text, True)
+            assert same_tokens(char_lexer, fast_lexer)
+            print(f"{megabytes:>10.1f}{len(fast_lexer.kinds):>10}{megabytes / char_time:>16.2f}"
+                  f"{megabytes / fast_time:>14.2f}{char_time / fast_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
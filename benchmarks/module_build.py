@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+import common # Puts the repository root on sys.path
+
+from blok.blok_vm import interp_lowered
+from blok.modules import build
+
+
+NUM_MODULES = 16
+FUNCTIONS_PER_MODULE = 200
+
+FUNCTION_TEMPLATE = """int M{m}F{n}(int a) {{
+    int total = a;
+    for i = 0 .. 3 step 1 {{
+        total += i * {n};
+    }}
+
+    return total;
+}}
+
+"""
+
+
+# Module m imports module m - 1, whose last function each module's first one calls
+def write_modules(directory, num_modules, num_funcs):
+    for m in range(num_modules):
+        text = f"import Mod{m - 1};\n\n" if m > 0 else ""
+        text += "".join(FUNCTION_TEMPLATE.format(m=m, n=n) for n in range(num_funcs))
+        if m > 0:
+            text += f"int M{m}Chain(int a) {{\n    return M{m - 1}F{num_funcs - 1}(a) + 1;\n}}\n"
+
+        with open(os.path.join(directory, f"Mod{m}.blk"), "w") as blkfile:
+            blkfile.write(text)
+
+    last = num_modules - 1
+    main = f"import Mod{last};\n\nint Main() {{\n    return M{last}Chain(1);\n}}\n"
+    with open(os.path.join(directory, "Main.blk"), "w") as blkfile:
+        blkfile.write(main)
+
+
+def time_build(path, workers, use_cache):
+    start_time = time.perf_counter()
+    built = build(path, workers, use_cache)
+    return time.perf_counter() - start_time, built
+
+
+def print_build(name, elapsed, built):
+    result = interp_lowered(built.code, func_names=built.func_names)
+    print(f"{name:<28}{elapsed:>10.3f}{len(built.recompiled):>12}  {result.values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time building a program of many modules from "
+                                                 "scratch, from the cache and after editing one "
+                                                 "module")
+    parser.add_argument("--modules", type=int, default=NUM_MODULES)
+    parser.add_argument("--functions", type=int, default=FUNCTIONS_PER_MODULE)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(),
+                        help="largest pool to time, the number of cores by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_modules(directory, args.modules, args.functions)
+        path = os.path.join(directory, "Main.blk")
+        print(f"{os.cpu_count()} cores, {args.modules} modules of {args.functions} functions")
+        print(f"{'build':<28}{'time (s)':>10}{'recompiled':>12}  result")
+        for workers in range(1, args.max_workers + 1):
+            print_build(f"cold, {workers} workers", *time_build(path, workers, False))
+
+        time_build(path, args.max_workers, True)
+        print_build("warm", *time_build(path, args.max_workers, True))
+
+        # A body changes, the interface stays the same
+        edited_path = os.path.join(directory, "Mod0.blk")
+        with open(edited_path) as blkfile:
+            text = blkfile.read()
+        with open(edited_path, "w") as blkfile:
+            blkfile.write(text.replace("int total = a;", "int total = a + 1;", 1))
+
+        print_build("one module edited", *time_build(path, args.max_workers, True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import time
+from collections import deque
+import common # Puts the repository root on sys.path
+
+from blok.blok_vm import run_lowered
+from blok.program import compile
+from blok.scheduler import DEFAULT_SLICE_INSTRS, run_round_robin
+
+
+FIB_PROGRAM = """int Fib(int n) {
+    if n < 2 {
+        return n;
+    }
+
+    return Fib(n - 1) + Fib(n - 2);
+}
+
+int Main(int n) {
+    return Fib(n);
+}
+"""
+
+LONG_INPUT = 22
+SHORT_INPUT = 12
+NUM_SHORT = 20
+SLICE_SIZES = [100, 1_000, 10_000, 100_000]
+
+
+# Best of a few runs, as the first ones are slower
+def time_sliced(program, slice_instrs, repeats=3):
+    best_time = None
+    for _ in range(repeats):
+        execution = program.start([LONG_INPUT])
+        start_time = time.perf_counter()
+        result = None
+        while result == None:
+            result = run_lowered(execution, slice_instrs)
+
+        elapsed = time.perf_counter() - start_time
+        best_time = elapsed if best_time == None else min(best_time, elapsed)
+
+    return best_time, result
+
+
+# Runs the executions one after the other and returns when each finished
+def finish_times_in_turn(executions):
+    start_time = time.perf_counter()
+    finish_times = []
+    for execution in executions:
+        run_lowered(execution)
+        finish_times.append(time.perf_counter() - start_time)
+
+    return finish_times
+
+
+# Takes turns like run_round_robin, noting when each execution finished
+def finish_times_round_robin(executions, slice_instrs):
+    start_time = time.perf_counter()
+    finish_times = [None] * len(executions)
+    ready = deque(range(len(executions)))
+    while len(ready) > 0:
+        idx = ready.popleft()
+        if run_lowered(executions[idx], slice_instrs) == None:
+            ready.append(idx)
+        else:
+            finish_times[idx] = time.perf_counter() - start_time
+
+    return finish_times
+
+
+def time_round_robin(executions, slice_instrs):
+    start_time = time.perf_counter()
+    run_round_robin(executions, slice_instrs)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the cost of running a program a slice "
+                                                 "at a time, and how long short programs wait "
+                                                 "behind a long one with and without taking turns")
+    parser.add_argument("--short", type=int, default=NUM_SHORT,
+                        help="number of short programs queued behind the long one")
+    parser.add_argument("--slice", type=int, default=DEFAULT_SLICE_INSTRS,
+                        help="slice size for the round robin")
+    args = parser.parse_args()
+
+    program = compile(FIB_PROGRAM)
+    full_time, expected = time_sliced(program, None)
+    print(f"Fib({LONG_INPUT}), {expected.num_instrs} instructions")
+    print(f"{'slice':>10}{'time (s)':>10}{'overhead':>10}")
+    print(f"{'none':>10}{full_time:>10.3f}{1:>10.2f}")
+    for slice_instrs in SLICE_SIZES:
+        elapsed, result = time_sliced(program, slice_instrs)
+        assert result.values == expected.values
+        print(f"{slice_instrs:>10}{elapsed:>10.3f}{elapsed / full_time:>10.2f}")
+
+    def make_executions():
+        inputs = [LONG_INPUT] + [SHORT_INPUT] * args.short
+        return [program.start([n]) for n in inputs]
+
+    print()
+    print(f"Fib({LONG_INPUT}) followed by {args.short} of Fib({SHORT_INPUT}), "
+          f"slices of {args.slice}")
+    print(f"{'schedule':<14}{'short done (s)':>16}{'all done (s)':>14}")
+    for name, finish_times in [
+        ("in turn", finish_times_in_turn(make_executions())),
+        ("round robin", finish_times_round_robin(make_executions(), args.slice)),
+    ]:
+        print(f"{name:<14}{max(finish_times[1:]):>16.3f}{max(finish_times):>14.3f}")
+
+    print(f"run_round_robin, all done in {time_round_robin(make_executions(), args.slice):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
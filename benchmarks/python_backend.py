@@ -0,0 +1,31 @@
+import argparse
+import time
+from common import PROGRAMS, bench, compile_program, compile_python_program, program_path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.python_vm import interp_python
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the stack VM with programs compiled to Python functions")
+    parser.add_argument("programs", nargs="*", default=PROGRAMS,
+                        help="names of the programs in benchmarks/programs to run")
+    args = parser.parse_args()
+    print(f"{'program':<18}{'stack (s)':>10}{'python (s)':>12}{'compile (s)':>13}{'speedup':>9}")
+    for name in args.programs:
+        path = program_path(name)
+        bytecode, func_names = compile_program(path)
+        stack_result, stack_time = bench(interp_lowered, lower_bytecode(bytecode), func_names)
+
+        start_time = time.perf_counter()
+        source = compile_python_program(path)
+        compile_time = time.perf_counter() - start_time
+        result, elapsed = bench(interp_python, source, None)
+        assert result.values == stack_result.values, (result.values, stack_result.values)
+        print(f"{name:<18}{stack_time:>10.3f}{elapsed:>12.4f}{compile_time:>13.4f}"
+              f"{stack_time / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import argparse
+from common import PROGRAMS, bench, compile_program, compile_register_program, program_path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.register_vm import interp_register, lower_register_code
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare dispatch counts of the stack and register backends")
+    parser.add_argument("programs", nargs="*", default=PROGRAMS,
+                        help="names of the programs in benchmarks/programs to run")
+    args = parser.parse_args()
+    print(f"{'program':<18}{'backend':<10}{'length':>8}{'dispatches':>12}"
+          f"{'time (s)':>10}{'fewer':>8}{'speedup':>9}")
+    for name in args.programs:
+        path = program_path(name)
+        bytecode, func_names = compile_program(path)
+        stack_result, stack_time = bench(interp_lowered, lower_bytecode(bytecode), func_names)
+        print(f"{name:<18}{'stack':<10}{len(bytecode):>8}{stack_result.num_instrs:>12}"
+              f"{stack_time:>10.3f}")
+
+        code, func_names = compile_register_program(path)
+        result, elapsed = bench(interp_register, lower_register_code(code), func_names)
+        assert result.values == stack_result.values, (result.values, stack_result.values)
+        fewer = 1 - result.num_instrs / stack_result.num_instrs
+        print(f"{name:<18}{'register':<10}{len(code):>8}{result.num_instrs:>12}"
+              f"{elapsed:>10.3f}{fewer:>8.0%}{stack_time / elapsed:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
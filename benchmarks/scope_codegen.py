@@ -0,0 +1,77 @@
+import argparse
+import time
+import common # Puts the repository root on sys.path
+
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.codegen_python import CodeGenPython
+from blok.codegen_register import CodeGenRegister
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.typechecker import TypeChecker
+
+
+NUM_LOCALS = [100, 1000, 4000]
+DEPTHS = [10, 50]
+# Number of nests of blocks side by side in the function
+NUM_NESTS = 20
+
+
+# A Main with num_locals locals followed by num_nests if statements nested
+# depth deep, each block declaring a local of its own that shadows the one of
+# the enclosing block
+def make_program(num_locals, depth, num_nests):
+    lines = ["int Main() {"]
+    lines += [f"    int v{i} = {i};" for i in range(num_locals)]
+    for nest in range(num_nests):
+        for level in range(depth):
+            lines.append(f"if (v{level % num_locals} > {nest}) {{")
+            lines.append(f"int d = v{(nest + level) % num_locals};")
+
+        lines.append(f"v{nest % num_locals} = d;")
+        lines += ["}"] * depth
+
+    lines += ["    return v0;", "}"]
+    return "\n".join(lines) + "\n"
+
+
+# The code generators fill in the AST, so every run starts from a fresh one
+def time_phase(text, phase, num_runs):
+    def run():
+        ast = parse_blkprogram(Lexer(text))
+        if phase == "typecheck":
+            start_time = time.perf_counter()
+            TypeChecker(ast)
+            return time.perf_counter() - start_time
+
+        TypeChecker(ast)
+        start_time = time.perf_counter()
+        if phase == "stack":
+            CodeGenByteCode(ast).gen_bytecode()
+        elif phase == "register":
+            CodeGenRegister(ast).gen_code()
+        elif phase == "python":
+            CodeGenPython(ast).gen_source()
+        return time.perf_counter() - start_time
+
+    return min(run() for _ in range(num_runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the type checker and code generators "
+                                                 "on functions with many locals and deeply "
+                                                 "nested blocks")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    phases = ["typecheck", "stack", "register", "python"]
+    print(f"{'locals':>7}{'depth':>7}{'blocks':>8}" + "".join(f"{phase + ' (s)':>16}" for phase in phases))
+    for num_locals in NUM_LOCALS:
+        for depth in DEPTHS:
+            text = make_program(num_locals, depth, NUM_NESTS)
+            times = [time_phase(text, phase, args.runs) for phase in phases]
+            print(f"{num_locals:>7}{depth:>7}{depth * NUM_NESTS:>8}" +
+                  "".join(f"{t:>16.4f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+import tracemalloc
+from common import compile_program, program_path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.vm_stack import STACK_BACKINGS, StackConfig, numpy
+
+
+PROGRAMS = ["recursive_fib", "deep_recursion", "array_sweep"]
+REPETITIONS = 3
+
+
+def bench(code, func_names, backing, measure_memory):
+    stack_config = StackConfig(backing=backing)
+    best = None
+    for _ in range(REPETITIONS):
+        start_time = time.perf_counter()
+        result = interp_lowered(code, stack_config=stack_config, func_names=func_names)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best == None else min(best, elapsed)
+
+    if not measure_memory:
+        return result, best, None
+
+    # Tracing allocations slows the VM down a lot, so it gets its own run
+    tracemalloc.start()
+    interp_lowered(code, stack_config=stack_config, func_names=func_names)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the VM stack backings")
+    parser.add_argument("--memory", action="store_true",
+                        help="also measure peak memory with tracemalloc (slow)")
+    args = parser.parse_args()
+    print(f"{'program':<18}{'backing':<10}{'time (s)':>10}{'peak (KiB)':>12}  result")
+    for name in PROGRAMS:
+        bytecode, func_names = compile_program(program_path(name))
+        code = lower_bytecode(bytecode)
+        for backing in STACK_BACKINGS:
+            if backing == "numpy" and numpy == None:
+                print(f"{name:<18}{backing:<10}{'skipped, numpy is not installed':>24}")
+                continue
+
+            result, elapsed, peak = bench(code, func_names, backing, args.memory)
+            peak = f"{peak / 1024:.1f}" if peak != None else "-"
+            print(f"{name:<18}{backing:<10}{elapsed:>10.3f}{peak:>12}  {result.values}")
+
+
+if __name__ == "__main__":
+    main()
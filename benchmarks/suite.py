@@ -0,0 +1,209 @@
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import common # Puts the repository root on sys.path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.error import report_errors
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.typechecker import TypeChecker
+
+
+PHASES = ["lex", "parse", "typecheck", "codegen", "optimize", "execute"]
+REPETITIONS = 5
+# Growth of a median time or of a peak memory that counts as a regression
+THRESHOLD = 0.10
+# Differences below these are noise, whatever their ratio
+MIN_TIME_DIFFERENCE = 0.0005
+MIN_MEMORY_DIFFERENCE = 16 * 1024
+
+
+def program_names():
+    return sorted(name[:-len(".blk")] for name in os.listdir(common.PROGRAMS_DIR)
+                  if name.endswith(".blk"))
+
+
+# Compiles and runs text, calling measure(phase, run) for each phase. measure
+# has to call run and return what it returns.
+def run_phases(text, measure):
+    lexer = Lexer(text)
+    measure("lex", lexer.read_all_tokens)
+    ast = measure("parse", lambda: parse_blkprogram(lexer))
+    measure("typecheck", lambda: TypeChecker(ast))
+    if len(lexer.errors) > 0:
+        report_errors(lexer.errors)
+        sys.exit(1)
+
+    codegen = CodeGenByteCode(ast)
+    measure("codegen", codegen.gen_bytecode_blkfile)
+    # Resolving the labels and lowering are the last steps before execution,
+    # so they count as part of optimizing
+    def optimize():
+        codegen.optimize_bytecode()
+        codegen.replace_labels_by_idx()
+        return lower_bytecode(codegen.bytecode)
+
+    code = measure("optimize", optimize)
+    return measure("execute", lambda: interp_lowered(code, func_names=codegen.idx_to_funcident))
+
+
+def time_phases(text, phase_to_times):
+    def measure(phase, run):
+        start_time = time.perf_counter()
+        result = run()
+        phase_to_times[phase].append(time.perf_counter() - start_time)
+        return result
+
+    return run_phases(text, measure)
+
+
+# Tracing allocations slows everything down, so the peaks come from a run of
+# their own. Each peak is the most memory a phase had allocated on top of what
+# was allocated when it started.
+def measure_peak_memory(text):
+    phase_to_peak = {}
+    def measure(phase, run):
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        result = run()
+        phase_to_peak[phase] = tracemalloc.get_traced_memory()[1] - start_memory
+        return result
+
+    tracemalloc.start()
+    try:
+        run_phases(text, measure)
+    finally:
+        tracemalloc.stop()
+
+    return phase_to_peak
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[math.ceil(fraction * len(ordered)) - 1]
+
+
+def bench_program(name, repetitions):
+    with open(common.program_path(name)) as blkfile:
+        text = blkfile.read()
+
+    phase_to_times = {phase: [] for phase in PHASES}
+    for _ in range(repetitions):
+        result = time_phases(text, phase_to_times)
+
+    phase_to_peak = measure_peak_memory(text)
+    phases = {}
+    for phase in PHASES:
+        times = phase_to_times[phase]
+        phases[phase] = {
+            "median": statistics.median(times),
+            "p95": percentile(times, 0.95),
+            "peak_memory": phase_to_peak[phase],
+        }
+
+    return {"values": result.values, "num_instrs": result.num_instrs, "phases": phases}
+
+
+# Returns the regressions of program, which is compared to base, as strings
+def find_regressions(program, base, threshold):
+    regressions = []
+    if program["values"] != base["values"]:
+        regressions.append(f"returned {program['values']} instead of {base['values']}")
+    if program["num_instrs"] > base["num_instrs"]:
+        regressions.append(f"executed {program['num_instrs']} instructions "
+                           f"instead of {base['num_instrs']}")
+
+    for phase, stats in program["phases"].items():
+        base_stats = base["phases"].get(phase)
+        if base_stats == None:
+            continue
+
+        median = stats["median"]
+        base_median = base_stats["median"]
+        if median > base_median * (1 + threshold) and \
+           median - base_median > MIN_TIME_DIFFERENCE:
+            regressions.append(f"{phase} took {median * 1e3:.2f}ms "
+                               f"instead of {base_median * 1e3:.2f}ms")
+        peak = stats["peak_memory"]
+        base_peak = base_stats["peak_memory"]
+        if peak > base_peak * (1 + threshold) and peak - base_peak > MIN_MEMORY_DIFFERENCE:
+            regressions.append(f"{phase} peaked at {peak / 1024:.0f}KB "
+                               f"instead of {base_peak / 1024:.0f}KB")
+
+    return regressions
+
+
+def print_program(name, program, base):
+    print(f"{name}: {program['num_instrs']} instructions, returned {program['values']}")
+    for phase, stats in program["phases"].items():
+        change = ""
+        if base != None and phase in base["phases"]:
+            base_median = base["phases"][phase]["median"]
+            if base_median > 0:
+                change = f"{(stats['median'] / base_median - 1) * 100:+.1f}%"
+
+        print(f"  {phase:<10}{stats['median'] * 1e3:>12.3f}{stats['p95'] * 1e3:>12.3f}"
+              f"{stats['peak_memory'] / 1024:>12.0f}{change:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every phase of compiling and running the "
+                                                 "programs in benchmarks/programs and compare "
+                                                 "them to a saved baseline")
+    parser.add_argument("programs", nargs="*",
+                        help="names of the programs to run, all of them by default")
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS)
+    parser.add_argument("--baseline",
+                        help="JSON file written by --save to compare the results to")
+    parser.add_argument("--save",
+                        help="write the results to this JSON file, to use as a baseline later")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD * 100,
+                        help="percentage a median time or a peak memory may grow by before it "
+                             "is flagged as a regression")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline != None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["programs"]
+
+    names = args.programs if len(args.programs) > 0 else program_names()
+    programs = {}
+    regressions = []
+    print(f"  {'phase':<10}{'median (ms)':>12}{'p95 (ms)':>12}{'peak (KB)':>12}"
+          f"{'vs base':>12}")
+    for name in names:
+        program = bench_program(name, args.repetitions)
+        programs[name] = program
+        base = None if baseline == None else baseline.get(name)
+        print_program(name, program, base)
+        if base != None:
+            regressions += [f"{name}: {regression}"
+                            for regression in find_regressions(program, base, args.threshold / 100)]
+
+    if args.save != None:
+        with open(args.save, "w") as results_file:
+            json.dump({"repetitions": args.repetitions, "programs": programs}, results_file,
+                      indent=4)
+
+    if baseline == None:
+        return
+
+    if len(regressions) == 0:
+        print("no regressions")
+        return
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
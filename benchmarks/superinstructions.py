@@ -0,0 +1,33 @@
+import argparse
+from common import PROGRAMS, bench, compile_program, program_path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare bytecode with and without superinstructions")
+    parser.add_argument("programs", nargs="*", default=PROGRAMS,
+                        help="names of the programs in benchmarks/programs to run")
+    args = parser.parse_args()
+    print(f"{'program':<18}{'mode':<8}{'length':>8}{'executed':>12}{'time (s)':>10}{'speedup':>9}")
+    for name in args.programs:
+        before = None
+        for superinstructions in [False, True]:
+            bytecode, func_names = compile_program(program_path(name),
+                                                   superinstructions=superinstructions)
+            result, elapsed = bench(interp_lowered, lower_bytecode(bytecode), func_names)
+            if before == None:
+                before = (result, elapsed)
+                speedup = ""
+            else:
+                assert result.values == before[0].values, (result.values, before[0].values)
+                speedup = f"{before[1] / elapsed:.2f}x"
+
+            mode = "fused" if superinstructions else "plain"
+            print(f"{name:<18}{mode:<8}{len(bytecode):>8}{result.num_instrs:>12}"
+                  f"{elapsed:>10.3f}{speedup:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import time
+from common import compile_program, program_path
+
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.tiering import DEFAULT_HOT_THRESHOLD, HotFunctionCompiler, interp_tiered
+
+
+PROGRAMS = ["small_calls", "recursive_fib", "deep_recursion", "array_sweep", "nested_loops"]
+THRESHOLDS = [1, 5, DEFAULT_HOT_THRESHOLD, 100]
+REPETITIONS = 5
+
+
+def best_time(run):
+    best = None
+    for _ in range(REPETITIONS):
+        start_time = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best == None else min(best, elapsed)
+
+    return result, best
+
+
+# The compile time of the Python tier is part of every tiered run, since a
+# fresh HotFunctionCompiler is made for each of them
+def bench_tiered(text, code, func_names, hot_threshold):
+    hot_compilers = []
+    def run():
+        hot_compilers.append(HotFunctionCompiler([text]))
+        return interp_tiered(code, hot_compilers[-1], func_names,
+                             hot_threshold=hot_threshold)
+
+    result, elapsed = best_time(run)
+    return result, elapsed, hot_compilers[-1].promoted
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the stack VM with and without hot functions compiled to Python")
+    parser.add_argument("programs", nargs="*", default=PROGRAMS,
+                        help="names of the programs in benchmarks/programs to run")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=THRESHOLDS,
+                        help="hot thresholds to run the tiered engine with")
+    args = parser.parse_args()
+    print(f"{'program':<16}{'threshold':>10}{'instrs':>10}{'time (s)':>10}{'speedup':>9}  promoted")
+    for name in args.programs:
+        path = program_path(name)
+        with open(path) as f:
+            text = f.read()
+
+        bytecode, func_names = compile_program(path)
+        code = lower_bytecode(bytecode)
+        base_result, base_time = best_time(lambda: interp_lowered(code, func_names=func_names))
+        print(f"{name:<16}{'-':>10}{base_result.num_instrs:>10}{base_time:>10.3f}")
+        for hot_threshold in args.thresholds:
+            result, elapsed, promoted = bench_tiered(text, code, func_names, hot_threshold)
+            assert result.values == base_result.values, (result.values, base_result.values)
+            # Promoted functions do not count instructions
+            num_instrs = result.num_instrs if result.num_instrs != None else "-"
+            print(f"{'':<16}{hot_threshold:>10}{num_instrs:>10}{elapsed:>10.3f}"
+                  f"{base_time / elapsed:>8.1f}x  {', '.join(promoted)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import sys
+import time
+import tracemalloc
+import common # Puts the repository root on sys.path
+
+from lexer_throughput import FUNCTION_TEMPLATE
+from blok.lexer import TOKEN_KINDS, Lexer
+from blok.parsing import parse_blkprogram
+from blok.token import Token, TokenKind
+
+
+SIZES_MB = [1, 4]
+REPETITIONS = 3
+
+
+# The layout tokens had before they got __slots__
+class DictToken:
+    def __init__(self, kind, value, line):
+        self.kind = kind
+        self.value = value
+        self.line = line
+
+
+def make_text(size_mb):
+    parts = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        parts.append(FUNCTION_TEMPLATE.format(n=len(parts), prev=max(len(parts) - 1, 0)))
+        size += len(parts[-1])
+
+    return "".join(parts)
+
+
+def lex(text):
+    lexer = Lexer(text)
+    while len(lexer.kinds) == 0 or lexer.kinds[-1] != TokenKind.EOF:
+        lexer.read_token()
+
+    return lexer
+
+
+# Bytes per token of the token store, leaving out the values themselves,
+# which every layout shares
+def bytes_per_object_token(lexer, token_class):
+    tracemalloc.start()
+    tokens = [token_class(TOKEN_KINDS[kind], value, line)
+              for kind, value, line in zip(lexer.kinds, lexer.values, lexer.lines)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(tokens)
+
+
+def bytes_per_array_token(lexer):
+    size = sys.getsizeof(lexer.kinds) + sys.getsizeof(lexer.lines) + sys.getsizeof(lexer.values)
+    return size / len(lexer.kinds)
+
+
+def best_parse_time(text):
+    best = None
+    for _ in range(REPETITIONS):
+        start_time = time.perf_counter()
+        parse_blkprogram(Lexer(text))
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best == None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the memory per token of the token store and the parse throughput")
+    parser.add_argument("sizes", type=int, nargs="*", default=SIZES_MB,
+                        help="sizes in megabytes of the generated programs")
+    args = parser.parse_args()
+    print(f"{'size (MB)':>10}{'tokens':>10}{'dict B/tok':>12}{'slots B/tok':>13}"
+          f"{'arrays B/tok':>14}{'parse (s)':>11}{'Mtok/s':>8}{'MB/s':>7}")
+    for size_mb in args.sizes:
+        text = make_text(size_mb)
+        megabytes = len(text.encode()) / (1024 * 1024)
+        lexer = lex(text)
+        num_tokens = len(lexer.kinds)
+        dict_size = bytes_per_object_token(lexer, DictToken)
+        slots_size = bytes_per_object_token(lexer, Token)
+        array_size = bytes_per_array_token(lexer)
+        parse_time = best_parse_time(text)
+        print(f"{megabytes:>10.1f}{num_tokens:>10}{dict_size:>12.1f}{slots_size:>13.1f}"
+              f"{array_size:>14.1f}{parse_time:>11.2f}{num_tokens / parse_time / 1e6:>8.2f}"
+              f"{megabytes / parse_time:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ from enum import Enum
 
 
 class AstNode:
+    __slots__ = ("parent",)
+
     def __init__(self):
         self.parent = None
 
@@ -24,6 +26,8 @@ class AstNode:
 
 
 class Expr(AstNode):
+    __slots__ = ("eval_kind",)
+
     def __init__(self):
         super().__init__()
         self.eval_kind = None
@@ -35,18 +39,30 @@ class Expr(AstNode):
 
 
 class Loop(AstNode):
+    __slots__ = ("start_label", "end_label", "line")
+
     def __init__(self):
         super().__init__()
         self.start_label = None
         self.end_label = None
+        self.line = None
 
 
 class BlkProgram(AstNode):
+    __slots__ = ("imports", "structs", "funcdecls")
+
     def __init__(self):
         super().__init__()
+        # Identifier tokens of the modules the file imports
+        self.imports = []
         self.structs = []
         self.funcdecls = []
 
+    def attributes_tostr(self):
+        if len(self.imports) > 0:
+            return f" imports=\"{' '.join(token.value for token in self.imports)}\""
+        return ""
+
     def content_tostr(self, indent):
         result = ""
         for struct in self.structs:
@@ -59,6 +75,8 @@ class BlkProgram(AstNode):
 
 
 class Struct(AstNode):
+    __slots__ = ("stack_size", "ident", "vardecls")
+
     def __init__(self):
         super().__init__()
         self.stack_size = 0
@@ -77,9 +95,12 @@ class Struct(AstNode):
 
 
 class ReturnStatement(AstNode):
+    __slots__ = ("expr", "line")
+
     def __init__(self):
         super().__init__()
         self.expr = None
+        self.line = None
 
 
     def content_tostr(self, indent):
@@ -89,10 +110,13 @@ class ReturnStatement(AstNode):
 
 
 class FuncCall(AstNode):
+    __slots__ = ("eval_kind", "ident", "args", "line")
+
     def __init__(self):
         self.eval_kind = None
         self.ident = None
         self.args = []
+        self.line = None
 
     def attributes_tostr(self):
         return f" eval_kind=\"{self.eval_kind}\""
@@ -106,6 +130,8 @@ class FuncCall(AstNode):
 
 
 class FuncDecl(AstNode):
+    __slots__ = ("stack_size", "return_token", "params", "ident", "block", "line")
+
     def __init__(self):
         super().__init__()
         self.stack_size = None
@@ -113,6 +139,7 @@ class FuncDecl(AstNode):
         self.params = []
         self.ident = None
         self.block = None
+        self.line = None
 
     def attributes_tostr(self):
         if self.stack_size != None:
@@ -130,6 +157,8 @@ class FuncDecl(AstNode):
 
 
 class Block(AstNode):
+    __slots__ = ("statements",)
+
     def __init__(self):
         super().__init__()
         self.statements = []
@@ -143,6 +172,8 @@ class Block(AstNode):
 
 
 class ForLoop(Loop):
+    __slots__ = ("var_ident", "start", "stop", "step", "block", "step_label")
+
     def __init__(self):
         super().__init__()
         self.var_ident = None
@@ -162,6 +193,8 @@ class ForLoop(Loop):
 
 
 class WhileLoop(Loop):
+    __slots__ = ("condition", "block")
+
     def __init__(self):
         super().__init__()
         self.condition = None
@@ -174,10 +207,13 @@ class WhileLoop(Loop):
 
 
 class LoopControl(AstNode):
+    __slots__ = ("parent_loop", "kind", "line")
+
     def __init__(self):
         super().__init__()
         self.parent_loop = None
         self.kind = None
+        self.line = None
 
 
 class LoopControlKind(Enum):
@@ -186,11 +222,14 @@ class LoopControlKind(Enum):
 
 
 class IfStatement(AstNode):
+    __slots__ = ("condition", "block", "else_block", "line")
+
     def __init__(self):
         super().__init__()
         self.condition = None
         self.block = None
         self.else_block = None
+        self.line = None
 
     def content_tostr(self, indent):
         result = self.condition.tostr(indent)
@@ -202,6 +241,8 @@ class IfStatement(AstNode):
 
 
 class VarDecl(AstNode):
+    __slots__ = ("ptr_depth", "stack_size", "kind", "ident", "expr", "line")
+
     def __init__(self):
         super().__init__()
         self.ptr_depth = 0
@@ -209,6 +250,7 @@ class VarDecl(AstNode):
         self.kind = None
         self.ident = None
         self.expr = None
+        self.line = None
 
     def attributes_tostr(self):
         return f" ptr_depth=\"{self.ptr_depth}\" stack_size=\"{self.stack_size}\""
@@ -223,6 +265,8 @@ class VarDecl(AstNode):
 
 
 class Literal(Expr):
+    __slots__ = ("token", "offset")
+
     def __init__(self):
         super().__init__()
         self.token = None
@@ -236,6 +280,8 @@ class Literal(Expr):
 
 
 class UnaryOp(Expr):
+    __slots__ = ("op", "expr")
+
     def __init__(self):
         super().__init__()
         self.op = None
@@ -248,11 +294,14 @@ class UnaryOp(Expr):
 
 
 class BinaryOp(Expr):
+    __slots__ = ("op", "lhs", "rhs", "line")
+
     def __init__(self):
         super().__init__()
         self.op = None
         self.lhs = None
         self.rhs = None
+        self.line = None
 
     def content_tostr(self, indent):
         result = f"{' ' * (indent)}{self.op}\n"
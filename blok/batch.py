@@ -0,0 +1,70 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from blok.blok_vm import interp_lowered
+from blok.error import VMError
+from blok.vm_stack import DEFAULT_STACK_CONFIG
+
+
+# Jobs handed to a worker at a time. Larger chunks cost less in pickling and
+# waiting on the pool, smaller ones spread uneven jobs better over the workers.
+DEFAULT_CHUNKSIZE = 16
+
+
+class BatchResult:
+    def __init__(self, values=None, num_instrs=None, error=None):
+        self.values = values
+        self.num_instrs = num_instrs
+        # The text of the VMError the job stopped with
+        self.error = error
+
+
+# The programs of the batch, set in each worker by init_worker so they are
+# shipped to a worker once instead of with every job
+worker_programs = []
+worker_stack_config = DEFAULT_STACK_CONFIG
+worker_max_instrs = None
+worker_max_seconds = None
+
+
+def init_worker(programs, stack_config, max_instrs, max_seconds):
+    global worker_programs, worker_stack_config, worker_max_instrs, worker_max_seconds
+    worker_programs = programs
+    worker_stack_config = stack_config
+    worker_max_instrs = max_instrs
+    worker_max_seconds = max_seconds
+
+
+def run_job(job):
+    program_idx, args = job
+    code, func_names = worker_programs[program_idx]
+    try:
+        result = interp_lowered(code, stack_config=worker_stack_config, func_names=func_names,
+                                args=args, max_instrs=worker_max_instrs,
+                                max_seconds=worker_max_seconds)
+    except VMError as err:
+        # VMError does not survive pickling, so the worker sends its text
+        return BatchResult(error=str(err))
+
+    return BatchResult(result.values, result.num_instrs)
+
+
+# Runs each job, a pair of the index of a Program in programs and the
+# arguments to call its Main with, in a pool of worker processes. Returns a
+# BatchResult per job, in the order of jobs. A job that runs into a VMError,
+# such as going over max_instrs or max_seconds, gets a result with the error
+# and does not stop the others.
+def run_batch(programs, jobs, workers=None, chunksize=DEFAULT_CHUNKSIZE, max_instrs=None,
+              stack_config=DEFAULT_STACK_CONFIG, max_seconds=None):
+    jobs = [(program_idx, tuple(args)) for program_idx, args in jobs]
+    for program_idx, args in jobs:
+        num_params = programs[program_idx].num_params
+        if len(args) != num_params:
+            raise TypeError(f"Main of program {program_idx} takes {num_params} arguments "
+                            f"but {len(args)} were given")
+
+    # Packed like in the .blkc cache, which pickles to a fraction of a list
+    shipped = [(array("q", program.code), program.func_names) for program in programs]
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(shipped, stack_config, max_instrs,
+                                       max_seconds)) as executor:
+        return list(executor.map(run_job, jobs, chunksize=chunksize))
@@ -1,84 +1,872 @@
-from blok.codegen_bytecode import ByteCode
+import sys
+import time
+from blok.bytecode import ByteCode
+from blok.error import VMError
+from blok.trace import NO_TRACE, TraceLevel
+from blok.vm_stack import (
+    DEFAULT_STACK_CONFIG,
+    grow_stack,
+    make_entry_stack,
+    make_stack,
+    stack_values
+)
 
 
-def interp_bytecode(bytecode):
+# Integer opcodes used by the lowered instruction format. Comparing small ints
+# is much cheaper than comparing Enum members looked up through ByteCode.
+OP_STOP                         = ByteCode.STOP.value
+OP_PUSH_CONST                   = ByteCode.PUSH_CONST.value
+OP_LOAD_VALUE_AT_IDX            = ByteCode.LOAD_VALUE_AT_IDX.value
+OP_STORE_VALUE_AT_IDX           = ByteCode.STORE_VALUE_AT_IDX.value
+OP_INCR_STACK_BY_CONST          = ByteCode.INCR_STACK_BY_CONST.value
+OP_LOAD_BASE_POINTER            = ByteCode.LOAD_BASE_POINTER.value
+OP_UNARYOP_NEG                  = ByteCode.UNARYOP_NEG.value
+OP_BINARYOP_ADD                 = ByteCode.BINARYOP_ADD.value
+OP_BINARYOP_SUB                 = ByteCode.BINARYOP_SUB.value
+OP_BINARYOP_MUL                 = ByteCode.BINARYOP_MUL.value
+OP_BINARYOP_DIV                 = ByteCode.BINARYOP_DIV.value
+OP_JUMP                         = ByteCode.JUMP.value
+OP_JUMP_IF_EQUAL                = ByteCode.JUMP_IF_EQUAL.value
+OP_JUMP_IF_NOT_EQUAL            = ByteCode.JUMP_IF_NOT_EQUAL.value
+OP_JUMP_IF_LESS_THAN            = ByteCode.JUMP_IF_LESS_THAN.value
+OP_JUMP_IF_LESS_THAN_EQUAL      = ByteCode.JUMP_IF_LESS_THAN_EQUAL.value
+OP_JUMP_IF_GREATER_THAN         = ByteCode.JUMP_IF_GREATER_THAN.value
+OP_JUMP_IF_GREATER_THAN_EQUAL   = ByteCode.JUMP_IF_GREATER_THAN_EQUAL.value
+OP_CALL_PROCEDURE               = ByteCode.CALL_PROCEDURE.value
+OP_RETURN                       = ByteCode.RETURN.value
+OP_LOAD_LOCAL                   = ByteCode.LOAD_LOCAL.value
+OP_STORE_LOCAL                  = ByteCode.STORE_LOCAL.value
+OP_LOAD_LOCAL_OFFSET            = ByteCode.LOAD_LOCAL_OFFSET.value
+OP_ADD_CONST                    = ByteCode.ADD_CONST.value
+# Not emitted by the code generator. The tiered engine patches it over the calls
+# to functions it compiled to Python, see blok/tiering.py.
+OP_CALL_COMPILED                = max(code.value for code in ByteCode) + 1
+
+# Every lowered instruction is an opcode followed by two operands
+INSTR_WIDTH = 3
+# Instructions between two readings of the clock when a run has a time limit
+CLOCK_CHECK_INSTRS = 10_000
+# interp_profiled counts calls deeper than this towards the stack of their
+# caller at this depth, which keeps the stacks of deep recursion short
+MAX_PROFILED_STACK_DEPTH = 64
+
+OPCODE_TO_NAME = {code.value: code.name for code in ByteCode}
+OPCODES_WITH_ARG = {
+    OP_PUSH_CONST,
+    OP_INCR_STACK_BY_CONST,
+    OP_JUMP,
+    OP_JUMP_IF_EQUAL,
+    OP_JUMP_IF_NOT_EQUAL,
+    OP_JUMP_IF_LESS_THAN,
+    OP_JUMP_IF_LESS_THAN_EQUAL,
+    OP_JUMP_IF_GREATER_THAN,
+    OP_JUMP_IF_GREATER_THAN_EQUAL,
+    OP_CALL_PROCEDURE,
+    OP_RETURN,
+    OP_LOAD_LOCAL,
+    OP_STORE_LOCAL,
+    OP_LOAD_LOCAL_OFFSET,
+    OP_ADD_CONST,
+}
+
+
+class VMResult:
+    def __init__(self, values, num_instrs):
+        self.values = values
+        self.num_instrs = num_instrs
+
+
+def lower_bytecode(bytecode):
+    code = []
+    for instr in bytecode:
+        code.append(instr[0].value)
+        code.append(instr[1] if len(instr) > 1 else 0)
+        code.append(instr[2] if len(instr) > 2 else 0)
+
+    return code
+
+
+# The lowered code may be a memoryview over a cache file. The interpreters index
+# plain lists, which is noticeably faster than indexing a memoryview.
+def split_code(code):
+    ops = list(code[0::INSTR_WIDTH])
+    args1 = list(code[1::INSTR_WIDTH])
+    args2 = list(code[2::INSTR_WIDTH])
+    return ops, args1, args2
+
+
+def lift_lowered(code):
+    ops, args1, args2 = split_code(code)
+    return [(ByteCode(op), args1[pc], args2[pc]) for pc, op in enumerate(ops)]
+
+
+# Returns how many slots each called procedure can use above its base pointer,
+# indexed by the pc of its first instruction. Procedures are laid out one after
+# another and the operand stack is balanced between statements, so summing the
+# stack effects along a procedure gives an upper bound without following jumps.
+def compute_frame_sizes(code):
+    ops, args1, args2 = split_code(code)
+    frame_sizes = [0] * len(ops)
+    targets = sorted({args1[pc] for pc in range(len(ops)) if ops[pc] == OP_CALL_PROCEDURE})
+    for i, target in enumerate(targets):
+        end = targets[i + 1] if i + 1 < len(targets) else len(ops)
+        depth = 0
+        max_depth = 0
+        for pc in range(target, end):
+            op = ops[pc]
+            if op == OP_PUSH_CONST or op == OP_LOAD_BASE_POINTER or \
+               op == OP_LOAD_LOCAL or op == OP_LOAD_LOCAL_OFFSET:
+                depth += 1
+            elif op == OP_INCR_STACK_BY_CONST:
+                depth += args1[pc]
+            elif op == OP_BINARYOP_ADD or op == OP_BINARYOP_SUB or \
+                 op == OP_BINARYOP_MUL or op == OP_BINARYOP_DIV or \
+                 op == OP_STORE_LOCAL:
+                depth -= 1
+            elif op == OP_STORE_VALUE_AT_IDX or \
+                 op == OP_JUMP_IF_EQUAL or \
+                 op == OP_JUMP_IF_NOT_EQUAL or \
+                 op == OP_JUMP_IF_LESS_THAN or \
+                 op == OP_JUMP_IF_LESS_THAN_EQUAL or \
+                 op == OP_JUMP_IF_GREATER_THAN or \
+                 op == OP_JUMP_IF_GREATER_THAN_EQUAL:
+                depth -= 2
+            elif op == OP_CALL_PROCEDURE:
+                # The callee checks its own frame, but the return value and
+                # the saved pc and bp are written above the arguments
+                max_depth = max(max_depth, depth + 2)
+                depth += 1 - args2[pc]
+            elif op == OP_RETURN:
+                depth -= args1[pc]
+
+            max_depth = max(max_depth, depth)
+
+        frame_sizes[target] = max_depth
+
+    return frame_sizes
+
+
+def make_call_trace(stack, pc, bp, func_names, max_frames=20):
+    call_trace = [f"in {func_name_at(pc, func_names)}"]
+    while bp >= 2:
+        pc = int(stack[bp - 2])
+        bp = int(stack[bp - 1])
+        if bp == 0:
+            break
+
+        call_trace.append(f"in {func_name_at(pc, func_names)}")
+
+    if len(call_trace) > max_frames:
+        num_hidden = len(call_trace) - max_frames
+        call_trace = call_trace[:max_frames // 2] + \
+                     [f"... {num_hidden} more frames"] + \
+                     call_trace[-(max_frames // 2):]
+
+    return call_trace
+
+
+def func_name_at(pc, func_names):
+    name = None
+    if func_names != None:
+        entry = max((entry for entry in func_names if entry <= pc), default=None)
+        name = func_names.get(entry)
+
+    if name == None:
+        return f"pc {pc}"
+
+    return f"{name} (pc {pc})"
+
+
+# Loops and recursion are the only way a program runs for long, so the
+# interpreters check max_instrs when they take a jump or make a call. A run
+# can go a few instructions past the budget before it is stopped.
+def budget_exceeded(max_instrs, stack, pc, bp, func_names):
+    return VMError(f"instruction budget of {max_instrs} exceeded",
+                   make_call_trace(stack, pc, bp, func_names))
+
+
+def time_limit_exceeded(max_seconds, stack, pc, bp, func_names):
+    return VMError(f"time limit of {max_seconds} s exceeded",
+                   make_call_trace(stack, pc, bp, func_names))
+
+
+# A run of lowered code, which run_lowered can stop after a jump or a call and
+# later continue. It holds what the interpreter loop keeps in local variables
+# and the limits of the whole run, over all the times it is continued.
+class Execution:
+    def __init__(self, code, stack_config=DEFAULT_STACK_CONFIG, func_names=None, args=(),
+                 max_instrs=None, max_seconds=None):
+        self.ops, self.args1, self.args2 = split_code(code)
+        self.frame_sizes = compute_frame_sizes(code)
+        self.stack_config = stack_config
+        self.func_names = func_names
+        self.pc = 0 # program counter
+        self.sp = 0 # stack pointer
+        self.bp = 0 # base pointer
+        self.stack = make_entry_stack(stack_config, args)
+        self.num_instrs = 0
+        self.max_instrs = max_instrs
+        self.max_seconds = max_seconds
+        # Time spent running in earlier calls to run_lowered, which max_seconds
+        # limits, so the time a run waits for others to take their turn in
+        # run_round_robin does not count
+        self.seconds_used = 0.0
+        # Set by start_clock when the current call started
+        self.started_at = None
+        # The VMResult once the program stopped
+        self.result = None
+        # Functions compiled to Python by entry pc, for OP_CALL_COMPILED
+        self.compiled = {}
+
+    def start_clock(self):
+        self.started_at = time.monotonic()
+
+    def stop_clock(self):
+        self.seconds_used += time.monotonic() - self.started_at
+
+    # The instruction count after which the loop next has to stop at a jump
+    # or call for check_limits. Reading the clock is slow compared to an
+    # instruction, so it is only read every CLOCK_CHECK_INSTRS instructions.
+    def next_check(self, num_instrs):
+        check_at = self.max_instrs if self.max_instrs != None else sys.maxsize
+        if self.max_seconds != None:
+            check_at = min(check_at, num_instrs + CLOCK_CHECK_INSTRS)
+
+        return check_at
+
+    def check_limits(self, num_instrs, stack, pc, bp):
+        if self.max_instrs != None and num_instrs > self.max_instrs:
+            raise budget_exceeded(self.max_instrs, stack, pc, bp, self.func_names)
+
+        if self.max_seconds != None and \
+           self.seconds_used + time.monotonic() - self.started_at > self.max_seconds:
+            raise time_limit_exceeded(self.max_seconds, stack, pc, bp, self.func_names)
+
+        return self.next_check(num_instrs)
+
+
+def grow_stack_or_overflow(stack, stack_config, min_size, target, pc, bp, func_names):
+    new_stack = grow_stack(stack, stack_config, min_size)
+    if new_stack == None:
+        call_trace = make_call_trace(stack, pc, bp, func_names)
+        call_trace.insert(0, f"in {func_name_at(target, func_names)}")
+        raise VMError("stack overflow", call_trace)
+
+    return new_stack
+
+
+def interp_bytecode(bytecode, tracer=NO_TRACE, stack_config=DEFAULT_STACK_CONFIG, func_names=None,
+                    max_instrs=None, max_seconds=None):
+    if tracer.is_enabled(TraceLevel.CALL):
+        return interp_traced(lower_bytecode(bytecode), tracer, stack_config, func_names, (),
+                             max_instrs, max_seconds)
+
+    # Only used for its limits, like in interp_traced
+    execution = Execution(lower_bytecode(bytecode), stack_config, func_names, (), max_instrs,
+                          max_seconds)
+    frame_sizes = execution.frame_sizes
     pc = 0 # program counter
     sp = 0 # stack pointer
     bp = 0 # base pointer
-    stack = [0] * 100
-    while True:
-        code = bytecode[pc]
-        print(f"{code[0]:<30}{code[1] if len(code) > 1 else '':<5}", end="")
-        if code[0] == ByteCode.STOP:
-            break
-        elif code[0] == ByteCode.PUSH_CONST:
-            stack[sp] = code[1]
-            sp += 1
-        elif code[0] == ByteCode.LOAD_VALUE_AT_IDX:
-            idx = stack[sp - 1]
-            stack[sp - 1] = stack[idx]
-        elif code[0] == ByteCode.STORE_VALUE_AT_IDX:
-            sp -= 2
-            idx = stack[sp + 1]
-            value = stack[sp]
-            stack[idx] = value
-        elif code[0] == ByteCode.LOAD_BASE_POINTER:
-            stack[sp] = bp
-            sp += 1
-        elif code[0] == ByteCode.UNARYOP_NEG:
-            idx = sp - 1
-            stack[idx] = -stack[idx]
-        elif code[0] == ByteCode.BINARYOP_ADD:
-            sp -= 1
-            stack[sp - 1] += stack[sp]
-        elif code[0] == ByteCode.BINARYOP_SUB:
-            sp -= 1
-            stack[sp - 1] -= stack[sp]
-        elif code[0] == ByteCode.BINARYOP_MUL:
-            sp -= 1
-            stack[sp - 1] *= stack[sp]
-        elif code[0] == ByteCode.INCR_STACK_BY_CONST:
-            sp += code[1]
-        elif code[0] == ByteCode.JUMP:
-            pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_EQUAL:
-            sp -= 2
-            if stack[sp] == stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_NOT_EQUAL:
-            sp -= 2
-            if stack[sp] != stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_LESS_THAN:
-            sp -= 2
-            if stack[sp] < stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_LESS_THAN_EQUAL:
-            sp -= 2
-            if stack[sp] <= stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_GREATER_THAN:
-            sp -= 2
-            if stack[sp] > stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.JUMP_IF_GREATER_THAN_EQUAL:
-            sp -= 2
-            if stack[sp] >= stack[sp + 1]: pc = code[1] - 1
-        elif code[0] == ByteCode.CALL_PROCEDURE:
-            sp -= code[2]
-            for i in range(code[2]):
-                stack[sp + i + 2] = stack[sp + i]
-
-            stack[sp] = pc
-            stack[sp + 1] = bp
-            sp += 2
-            bp = sp
-            pc = code[1] - 1
-        elif code[0] == ByteCode.RETURN:
-            bp -= 2
-            new_pc = stack[bp]
-            new_bp = stack[bp + 1]
-            stack[bp] = stack[sp - 1]
-            sp = bp + code[1]
-            pc = new_pc
-            bp = new_bp
-        else:
-            assert False, code
-
-        pc += 1
-        print(f"{stack[:sp]}")
+    stack = execution.stack
+    num_instrs = 0
+    execution.start_clock()
+    check_at = execution.next_check(num_instrs)
+    try:
+        while True:
+            code = bytecode[pc]
+            num_instrs += 1
+            if code[0] == ByteCode.STOP:
+                break
+            elif code[0] == ByteCode.PUSH_CONST:
+                stack[sp] = code[1]
+                sp += 1
+            elif code[0] == ByteCode.LOAD_VALUE_AT_IDX:
+                idx = stack[sp - 1]
+                stack[sp - 1] = stack[idx]
+            elif code[0] == ByteCode.STORE_VALUE_AT_IDX:
+                sp -= 2
+                idx = stack[sp + 1]
+                value = stack[sp]
+                stack[idx] = value
+            elif code[0] == ByteCode.LOAD_BASE_POINTER:
+                stack[sp] = bp
+                sp += 1
+            elif code[0] == ByteCode.LOAD_LOCAL:
+                stack[sp] = stack[bp + code[1]]
+                sp += 1
+            elif code[0] == ByteCode.STORE_LOCAL:
+                sp -= 1
+                stack[bp + code[1]] = stack[sp]
+            elif code[0] == ByteCode.LOAD_LOCAL_OFFSET:
+                stack[sp] = stack[stack[bp + code[1]] + code[2]]
+                sp += 1
+            elif code[0] == ByteCode.ADD_CONST:
+                stack[sp - 1] += code[1]
+            elif code[0] == ByteCode.UNARYOP_NEG:
+                idx = sp - 1
+                stack[idx] = -stack[idx]
+            elif code[0] == ByteCode.BINARYOP_ADD:
+                sp -= 1
+                stack[sp - 1] += stack[sp]
+            elif code[0] == ByteCode.BINARYOP_SUB:
+                sp -= 1
+                stack[sp - 1] -= stack[sp]
+            elif code[0] == ByteCode.BINARYOP_MUL:
+                sp -= 1
+                stack[sp - 1] *= stack[sp]
+            elif code[0] == ByteCode.INCR_STACK_BY_CONST:
+                sp += code[1]
+            elif code[0] == ByteCode.JUMP:
+                if num_instrs > check_at:
+                    check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_EQUAL:
+                sp -= 2
+                if stack[sp] == stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_NOT_EQUAL:
+                sp -= 2
+                if stack[sp] != stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_LESS_THAN:
+                sp -= 2
+                if stack[sp] < stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_LESS_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] <= stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_GREATER_THAN:
+                sp -= 2
+                if stack[sp] > stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.JUMP_IF_GREATER_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] >= stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = code[1] - 1
+            elif code[0] == ByteCode.CALL_PROCEDURE:
+                if num_instrs > check_at:
+                    check_at = execution.check_limits(num_instrs, stack, pc, bp)
+
+                min_size = sp + 2 + frame_sizes[code[1]]
+                if min_size > len(stack):
+                    stack = grow_stack_or_overflow(stack, stack_config, min_size,
+                                                   code[1], pc, bp, func_names)
+
+                sp -= code[2]
+                # Copy backwards since the source and destination overlap
+                for i in reversed(range(code[2])):
+                    stack[sp + i + 2] = stack[sp + i]
+
+                stack[sp] = pc
+                stack[sp + 1] = bp
+                sp += 2
+                bp = sp
+                pc = code[1] - 1
+            elif code[0] == ByteCode.RETURN:
+                bp -= 2
+                new_pc = stack[bp]
+                new_bp = stack[bp + 1]
+                stack[bp] = stack[sp - 1]
+                sp = bp + code[1]
+                pc = new_pc
+                bp = new_bp
+            else:
+                assert False, code
+
+            pc += 1
+    except IndexError:
+        raise VMError("stack access out of bounds",
+                      make_call_trace(stack, pc, bp, func_names)) from None
+
+    return VMResult(stack_values(stack, sp), num_instrs)
+
+
+def interp_lowered(code, tracer=NO_TRACE, stack_config=DEFAULT_STACK_CONFIG, func_names=None,
+                   args=(), max_instrs=None, max_seconds=None):
+    if tracer.is_enabled(TraceLevel.CALL):
+        return interp_traced(code, tracer, stack_config, func_names, args, max_instrs,
+                             max_seconds)
+
+    return run_lowered(Execution(code, stack_config, func_names, args, max_instrs, max_seconds))
+
+
+# Runs execution until it stops and returns its VMResult, or, given
+# slice_instrs, until it executed about that many more instructions and
+# returns None. It can then be run again from where it left off. Raises
+# VMError when it goes over its limits.
+def run_lowered(execution, slice_instrs=None):
+    if execution.result != None:
+        return execution.result
+
+    ops = execution.ops
+    args1 = execution.args1
+    args2 = execution.args2
+    frame_sizes = execution.frame_sizes
+    stack_config = execution.stack_config
+    func_names = execution.func_names
+    pc = execution.pc
+    sp = execution.sp
+    bp = execution.bp
+    stack = execution.stack
+    num_instrs = execution.num_instrs
+    slice_end = num_instrs + slice_instrs if slice_instrs != None else sys.maxsize
+    execution.start_clock()
+    check_at = min(execution.next_check(num_instrs), slice_end)
+    try:
+        while True:
+            # The branches are ordered by how often the opcodes are executed
+            while True:
+                op = ops[pc]
+                num_instrs += 1
+                if op == OP_LOAD_LOCAL:
+                    stack[sp] = stack[bp + args1[pc]]
+                    sp += 1
+                elif op == OP_PUSH_CONST:
+                    stack[sp] = args1[pc]
+                    sp += 1
+                elif op == OP_STORE_LOCAL:
+                    sp -= 1
+                    stack[bp + args1[pc]] = stack[sp]
+                elif op == OP_ADD_CONST:
+                    stack[sp - 1] += args1[pc]
+                elif op == OP_LOAD_LOCAL_OFFSET:
+                    stack[sp] = stack[stack[bp + args1[pc]] + args2[pc]]
+                    sp += 1
+                elif op == OP_LOAD_BASE_POINTER:
+                    stack[sp] = bp
+                    sp += 1
+                elif op == OP_BINARYOP_ADD:
+                    sp -= 1
+                    stack[sp - 1] += stack[sp]
+                elif op == OP_LOAD_VALUE_AT_IDX:
+                    stack[sp - 1] = stack[stack[sp - 1]]
+                elif op == OP_STORE_VALUE_AT_IDX:
+                    sp -= 2
+                    stack[stack[sp + 1]] = stack[sp]
+                elif op == OP_JUMP:
+                    pc = args1[pc]
+                    if num_instrs > check_at:
+                        break
+                    continue
+                elif op == OP_JUMP_IF_LESS_THAN:
+                    sp -= 2
+                    if stack[sp] < stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_JUMP_IF_GREATER_THAN_EQUAL:
+                    sp -= 2
+                    if stack[sp] >= stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_JUMP_IF_GREATER_THAN:
+                    sp -= 2
+                    if stack[sp] > stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_JUMP_IF_LESS_THAN_EQUAL:
+                    sp -= 2
+                    if stack[sp] <= stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_JUMP_IF_EQUAL:
+                    sp -= 2
+                    if stack[sp] == stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_JUMP_IF_NOT_EQUAL:
+                    sp -= 2
+                    if stack[sp] != stack[sp + 1]:
+                        pc = args1[pc]
+                        if num_instrs > check_at:
+                            break
+                        continue
+                elif op == OP_BINARYOP_SUB:
+                    sp -= 1
+                    stack[sp - 1] -= stack[sp]
+                elif op == OP_BINARYOP_MUL:
+                    sp -= 1
+                    stack[sp - 1] *= stack[sp]
+                elif op == OP_UNARYOP_NEG:
+                    stack[sp - 1] = -stack[sp - 1]
+                elif op == OP_CALL_PROCEDURE:
+                    min_size = sp + 2 + frame_sizes[args1[pc]]
+                    if min_size > len(stack):
+                        stack = grow_stack_or_overflow(stack, stack_config, min_size,
+                                                       args1[pc], pc, bp, func_names)
+
+                    num_args = args2[pc]
+                    sp -= num_args
+                    stack[sp + 2:sp + 2 + num_args] = stack[sp:sp + num_args]
+                    stack[sp] = pc
+                    stack[sp + 1] = bp
+                    sp += 2
+                    bp = sp
+                    pc = args1[pc]
+                    if num_instrs > check_at:
+                        break
+                    continue
+                elif op == OP_RETURN:
+                    bp -= 2
+                    new_pc = stack[bp]
+                    new_bp = stack[bp + 1]
+                    stack[bp] = stack[sp - 1]
+                    sp = bp + args1[pc]
+                    pc = new_pc
+                    bp = new_bp
+                elif op == OP_INCR_STACK_BY_CONST:
+                    sp += args1[pc]
+                elif op == OP_STOP:
+                    break
+                elif op == OP_CALL_COMPILED:
+                    num_args = args2[pc]
+                    sp -= num_args
+                    try:
+                        value = execution.compiled[args1[pc]](stack, sp + 2,
+                                                              *stack[sp:sp + num_args])
+                    except RecursionError:
+                        # Make the call in the VM instead, see can_promote in
+                        # blok/tiering.py
+                        sp += num_args
+                        ops[pc] = OP_CALL_PROCEDURE
+                        continue
+
+                    if value != None:
+                        stack[sp] = value
+                        sp += 1
+                else:
+                    assert False, op
+
+                pc += 1
+
+            if op == OP_STOP:
+                break
+
+            # Stopped after a jump or call, with pc at its target
+            check_at = min(execution.check_limits(num_instrs, stack, pc, bp), slice_end)
+            if num_instrs > slice_end:
+                execution.pc = pc
+                execution.sp = sp
+                execution.bp = bp
+                execution.stack = stack
+                execution.num_instrs = num_instrs
+                return None
+    except IndexError:
+        raise VMError("stack access out of bounds",
+                      make_call_trace(stack, pc, bp, func_names)) from None
+    finally:
+        execution.stop_clock()
+
+    execution.result = VMResult(stack_values(stack, sp), num_instrs)
+    return execution.result
+
+
+# Tracing is kept out of the loops above so it costs nothing when it is
+# turned off. This loop is only used when a tracer asks for VM events.
+def interp_traced(code, tracer, stack_config=DEFAULT_STACK_CONFIG, func_names=None, args=(),
+                  max_instrs=None, max_seconds=None):
+    # Only used for its limits, as this loop cannot be stopped and continued
+    execution = Execution(code, stack_config, func_names, args, max_instrs, max_seconds)
+    ops, args1, args2 = execution.ops, execution.args1, execution.args2
+    frame_sizes = execution.frame_sizes
+    trace_instrs = tracer.is_enabled(TraceLevel.INSTR)
+    pc = 0 # program counter
+    sp = 0 # stack pointer
+    bp = 0 # base pointer
+    stack = execution.stack
+    num_instrs = 0
+    execution.start_clock()
+    check_at = execution.next_check(num_instrs)
+    call_depth = 0
+    try:
+        while True:
+            op = ops[pc]
+            num_instrs += 1
+            if trace_instrs:
+                arg = args1[pc] if op in OPCODES_WITH_ARG else ""
+                if op == OP_LOAD_LOCAL_OFFSET:
+                    arg = f"{arg} {args2[pc]}"
+                line = f"{OPCODE_TO_NAME[op]:<30}{arg:<5}"
+
+            if op == OP_STOP:
+                if trace_instrs:
+                    tracer.emit(line)
+                break
+            elif op == OP_PUSH_CONST:
+                stack[sp] = args1[pc]
+                sp += 1
+            elif op == OP_LOAD_VALUE_AT_IDX:
+                stack[sp - 1] = stack[stack[sp - 1]]
+            elif op == OP_STORE_VALUE_AT_IDX:
+                sp -= 2
+                stack[stack[sp + 1]] = stack[sp]
+            elif op == OP_LOAD_BASE_POINTER:
+                stack[sp] = bp
+                sp += 1
+            elif op == OP_LOAD_LOCAL:
+                stack[sp] = stack[bp + args1[pc]]
+                sp += 1
+            elif op == OP_STORE_LOCAL:
+                sp -= 1
+                stack[bp + args1[pc]] = stack[sp]
+            elif op == OP_LOAD_LOCAL_OFFSET:
+                stack[sp] = stack[stack[bp + args1[pc]] + args2[pc]]
+                sp += 1
+            elif op == OP_ADD_CONST:
+                stack[sp - 1] += args1[pc]
+            elif op == OP_UNARYOP_NEG:
+                stack[sp - 1] = -stack[sp - 1]
+            elif op == OP_BINARYOP_ADD:
+                sp -= 1
+                stack[sp - 1] += stack[sp]
+            elif op == OP_BINARYOP_SUB:
+                sp -= 1
+                stack[sp - 1] -= stack[sp]
+            elif op == OP_BINARYOP_MUL:
+                sp -= 1
+                stack[sp - 1] *= stack[sp]
+            elif op == OP_INCR_STACK_BY_CONST:
+                sp += args1[pc]
+            elif op == OP_JUMP:
+                if num_instrs > check_at:
+                    check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_EQUAL:
+                sp -= 2
+                if stack[sp] == stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_NOT_EQUAL:
+                sp -= 2
+                if stack[sp] != stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_LESS_THAN:
+                sp -= 2
+                if stack[sp] < stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_LESS_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] <= stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_GREATER_THAN:
+                sp -= 2
+                if stack[sp] > stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_GREATER_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] >= stack[sp + 1]:
+                    if num_instrs > check_at:
+                        check_at = execution.check_limits(num_instrs, stack, pc, bp)
+                    pc = args1[pc] - 1
+            elif op == OP_CALL_PROCEDURE:
+                if num_instrs > check_at:
+                    check_at = execution.check_limits(num_instrs, stack, pc, bp)
+
+                min_size = sp + 2 + frame_sizes[args1[pc]]
+                if min_size > len(stack):
+                    stack = grow_stack_or_overflow(stack, stack_config, min_size,
+                                                   args1[pc], pc, bp, func_names)
+
+                num_args = args2[pc]
+                sp -= num_args
+                tracer.emit(f"{'  ' * call_depth}call {args1[pc]} from {pc} "
+                            f"args={stack[sp:sp + num_args]}")
+                call_depth += 1
+                stack[sp + 2:sp + 2 + num_args] = stack[sp:sp + num_args]
+                stack[sp] = pc
+                stack[sp + 1] = bp
+                sp += 2
+                bp = sp
+                pc = args1[pc] - 1
+            elif op == OP_RETURN:
+                num_returns = args1[pc]
+                call_depth -= 1
+                tracer.emit(f"{'  ' * call_depth}return to {stack[bp - 2]} "
+                            f"values={stack[sp - num_returns:sp]}")
+                bp -= 2
+                new_pc = stack[bp]
+                new_bp = stack[bp + 1]
+                stack[bp] = stack[sp - 1]
+                sp = bp + num_returns
+                pc = new_pc
+                bp = new_bp
+            else:
+                assert False, op
+
+            pc += 1
+            if trace_instrs:
+                tracer.emit(f"{line}{stack[:sp]}")
+    except IndexError:
+        raise VMError("stack access out of bounds",
+                      make_call_trace(stack, pc, bp, func_names)) from None
+
+    return VMResult(stack_values(stack, sp), num_instrs)
+
+
+# Runs like interp_lowered and fills in profile, see blok/profiler.py, with how
+# often each instruction ran, how long it took, which instruction ran before it
+# and how long each call stack ran for. Reading the clock after every
+# instruction makes this loop many times slower, so the times are only good for
+# comparing parts of the program with each other.
+def interp_profiled(code, profile, stack_config=DEFAULT_STACK_CONFIG, func_names=None):
+    ops, args1, args2 = split_code(code)
+    frame_sizes = compute_frame_sizes(code)
+    func_idents = profile.start(ops, args1, args2, func_names)
+    counts = profile.counts
+    times = profile.times
+    pair_counts = profile.pair_counts
+    stack_times = profile.stack_times
+    clock = time.perf_counter_ns
+    call_stack = [func_idents[0]]
+    pc = 0 # program counter
+    sp = 0 # stack pointer
+    bp = 0 # base pointer
+    stack = make_stack(stack_config.backing, stack_config.size)
+    num_instrs = 0
+    prev_op = OP_STOP
+    stack_start_time = clock()
+    instr_start_time = stack_start_time
+    try:
+        while True:
+            op = ops[pc]
+            num_instrs += 1
+            counts[pc] += 1
+            pair = (prev_op, op)
+            pair_counts[pair] = pair_counts.get(pair, 0) + 1
+            prev_op = op
+            instr_pc = pc
+            if op == OP_STOP:
+                break
+            elif op == OP_PUSH_CONST:
+                stack[sp] = args1[pc]
+                sp += 1
+            elif op == OP_LOAD_VALUE_AT_IDX:
+                stack[sp - 1] = stack[stack[sp - 1]]
+            elif op == OP_STORE_VALUE_AT_IDX:
+                sp -= 2
+                stack[stack[sp + 1]] = stack[sp]
+            elif op == OP_LOAD_BASE_POINTER:
+                stack[sp] = bp
+                sp += 1
+            elif op == OP_LOAD_LOCAL:
+                stack[sp] = stack[bp + args1[pc]]
+                sp += 1
+            elif op == OP_STORE_LOCAL:
+                sp -= 1
+                stack[bp + args1[pc]] = stack[sp]
+            elif op == OP_LOAD_LOCAL_OFFSET:
+                stack[sp] = stack[stack[bp + args1[pc]] + args2[pc]]
+                sp += 1
+            elif op == OP_ADD_CONST:
+                stack[sp - 1] += args1[pc]
+            elif op == OP_UNARYOP_NEG:
+                stack[sp - 1] = -stack[sp - 1]
+            elif op == OP_BINARYOP_ADD:
+                sp -= 1
+                stack[sp - 1] += stack[sp]
+            elif op == OP_BINARYOP_SUB:
+                sp -= 1
+                stack[sp - 1] -= stack[sp]
+            elif op == OP_BINARYOP_MUL:
+                sp -= 1
+                stack[sp - 1] *= stack[sp]
+            elif op == OP_INCR_STACK_BY_CONST:
+                sp += args1[pc]
+            elif op == OP_JUMP:
+                pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_EQUAL:
+                sp -= 2
+                if stack[sp] == stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_NOT_EQUAL:
+                sp -= 2
+                if stack[sp] != stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_LESS_THAN:
+                sp -= 2
+                if stack[sp] < stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_LESS_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] <= stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_GREATER_THAN:
+                sp -= 2
+                if stack[sp] > stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_JUMP_IF_GREATER_THAN_EQUAL:
+                sp -= 2
+                if stack[sp] >= stack[sp + 1]: pc = args1[pc] - 1
+            elif op == OP_CALL_PROCEDURE:
+                min_size = sp + 2 + frame_sizes[args1[pc]]
+                if min_size > len(stack):
+                    stack = grow_stack_or_overflow(stack, stack_config, min_size,
+                                                   args1[pc], pc, bp, func_names)
+
+                num_args = args2[pc]
+                sp -= num_args
+                stack[sp + 2:sp + 2 + num_args] = stack[sp:sp + num_args]
+                stack[sp] = pc
+                stack[sp + 1] = bp
+                sp += 2
+                bp = sp
+                pc = args1[pc] - 1
+                now = clock()
+                stack_times[call_stack[-1]] += now - stack_start_time
+                stack_start_time = now
+                if len(call_stack) < MAX_PROFILED_STACK_DEPTH:
+                    call_stack.append(f"{call_stack[-1]};{func_idents[pc + 1]}")
+                    stack_times.setdefault(call_stack[-1], 0)
+                else:
+                    call_stack.append(call_stack[-1])
+            elif op == OP_RETURN:
+                bp -= 2
+                new_pc = stack[bp]
+                new_bp = stack[bp + 1]
+                stack[bp] = stack[sp - 1]
+                sp = bp + args1[pc]
+                pc = new_pc
+                bp = new_bp
+                now = clock()
+                stack_times[call_stack.pop()] += now - stack_start_time
+                stack_start_time = now
+            else:
+                assert False, op
+
+            pc += 1
+            now = clock()
+            times[instr_pc] += now - instr_start_time
+            instr_start_time = now
+    except IndexError:
+        raise VMError("stack access out of bounds",
+                      make_call_trace(stack, pc, bp, func_names)) from None
+
+    stack_times[call_stack[-1]] += clock() - stack_start_time
+    return VMResult(stack_values(stack, sp), num_instrs)
@@ -0,0 +1,41 @@
+from enum import Enum
+
+
+class ByteCode(Enum):
+    STOP                        =  0
+    LABEL                       =  1
+    PUSH_CONST                  =  2
+    LOAD_VALUE_AT_IDX           =  3
+    STORE_VALUE_AT_IDX          =  4
+    INCR_STACK_BY_CONST         =  5
+    LOAD_BASE_POINTER           =  6
+    UNARYOP_NEG                 =  7
+    BINARYOP_ADD                =  8
+    BINARYOP_SUB                =  9
+    BINARYOP_MUL                = 10
+    BINARYOP_DIV                = 11
+    JUMP                        = 12
+    JUMP_IF_EQUAL               = 13
+    JUMP_IF_NOT_EQUAL           = 14
+    JUMP_IF_LESS_THAN           = 15
+    JUMP_IF_LESS_THAN_EQUAL     = 16
+    JUMP_IF_GREATER_THAN        = 17
+    JUMP_IF_GREATER_THAN_EQUAL  = 18
+    CALL_PROCEDURE              = 19
+    RETURN                      = 20
+    # Superinstructions for the frame-relative accesses almost every
+    # statement makes, each replacing three or four of the instructions above
+    LOAD_LOCAL                  = 21
+    STORE_LOCAL                 = 22
+    LOAD_LOCAL_OFFSET           = 23
+    ADD_CONST                   = 24
+    # Pseudo-instruction like LABEL: the instructions after it come from the
+    # source line in its operand
+    LINE                        = 25
+
+
+    def __repr__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,125 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+
+
+# Bump COMPILER_VERSION whenever the code generator emits different bytecode
+# for the same source, so stale .blkc files are recompiled
+COMPILER_VERSION = 4
+FORMAT_VERSION = 1
+CACHE_SUFFIX = ".blkc"
+
+MAGIC = b"BLKC"
+BYTE_ORDERS = {"little": 0, "big": 1}
+# magic, format version, byte order of the instructions, key, code length, number of functions
+HEADER = struct.Struct("<4sHBx32sII")
+FUNC_ENTRY = struct.Struct("<IH")
+CODE_ALIGNMENT = 8
+
+
+# Each backend gets its own cache file, so switching between them does not
+# throw the other one's code away
+def cache_path_for(filename, backend="stack"):
+    stem = os.path.splitext(filename)[0]
+    if backend != "stack":
+        stem += f".{backend}"
+
+    return stem + CACHE_SUFFIX
+
+
+def cache_key(source, backend="stack"):
+    digest = hashlib.sha256(f"{COMPILER_VERSION}\0{backend}\0".encode())
+    digest.update(source.encode())
+    return digest.digest()
+
+
+def save_cache(path, key, code, func_names):
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDERS[sys.byteorder],
+                         key, len(code), len(func_names))
+    entries = []
+    for idx, ident in func_names.items():
+        name = ident.encode()
+        entries.append(FUNC_ENTRY.pack(idx, len(name)) + name)
+
+    funcs = b"".join(entries)
+
+    padding = -(len(header) + len(funcs)) % CODE_ALIGNMENT
+    def write(cachefile):
+        cachefile.write(header)
+        cachefile.write(funcs)
+        cachefile.write(bytes(padding))
+        cachefile.write(array("q", code).tobytes())
+
+    write_atomically(path, write)
+
+
+# Writes the file with write(file) under a temporary name and then renames
+# it, so readers either see the old file or the complete new one
+def write_atomically(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as cachefile:
+        write(cachefile)
+
+    os.replace(tmp_path, path)
+
+
+# The cache files of modules and functions, see blok/modules.py and
+# blok/incremental.py, are pickled
+def save_pickle_atomically(path, obj):
+    write_atomically(path, lambda cachefile: pickle.dump(obj, cachefile,
+                                                         pickle.HIGHEST_PROTOCOL))
+
+
+# Returns the object pickled in the file at path, or None if the file is
+# missing or damaged
+def load_pickle(path):
+    try:
+        with open(path, "rb") as cachefile:
+            return pickle.load(cachefile)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError):
+        return None
+
+
+# Returns the lowered code and the function names stored in the cache file,
+# or None if the file is missing, stale or damaged. The code is a memoryview
+# over the mapped file, so the instructions are never copied while loading.
+def load_cache(path, key):
+    try:
+        with open(path, "rb") as cachefile:
+            buffer = mmap.mmap(cachefile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, format_version, byte_order, file_key, code_len, num_funcs = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or \
+           format_version != FORMAT_VERSION or \
+           byte_order != BYTE_ORDERS[sys.byteorder] or \
+           file_key != key:
+            buffer.close()
+            return None
+
+        offset = HEADER.size
+        func_names = {}
+        for _ in range(num_funcs):
+            idx, name_len = FUNC_ENTRY.unpack_from(buffer, offset)
+            offset += FUNC_ENTRY.size
+            func_names[idx] = buffer[offset:offset + name_len].decode()
+            offset += name_len
+
+        offset += -offset % CODE_ALIGNMENT
+        code_end = offset + code_len * 8
+        if code_end != len(buffer):
+            buffer.close()
+            return None
+    except (struct.error, UnicodeDecodeError):
+        buffer.close()
+        return None
+
+    code = memoryview(buffer)[offset:code_end].cast("q")
+    return code, func_names
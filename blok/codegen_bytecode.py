@@ -1,7 +1,24 @@
-from copy import deepcopy
-from enum import Enum
-from blok.token import TokenKind
-from blok.typechecker import EvalKind
+from blok.bytecode import ByteCode
+from blok.peephole import PEEPHOLE_RULES, SUPERINSTRUCTION_RULES, PeepholeOptimizer
+from blok.scopes import SymbolTable
+from blok.token import (
+    TK_DOT,
+    TK_EXMARK_EQUAL,
+    TK_GREATER_THAN,
+    TK_GREATER_THAN_EQUAL,
+    TK_IDENT,
+    TK_INT_LITERAL,
+    TK_LESS_THAN,
+    TK_LESS_THAN_EQUAL,
+    TK_MINUS,
+    TK_PLUS,
+    TK_SLASH,
+    TK_STAR,
+    TK_TWO_EQUAL
+)
+from blok.trace import NO_TRACE, TraceLevel
+from blok.typechecker import EK_BOOL, EK_INT, EK_PTR
+from blok.visitor import Visitor
 from blok.astnodes import (
     BlkProgram,
     ReturnStatement,
@@ -20,76 +37,95 @@ from blok.astnodes import (
 )
 
 
-class ByteCode(Enum):
-    STOP                        =  0
-    LABEL                       =  1
-    PUSH_CONST                  =  2
-    LOAD_VALUE_AT_IDX           =  3
-    STORE_VALUE_AT_IDX          =  4
-    INCR_STACK_BY_CONST         =  5
-    LOAD_BASE_POINTER           =  6
-    UNARYOP_NEG                 =  7
-    BINARYOP_ADD                =  8
-    BINARYOP_SUB                =  9
-    BINARYOP_MUL                = 10
-    BINARYOP_DIV                = 11
-    JUMP                        = 12
-    JUMP_IF_EQUAL               = 13
-    JUMP_IF_NOT_EQUAL           = 14
-    JUMP_IF_LESS_THAN           = 15
-    JUMP_IF_LESS_THAN_EQUAL     = 16
-    JUMP_IF_GREATER_THAN        = 17
-    JUMP_IF_GREATER_THAN_EQUAL  = 18
-    CALL_PROCEDURE              = 19
-    RETURN                      = 20
-
-
-    def __repr__(self):
-        return self.name
-
-    def __str__(self):
-        return self.name
-
-
-class CodeGenByteCode:
-    def __init__(self, ast):
+class CodeGenByteCode(Visitor):
+    def __init__(self, ast, tracer=NO_TRACE, superinstructions=True, iterative=False,
+                 line_info=False, optimize=True):
+        super().__init__(iterative)
         self.ast = ast
+        self.tracer = tracer
+        self.superinstructions = superinstructions
+        # Whether gen_bytecode runs the peephole optimizer
+        self.optimize = optimize
+        # Whether to emit LINE markers, which end up in idx_to_line
+        self.line_info = line_info
         self.localvar_idx = 0
         self.bytecode = []
-        self.localvar_to_idx = {}
+        self.locals = SymbolTable()
+        # Lookups go straight to the dict, see SymbolTable
+        self.localvar_to_idx = self.locals.bindings
         self.funcident_to_label = {}
         self.label_to_idx = {}
+        self.idx_to_funcident = {}
+        # Indices of the instructions whose operand is the index of an
+        # instruction, and of the calls gen_module_bytecode left to the linker
+        self.relocations = []
+        self.call_sites = []
+        # Source line of the instructions from each index on, up to the next index in it
+        self.idx_to_line = {}
+        self.peephole_stats = {}
+        # Numbers of instructions and labels gen_bytecode had before and after optimizing
+        self.unoptimized_length = None
+        self.optimized_length = None
+        self.statement_methods = self.make_dispatch_table({
+            VarDecl:         "gen_bytecode_vardecl",
+            BinaryOp:        "gen_bytecode_varassign",
+            IfStatement:     "gen_bytecode_if_statement",
+            WhileLoop:       "gen_bytecode_while_loop",
+            ForLoop:         "gen_bytecode_for_loop",
+            FuncCall:        "gen_bytecode_funccall",
+            ReturnStatement: "gen_bytecode_return_statement",
+            LoopControl:     "gen_bytecode_loopcontrol",
+            Block:           "gen_bytecode_block",
+        })
+        self.expr_methods = self.make_dispatch_table({
+            Literal:  "gen_bytecode_literal",
+            FuncCall: "gen_bytecode_funccall",
+            UnaryOp:  "gen_bytecode_unaryop",
+            BinaryOp: "gen_bytecode_binaryop",
+        })
+
+    # Drops the LABEL pseudo-instructions and resolves every label operand to
+    # an instruction index in one sweep. Forward references are recorded and
+    # patched afterwards, instead of deleting labels out of the list one by one.
+    # Without resolve_calls, calls keep the identifier of their function.
+    def replace_labels_by_idx(self, resolve_calls=True):
+        assembled = []
+        fixups = []
+        for code in self.bytecode:
+            if code[0] == ByteCode.LABEL:
+                self.label_to_idx[code[1]] = len(assembled)
+                continue
+
+            if code[0] == ByteCode.LINE:
+                self.idx_to_line[len(assembled)] = code[1]
+                continue
 
-    def replace_labels_by_idx(self):
-        for i in range(len(self.bytecode)):
-            code = self.bytecode[i]
             if code[0] == ByteCode.CALL_PROCEDURE:
-                func_label = self.funcident_to_label[code[1]]
-                self.bytecode[i] = (code[0], func_label, code[2])
+                if not resolve_calls:
+                    self.call_sites.append(len(assembled))
+                    assembled.append(code)
+                    continue
 
-        i = 0
-        while True:
-            if i == len(self.bytecode):
-                break
+                code = (code[0], self.funcident_to_label[code[1]], code[2])
 
-            code = self.bytecode[i]
-            if code[0] == ByteCode.LABEL:
-                self.label_to_idx[code[1]] = i
-                del self.bytecode[i]
-            else:
-                i += 1
+            if len(code) > 1 and isinstance(code[1], str):
+                fixups.append(len(assembled))
+
+            assembled.append(code)
+
+        for i in fixups:
+            code = assembled[i]
+            assembled[i] = (code[0], self.label_to_idx[code[1]]) + code[2:]
 
-        for i in range(len(self.bytecode)):
-            code = self.bytecode[i]
-            if len(code) == 2 and isinstance(code[1], str):
-                self.bytecode[i] = (code[0], self.label_to_idx[code[1]])
-            elif len(code) == 3 and isinstance(code[1], str):
-                self.bytecode[i] = (code[0], self.label_to_idx[code[1]], code[2])
+        self.relocations = fixups
+        self.bytecode = assembled
+        for ident, label in self.funcident_to_label.items():
+            self.idx_to_funcident[self.label_to_idx[label]] = ident
 
     def add_var(self, ident, offset=1):
         idx = self.localvar_idx
         self.localvar_idx += offset
-        self.localvar_to_idx[ident] = idx
+        self.locals.bind(ident, idx)
         return idx
 
     def get_new_label(self):
@@ -98,146 +134,171 @@ class CodeGenByteCode:
         return label_name
 
     def gen_bytecode(self):
-        self.bytecode = [
-            (ByteCode.CALL_PROCEDURE, "Main", 0),
-            (ByteCode.STOP,)
-        ]
-
         self.gen_bytecode_blkfile()
-        print(f"\n{'-'*10} BEFORE OPTIMIZATION {'-'*10}\n")
-        for i, j in enumerate(self.bytecode): print(i, j)
-        len_bfr = len(self.bytecode)
+        self.trace_bytecode("BEFORE OPTIMIZATION")
+        self.unoptimized_length = len(self.bytecode)
 
-        self.optimize_bytecode()
+        if self.optimize:
+            self.optimize_bytecode()
 
-        print(f"\n{'-'*10} AFTER OPTIMIZATION {'-'*10}\n")
-        for i, j in enumerate(self.bytecode): print(i, j)
-        print(f"\n{'-'*10} OPTIMIZED {len_bfr - len(self.bytecode)} {'-'*10}\n")
+        self.trace_bytecode("AFTER OPTIMIZATION")
+        self.optimized_length = len(self.bytecode)
+        if self.tracer.is_enabled(TraceLevel.PHASE):
+            num_optimized = self.unoptimized_length - self.optimized_length
+            self.tracer.emit(f"\n{'-'*10} OPTIMIZED {num_optimized} {'-'*10}\n")
 
         self.replace_labels_by_idx()
         return self.bytecode
 
+    # Optimized code for the functions of one module, without the call to Main
+    # that starts a program. The calls are left to the linker in
+    # blok/modules.py, as their functions may be in other modules.
+    def gen_module_bytecode(self):
+        self.bytecode = []
+        self.walk(self.gen_bytecode_funcdecls())
+        self.optimize_bytecode()
+        self.replace_labels_by_idx(resolve_calls=False)
+        return self.bytecode
+
+    def trace_bytecode(self, title):
+        if not self.tracer.is_enabled(TraceLevel.PHASE):
+            return
+
+        self.tracer.emit(f"\n{'-'*10} {title} {'-'*10}\n")
+        for i, code in enumerate(self.bytecode):
+            self.tracer.emit(f"{i} {code}")
+
     def optimize_bytecode(self):
-        idx = 0
-        while True:
-            if idx >= len(self.bytecode):
-                break
-
-            code = self.bytecode[idx]
-            if code[0] == ByteCode.BINARYOP_ADD:
-                fst = self.bytecode[idx - 1]
-                snd = self.bytecode[idx - 2]
-                if fst[0] == ByteCode.PUSH_CONST and fst[1] == 0:
-                    del self.bytecode[idx]
-                    del self.bytecode[idx - 1]
-                    idx -= 1
-                    continue
-                elif snd[0] == ByteCode.PUSH_CONST and snd[1] == 0:
-                    del self.bytecode[idx]
-                    del self.bytecode[idx - 2]
-                    idx -= 1
-                    continue
-            elif code[0] == ByteCode.INCR_STACK_BY_CONST:
-                if code[1] == 0:
-                    del self.bytecode[idx]
-                    continue
+        rules = PEEPHOLE_RULES
+        if self.superinstructions:
+            rules = rules + SUPERINSTRUCTION_RULES
+
+        optimizer = PeepholeOptimizer(self.funcident_to_label.values(), rules)
+        self.bytecode = optimizer.optimize(self.bytecode)
+        self.peephole_stats = optimizer.stats
+        if self.tracer.is_enabled(TraceLevel.PHASE):
+            for name, (hits, num_removed) in self.peephole_stats.items():
+                self.tracer.emit(f"{name:<24}{hits:>8} hits{num_removed:>8} removed")
+
+    # Pushes the local at bp + idx, or the value at offset from the pointer
+    # stored there
+    def gen_bytecode_load_local(self, idx, offset=None):
+        if self.superinstructions:
+            if offset == None:
+                self.bytecode += [(ByteCode.LOAD_LOCAL, idx)]
+            else:
+                self.bytecode += [(ByteCode.LOAD_LOCAL_OFFSET, idx, offset)]
+            return
 
-            idx += 1
+        self.bytecode += [
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, idx),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.LOAD_VALUE_AT_IDX,)
+        ]
+
+        if offset != None:
+            self.bytecode += [
+                (ByteCode.PUSH_CONST, offset),
+                (ByteCode.BINARYOP_ADD,),
+                (ByteCode.LOAD_VALUE_AT_IDX,),
+            ]
+
+    # Pops the top of the stack into the local at bp + idx
+    def gen_bytecode_store_local(self, idx):
+        if self.superinstructions:
+            self.bytecode += [(ByteCode.STORE_LOCAL, idx)]
+            return
+
+        self.bytecode += [
+            (ByteCode.LOAD_BASE_POINTER,),
+            (ByteCode.PUSH_CONST, idx),
+            (ByteCode.BINARYOP_ADD,),
+            (ByteCode.STORE_VALUE_AT_IDX,)
+        ]
+
+    # break and continue are left to the line before them, which keeps
+    # 'if c { break; }' a single inverted branch
+    def gen_bytecode_line(self, node):
+        if node.line != None and not isinstance(node, LoopControl):
+            self.bytecode += [(ByteCode.LINE, node.line)]
 
     def gen_bytecode_blkfile(self):
+        self.bytecode = [
+            (ByteCode.CALL_PROCEDURE, "Main", 0),
+            (ByteCode.STOP,)
+        ]
+
+        self.walk(self.gen_bytecode_funcdecls())
+
+    def gen_bytecode_funcdecls(self):
         for funcdecl in self.ast.funcdecls:
-            self.gen_bytecode_funcdecl(funcdecl)
+            yield self.gen_bytecode_funcdecl(funcdecl)
 
     def gen_bytecode_return_statement(self, return_statement):
         num_returns = 0
         if return_statement.expr != None:
             num_returns = 1
-            self.gen_bytecode_expr(return_statement.expr)
+            yield self.gen_bytecode_expr(return_statement.expr)
 
         self.bytecode += [(ByteCode.RETURN, num_returns)]
 
     def gen_bytecode_funccall(self, funccall):
         for arg in funccall.args:
-            self.gen_bytecode_expr(arg)
+            yield self.gen_bytecode_expr(arg)
 
         self.bytecode += [(ByteCode.CALL_PROCEDURE, funccall.ident.value, len(funccall.args))]
 
     def gen_bytecode_funcdecl(self, funcdecl):
         self.localvar_idx = 0
-        self.localvar_to_idx = {}
+        self.locals.clear()
         start_label = self.get_new_label()
         self.funcident_to_label[funcdecl.ident.value] = start_label
-        self.bytecode += [
-            (ByteCode.LABEL, start_label),
-            (ByteCode.INCR_STACK_BY_CONST, funcdecl.stack_size)
-        ]
+        self.bytecode += [(ByteCode.LABEL, start_label)]
+        if self.line_info:
+            self.gen_bytecode_line(funcdecl)
+
+        self.bytecode += [(ByteCode.INCR_STACK_BY_CONST, funcdecl.stack_size)]
 
         for param in funcdecl.params:
             self.add_var(param.ident.value)
 
-        self.gen_bytecode_block(funcdecl.block)
+        yield self.gen_bytecode_block(funcdecl.block)
 
     def gen_bytecode_block(self, block):
-        vars_before = deepcopy(self.localvar_to_idx)
+        self.locals.push_scope()
+        statement_methods = self.statement_methods
         for statement in block.statements:
-            if isinstance(statement, VarDecl):
-                self.gen_bytecode_vardecl(statement)
-            elif isinstance(statement, BinaryOp):
-                self.gen_bytecode_varassign(statement)
-            elif isinstance(statement, IfStatement):
-                self.gen_bytecode_if_statement(statement)
-            elif isinstance(statement, WhileLoop):
-                self.gen_bytecode_while_loop(statement)
-            elif isinstance(statement, ForLoop):
-                self.gen_bytecode_for_loop(statement)
-            elif isinstance(statement, FuncCall):
-                self.gen_bytecode_funccall(statement)
-            elif isinstance(statement, ReturnStatement):
-                self.gen_bytecode_return_statement(statement)
-            elif isinstance(statement, LoopControl):
-                self.gen_bytecode_loopcontrol(statement)
-            else: assert False
-
-        self.localvar_to_idx = vars_before
+            if self.line_info:
+                self.gen_bytecode_line(statement)
+
+            yield statement_methods[statement.__class__](statement)
+
+        self.locals.pop_scope()
 
     def gen_bytecode_for_loop(self, for_loop):
         idx = self.add_var(for_loop.var_ident.value)
-        self.gen_bytecode_expr(for_loop.start)
+        yield self.gen_bytecode_expr(for_loop.start)
         for_loop.start_label = self.get_new_label()
-        self.bytecode += [
-            (ByteCode.LOAD_BASE_POINTER,),
-            (ByteCode.PUSH_CONST, idx),
-            (ByteCode.BINARYOP_ADD,),
-            (ByteCode.STORE_VALUE_AT_IDX,),
-            (ByteCode.LABEL, for_loop.start_label)
-        ]
+        self.gen_bytecode_store_local(idx)
+        self.bytecode += [(ByteCode.LABEL, for_loop.start_label)]
 
-        self.gen_bytecode_expr(for_loop.stop)
+        yield self.gen_bytecode_expr(for_loop.stop)
         for_loop.end_label = self.get_new_label()
-        self.bytecode += [
-            (ByteCode.LOAD_BASE_POINTER,),
-            (ByteCode.PUSH_CONST, idx),
-            (ByteCode.BINARYOP_ADD,),
-            (ByteCode.LOAD_VALUE_AT_IDX,),
-            (ByteCode.JUMP_IF_LESS_THAN, for_loop.end_label)
-        ]
+        self.gen_bytecode_load_local(idx)
+        self.bytecode += [(ByteCode.JUMP_IF_LESS_THAN, for_loop.end_label)]
 
         for_loop.step_label = self.get_new_label()
-        self.gen_bytecode_block(for_loop.block)
+        yield self.gen_bytecode_block(for_loop.block)
         self.bytecode += [(ByteCode.LABEL, for_loop.step_label)]
-        self.gen_bytecode_expr(for_loop.step)
-        self.bytecode += [
-            (ByteCode.LOAD_BASE_POINTER,),
-            (ByteCode.PUSH_CONST, idx),
-            (ByteCode.BINARYOP_ADD,),
-            (ByteCode.LOAD_VALUE_AT_IDX,),
-            (ByteCode.BINARYOP_ADD,),
-
-            (ByteCode.LOAD_BASE_POINTER,),
-            (ByteCode.PUSH_CONST, idx),
-            (ByteCode.BINARYOP_ADD,),
-            (ByteCode.STORE_VALUE_AT_IDX,),
+        if self.line_info:
+            self.gen_bytecode_line(for_loop)
 
+        yield self.gen_bytecode_expr(for_loop.step)
+        self.gen_bytecode_load_local(idx)
+        self.bytecode += [(ByteCode.BINARYOP_ADD,)]
+        self.gen_bytecode_store_local(idx)
+        self.bytecode += [
             (ByteCode.JUMP, for_loop.start_label),
             (ByteCode.LABEL, for_loop.end_label)
         ]
@@ -246,9 +307,12 @@ class CodeGenByteCode:
         while_loop.start_label = self.get_new_label()
         while_loop.end_label = self.get_new_label()
         self.bytecode += [(ByteCode.LABEL, while_loop.start_label)]
-        self.gen_bytecode_expr(while_loop.condition)
+        yield self.gen_bytecode_expr(while_loop.condition)
         self.bytecode[-1] = (self.bytecode[-1][0], while_loop.end_label)
-        self.gen_bytecode_block(while_loop.block)
+        yield self.gen_bytecode_block(while_loop.block)
+        if self.line_info:
+            self.gen_bytecode_line(while_loop)
+
         self.bytecode += [(ByteCode.JUMP, while_loop.start_label)]
         self.bytecode += [(ByteCode.LABEL, while_loop.end_label)]
 
@@ -259,41 +323,47 @@ class CodeGenByteCode:
             self.bytecode += [(ByteCode.JUMP, loopcontrol.parent_loop.step_label)]
 
     def gen_bytecode_if_statement(self, if_statement):
-        self.gen_bytecode_expr(if_statement.condition)
+        yield self.gen_bytecode_expr(if_statement.condition)
         else_label = self.get_new_label()
         self.bytecode[-1] = (self.bytecode[-1][0], else_label)
-        self.gen_bytecode_block(if_statement.block)
+        yield self.gen_bytecode_block(if_statement.block)
         is_else_block_none = if_statement.else_block == None
         if not is_else_block_none:
             end_label = self.get_new_label()
             self.bytecode += [(ByteCode.JUMP, end_label)]
 
         self.bytecode += [(ByteCode.LABEL, else_label)]
-        if isinstance(if_statement.else_block, IfStatement):
-            self.gen_bytecode_if_statement(if_statement.else_block)
-        elif isinstance(if_statement.else_block, Block):
-            self.gen_bytecode_block(if_statement.else_block)
+        if not is_else_block_none:
+            else_block = if_statement.else_block
+            yield self.statement_methods[else_block.__class__](else_block)
 
         if not is_else_block_none:
             self.bytecode += [(ByteCode.LABEL, end_label)]
 
     def gen_bytecode_varassign(self, varassign):
-        self.gen_bytecode_expr(varassign.rhs)
-        self.bytecode += [(ByteCode.LOAD_BASE_POINTER,)]
+        yield self.gen_bytecode_expr(varassign.rhs)
         lhs = varassign.lhs
+        if isinstance(lhs, Literal) and lhs.offset == None:
+            self.gen_bytecode_store_local(self.localvar_to_idx[lhs.token.value])
+            return
+
+        if isinstance(lhs, BinaryOp):
+            assert lhs.op.kind == TK_DOT
+            local_idx = self.localvar_to_idx[lhs.lhs.token.value]
+            self.gen_bytecode_store_local(local_idx + lhs.rhs.offset)
+            return
+
+        self.bytecode += [(ByteCode.LOAD_BASE_POINTER,)]
         if isinstance(lhs, Literal):
+            # Stores through the pointer held in the variable
             local_idx = self.localvar_to_idx[lhs.token.value]
             self.bytecode += [
                 (ByteCode.PUSH_CONST, local_idx),
                 (ByteCode.BINARYOP_ADD,),
+                (ByteCode.LOAD_VALUE_AT_IDX,),
+                (ByteCode.PUSH_CONST, lhs.offset),
+                (ByteCode.BINARYOP_ADD,),
             ]
-
-            if lhs.offset != None:
-                self.bytecode += [
-                    (ByteCode.LOAD_VALUE_AT_IDX,),
-                    (ByteCode.PUSH_CONST, lhs.offset),
-                    (ByteCode.BINARYOP_ADD,),
-                ]
         elif isinstance(lhs, UnaryOp):
             num_derefs = 0
             while isinstance(lhs, UnaryOp):
@@ -306,25 +376,17 @@ class CodeGenByteCode:
                 (ByteCode.BINARYOP_ADD,),
             ]
             self.bytecode += [(ByteCode.LOAD_VALUE_AT_IDX,)] * num_derefs
-        elif isinstance(lhs, BinaryOp):
-            assert lhs.op.kind == TokenKind.DOT
-            print(lhs)
-            local_idx = self.localvar_to_idx[lhs.lhs.token.value]
-            self.bytecode += [
-                (ByteCode.PUSH_CONST, local_idx),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.PUSH_CONST, lhs.rhs.offset),
-                (ByteCode.BINARYOP_ADD,),
-            ]
         else: assert False, f"\n{varassign}"
         self.bytecode += [(ByteCode.STORE_VALUE_AT_IDX,)]
 
     def gen_bytecode_vardecl(self, vardecl):
-        is_array = vardecl.stack_size > 1 and vardecl.kind.kind != TokenKind.IDENT
+        is_array = vardecl.stack_size > 1 and vardecl.kind.kind != TK_IDENT
         if is_array:
+            # The elements come first and the variable itself holds a pointer to them
             self.localvar_idx += vardecl.stack_size - 1
-
-        idx = self.add_var(vardecl.ident.value, vardecl.stack_size)
+            idx = self.add_var(vardecl.ident.value)
+        else:
+            idx = self.add_var(vardecl.ident.value, vardecl.stack_size)
         if is_array:
             # TODO: If vardecl is a struct containing an array
             #       then first_elem_idx will point to where
@@ -335,118 +397,77 @@ class CodeGenByteCode:
                 (ByteCode.LOAD_BASE_POINTER,),
                 (ByteCode.PUSH_CONST, first_elem_idx),
                 (ByteCode.BINARYOP_ADD,),
-
-                (ByteCode.LOAD_BASE_POINTER,),
-                (ByteCode.PUSH_CONST, idx),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.STORE_VALUE_AT_IDX,)
             ]
+            self.gen_bytecode_store_local(idx)
         elif vardecl.expr != None:
-            self.gen_bytecode_expr(vardecl.expr)
-            self.bytecode += [
-                (ByteCode.LOAD_BASE_POINTER,),
-                (ByteCode.PUSH_CONST, idx),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.STORE_VALUE_AT_IDX,)
-            ]
+            yield self.gen_bytecode_expr(vardecl.expr)
+            self.gen_bytecode_store_local(idx)
 
     def gen_bytecode_expr(self, expr):
-        if isinstance(expr, Literal):
-            self.gen_bytecode_literal(expr)
-        elif isinstance(expr, FuncCall):
-            self.gen_bytecode_funccall(expr)
-        elif expr.eval_kind == EvalKind.INT:
-            self.gen_bytecode_arith_expr(expr)
-        elif expr.eval_kind == EvalKind.BOOL:
-            self.gen_bytecode_logic_expr(expr)
-        elif expr.eval_kind == EvalKind.PTR:
-            self.gen_bytecode_ptr_expr(expr)
-        else: assert False, f"\n{expr}"
-
-    def gen_bytecode_arith_expr(self, expr):
-        if isinstance(expr, UnaryOp):
-            self.gen_bytecode_arith_unaryop(expr)
-        elif isinstance(expr, BinaryOp):
-            self.gen_bytecode_arith_binaryop(expr)
-        else: assert False, f"\n{expr}"
-
-    def gen_bytecode_logic_expr(self, expr):
-        if isinstance(expr, BinaryOp):
-            self.gen_bytecode_logic_binaryop(expr)
-        else: assert False
-
-    def gen_bytecode_ptr_expr(self, expr):
-        if isinstance(expr, UnaryOp):
-            self.gen_bytecode_ptr_unaryop(expr)
-        else: assert False
+        return self.expr_methods[expr.__class__](expr)
+
+    def gen_bytecode_unaryop(self, unaryop):
+        if unaryop.eval_kind == EK_INT:
+            return self.gen_bytecode_arith_unaryop(unaryop)
+        if unaryop.eval_kind == EK_PTR:
+            return self.gen_bytecode_ptr_unaryop(unaryop)
+        assert False, f"\n{unaryop}"
+
+    def gen_bytecode_binaryop(self, binaryop):
+        if binaryop.eval_kind == EK_INT:
+            return self.gen_bytecode_arith_binaryop(binaryop)
+        if binaryop.eval_kind == EK_BOOL:
+            return self.gen_bytecode_logic_binaryop(binaryop)
+        assert False, f"\n{binaryop}"
 
     def gen_bytecode_literal(self, literal):
-        if literal.token.kind == TokenKind.IDENT:
+        if literal.token.kind == TK_IDENT:
             idx = self.localvar_to_idx[literal.token.value]
-            self.bytecode += [
-                (ByteCode.LOAD_BASE_POINTER,),
-                (ByteCode.PUSH_CONST, idx),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.LOAD_VALUE_AT_IDX,)
-            ]
-
-            if literal.offset != None:
-                self.bytecode += [
-                    (ByteCode.PUSH_CONST, literal.offset),
-                    (ByteCode.BINARYOP_ADD,),
-                    (ByteCode.LOAD_VALUE_AT_IDX,),
-                ]
-        elif literal.token.kind == TokenKind.INT_LITERAL:
+            self.gen_bytecode_load_local(idx, literal.offset)
+        elif literal.token.kind == TK_INT_LITERAL:
             self.bytecode += [(ByteCode.PUSH_CONST, literal.token.value)]
         else: assert False
 
     def gen_bytecode_arith_unaryop(self, unaryop):
-        self.gen_bytecode_expr(unaryop.expr)
-        if unaryop.op.kind == TokenKind.MINUS:
+        yield self.gen_bytecode_expr(unaryop.expr)
+        if unaryop.op.kind == TK_MINUS:
             self.bytecode += [(ByteCode.UNARYOP_NEG,)]
-        elif unaryop.op.kind == TokenKind.LESS_THAN:
+        elif unaryop.op.kind == TK_LESS_THAN:
             self.bytecode += [
                 (ByteCode.LOAD_VALUE_AT_IDX,)
             ]
         else: assert False, f"\n{unaryop}"
 
     def gen_bytecode_arith_binaryop(self, binaryop):
-        if binaryop.op.kind == TokenKind.DOT:
+        if binaryop.op.kind == TK_DOT:
             idx = self.localvar_to_idx[binaryop.lhs.token.value]
-            self.bytecode += [
-                (ByteCode.LOAD_BASE_POINTER,),
-                (ByteCode.PUSH_CONST, idx),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.PUSH_CONST, binaryop.rhs.offset),
-                (ByteCode.BINARYOP_ADD,),
-                (ByteCode.LOAD_VALUE_AT_IDX,)
-            ]
+            self.gen_bytecode_load_local(idx + binaryop.rhs.offset)
             return
 
-        self.gen_bytecode_expr(binaryop.lhs)
-        self.gen_bytecode_expr(binaryop.rhs)
+        yield self.gen_bytecode_expr(binaryop.lhs)
+        yield self.gen_bytecode_expr(binaryop.rhs)
         op_kind = binaryop.op.kind
-        if   op_kind == TokenKind.PLUS:  self.bytecode += [(ByteCode.BINARYOP_ADD,)]
-        elif op_kind == TokenKind.MINUS: self.bytecode += [(ByteCode.BINARYOP_SUB,)]
-        elif op_kind == TokenKind.STAR:  self.bytecode += [(ByteCode.BINARYOP_MUL,)]
-        elif op_kind == TokenKind.SLASH: self.bytecode += [(ByteCode.BINARYOP_DIV,)]
+        if   op_kind == TK_PLUS:  self.bytecode += [(ByteCode.BINARYOP_ADD,)]
+        elif op_kind == TK_MINUS: self.bytecode += [(ByteCode.BINARYOP_SUB,)]
+        elif op_kind == TK_STAR:  self.bytecode += [(ByteCode.BINARYOP_MUL,)]
+        elif op_kind == TK_SLASH: self.bytecode += [(ByteCode.BINARYOP_DIV,)]
         else: assert False, f"\n{binaryop}"
 
     def gen_bytecode_logic_binaryop(self, binaryop):
-        self.gen_bytecode_expr(binaryop.lhs)
-        self.gen_bytecode_expr(binaryop.rhs)
+        yield self.gen_bytecode_expr(binaryop.lhs)
+        yield self.gen_bytecode_expr(binaryop.rhs)
         jump_kind = None
-        if binaryop.op.kind == TokenKind.TWO_EQUAL:
+        if binaryop.op.kind == TK_TWO_EQUAL:
             jump_kind = ByteCode.JUMP_IF_NOT_EQUAL
-        elif binaryop.op.kind == TokenKind.EXMARK_EQUAL:
+        elif binaryop.op.kind == TK_EXMARK_EQUAL:
             jump_kind = ByteCode.JUMP_IF_EQUAL
-        elif binaryop.op.kind == TokenKind.LESS_THAN:
+        elif binaryop.op.kind == TK_LESS_THAN:
             jump_kind = ByteCode.JUMP_IF_GREATER_THAN_EQUAL
-        elif binaryop.op.kind == TokenKind.LESS_THAN_EQUAL:
+        elif binaryop.op.kind == TK_LESS_THAN_EQUAL:
             jump_kind = ByteCode.JUMP_IF_GREATER_THAN
-        elif binaryop.op.kind == TokenKind.GREATER_THAN:
+        elif binaryop.op.kind == TK_GREATER_THAN:
             jump_kind = ByteCode.JUMP_IF_LESS_THAN_EQUAL
-        elif binaryop.op.kind == TokenKind.GREATER_THAN_EQUAL:
+        elif binaryop.op.kind == TK_GREATER_THAN_EQUAL:
             jump_kind = ByteCode.JUMP_IF_LESS_THAN
         else:
             assert False, f"\n{binaryop}"
@@ -0,0 +1,343 @@
+from blok.scopes import SymbolTable
+from blok.token import TokenKind
+from blok.trace import NO_TRACE, TraceLevel
+from blok.typechecker import EvalKind
+from blok.astnodes import (
+    ReturnStatement,
+    FuncCall,
+    Block,
+    ForLoop,
+    WhileLoop,
+    LoopControl,
+    LoopControlKind,
+    IfStatement,
+    VarDecl,
+    Literal,
+    UnaryOp,
+    BinaryOp
+)
+
+
+COMPARISON_TO_PYTHON = {
+    TokenKind.TWO_EQUAL:            "==",
+    TokenKind.EXMARK_EQUAL:         "!=",
+    TokenKind.LESS_THAN:            "<",
+    TokenKind.LESS_THAN_EQUAL:      "<=",
+    TokenKind.GREATER_THAN:         ">",
+    TokenKind.GREATER_THAN_EQUAL:   ">=",
+}
+
+ARITH_TO_PYTHON = {
+    TokenKind.PLUS:     "+",
+    TokenKind.MINUS:    "-",
+    TokenKind.STAR:     "*",
+}
+
+
+# Raised for programs the Python backend cannot translate. They are run by
+# the interpreter instead.
+class NotCompilable(Exception):
+    pass
+
+
+# Translates every FuncDecl into a Python function. A variable whose address is
+# never taken becomes a Python local named after its frame slot. Arrays and
+# variables whose address is taken stay in the memory list `mem` at bp + slot,
+# the same place the stack VM keeps them, so pointers are still indices into
+# memory and can be passed between functions.
+class CodeGenPython:
+    def __init__(self, ast, tracer=NO_TRACE):
+        self.ast = ast
+        self.tracer = tracer
+        self.localvar_idx = 0
+        self.locals = SymbolTable()
+        # Lookups go straight to the dict, see SymbolTable
+        self.localvar_to_idx = self.locals.bindings
+        self.idx_to_size = {}
+        self.in_memory = set()
+        self.loop_to_var_idx = {}
+        self.lines = []
+        self.indent = 0
+        self.func_start = 0
+        self.frame_size = 0
+        # Per function, for compiling functions one at a time
+        self.func_sources = {}
+        self.func_callees = {}
+        self.func_stores_through_pointers = {}
+        self.callees = set()
+        self.stores_through_pointers = False
+
+    def add_var(self, ident, offset=1):
+        idx = self.localvar_idx
+        self.localvar_idx += offset
+        self.locals.bind(ident, idx)
+        self.idx_to_size[idx] = offset
+        return idx
+
+    def emit(self, line):
+        self.lines.append(f"{'    ' * self.indent}{line}")
+
+    def gen_source(self):
+        for funcdecl in self.ast.funcdecls:
+            self.gen_python_funcdecl(funcdecl)
+
+        source = "\n".join(self.lines) + "\n"
+        if self.tracer.is_enabled(TraceLevel.PHASE):
+            self.tracer.emit(f"\n{'-'*10} PYTHON SOURCE {'-'*10}\n")
+            self.tracer.emit(source)
+
+        return source
+
+    # The body is generated twice. The first pass only finds out which slots
+    # have their address taken, the second one emits the code.
+    def gen_python_funcdecl(self, funcdecl):
+        self.in_memory = set()
+        self.gen_python_funcbody(funcdecl)
+        self.lines = self.lines[:self.func_start]
+        self.callees = set()
+        self.stores_through_pointers = False
+        self.gen_python_funcbody(funcdecl)
+        ident = funcdecl.ident.value
+        self.func_sources[ident] = "\n".join(self.lines[self.func_start:]) + "\n"
+        self.func_callees[ident] = self.callees
+        self.func_stores_through_pointers[ident] = self.stores_through_pointers
+
+    def gen_python_funcbody(self, funcdecl):
+        self.localvar_idx = 0
+        self.locals.clear()
+        self.idx_to_size = {}
+        self.func_start = len(self.lines)
+        # Callees get their frames right above the slots kept in memory
+        self.frame_size = max(self.in_memory, default=-1) + 1
+        params = [self.add_var(param.ident.value) for param in funcdecl.params]
+        args = "".join(f", s{idx}" for idx in params)
+        self.emit(f"def f_{funcdecl.ident.value}(mem, bp{args}):")
+        self.indent += 1
+        if self.frame_size > 0:
+            self.emit(f"if bp + {self.frame_size} > len(mem):")
+            self.emit(f"    grow(mem, bp + {self.frame_size})")
+
+        for idx in params:
+            if idx in self.in_memory:
+                self.emit(f"mem[bp + {idx}] = s{idx}")
+
+        self.gen_python_block(funcdecl.block)
+        self.indent -= 1
+        self.emit("")
+
+    def mark_in_memory(self, idx):
+        for slot in range(idx, idx + self.idx_to_size.get(idx, 1)):
+            self.in_memory.add(slot)
+
+    # Returns the Python expression reading or writing the given slot
+    def slot(self, idx):
+        if idx in self.in_memory:
+            return f"mem[bp + {idx}]"
+        return f"s{idx}"
+
+    def var_slot(self, ident):
+        return self.slot(self.localvar_to_idx[ident])
+
+    def gen_python_block(self, block):
+        self.locals.push_scope()
+        num_lines = len(self.lines)
+        for statement in block.statements:
+            if isinstance(statement, VarDecl):
+                self.gen_python_vardecl(statement)
+            elif isinstance(statement, BinaryOp):
+                self.gen_python_varassign(statement)
+            elif isinstance(statement, IfStatement):
+                self.gen_python_if_statement(statement)
+            elif isinstance(statement, WhileLoop):
+                self.gen_python_while_loop(statement)
+            elif isinstance(statement, ForLoop):
+                self.gen_python_for_loop(statement)
+            elif isinstance(statement, FuncCall):
+                self.emit(self.gen_python_funccall(statement))
+            elif isinstance(statement, ReturnStatement):
+                self.gen_python_return_statement(statement)
+            elif isinstance(statement, LoopControl):
+                self.gen_python_loopcontrol(statement)
+            else: assert False
+
+        if len(self.lines) == num_lines:
+            self.emit("pass")
+
+        self.locals.pop_scope()
+
+    def gen_python_return_statement(self, return_statement):
+        if return_statement.expr == None:
+            self.emit("return")
+        else:
+            self.emit(f"return {self.gen_python_expr(return_statement.expr)}")
+
+    def gen_python_funccall(self, funccall):
+        self.callees.add(funccall.ident.value)
+        args = "".join(f", {self.gen_python_expr(arg)}" for arg in funccall.args)
+        return f"f_{funccall.ident.value}(mem, bp + {self.frame_size}{args})"
+
+    def gen_python_for_loop(self, for_loop):
+        idx = self.add_var(for_loop.var_ident.value)
+        self.loop_to_var_idx[for_loop] = idx
+        var = self.slot(idx)
+        self.emit(f"{var} = {self.gen_python_expr(for_loop.start)}")
+        self.emit(f"while {var} <= {self.gen_python_expr(for_loop.stop)}:")
+        self.indent += 1
+        self.gen_python_block(for_loop.block)
+        self.emit(self.gen_python_step(for_loop))
+        self.indent -= 1
+
+    def gen_python_step(self, for_loop):
+        var = self.slot(self.loop_to_var_idx[for_loop])
+        return f"{var} = {var} + {self.gen_python_expr(for_loop.step)}"
+
+    def gen_python_while_loop(self, while_loop):
+        self.emit(f"while {self.gen_python_condition(while_loop.condition)}:")
+        self.indent += 1
+        self.gen_python_block(while_loop.block)
+        self.indent -= 1
+
+    def gen_python_loopcontrol(self, loopcontrol):
+        if loopcontrol.kind == LoopControlKind.BREAK:
+            self.emit("break")
+        elif loopcontrol.kind == LoopControlKind.CONTINUE:
+            # Python's continue skips the step at the end of the loop body
+            if isinstance(loopcontrol.parent_loop, ForLoop):
+                self.emit(self.gen_python_step(loopcontrol.parent_loop))
+            self.emit("continue")
+
+    def gen_python_if_statement(self, if_statement, keyword="if"):
+        self.emit(f"{keyword} {self.gen_python_condition(if_statement.condition)}:")
+        self.indent += 1
+        self.gen_python_block(if_statement.block)
+        self.indent -= 1
+        if isinstance(if_statement.else_block, IfStatement):
+            self.gen_python_if_statement(if_statement.else_block, "elif")
+        elif isinstance(if_statement.else_block, Block):
+            self.emit("else:")
+            self.indent += 1
+            self.gen_python_block(if_statement.else_block)
+            self.indent -= 1
+
+    def gen_python_condition(self, condition):
+        if not isinstance(condition, BinaryOp) or \
+           condition.op.kind not in COMPARISON_TO_PYTHON:
+            raise NotCompilable(f"condition {condition}")
+
+        lhs = self.gen_python_expr(condition.lhs)
+        rhs = self.gen_python_expr(condition.rhs)
+        return f"{lhs} {COMPARISON_TO_PYTHON[condition.op.kind]} {rhs}"
+
+    def gen_python_varassign(self, varassign):
+        rhs = self.gen_python_expr(varassign.rhs)
+        lhs = varassign.lhs
+        if isinstance(lhs, Literal):
+            target = self.var_slot(lhs.token.value)
+            if lhs.offset != None:
+                # Stores through the pointer held in the variable
+                target = f"mem[{target} + {lhs.offset}]"
+                self.stores_through_pointers = True
+        elif isinstance(lhs, UnaryOp):
+            num_derefs = 0
+            while isinstance(lhs, UnaryOp):
+                num_derefs += 1
+                lhs = lhs.expr
+
+            target = self.var_slot(lhs.token.value)
+            for _ in range(num_derefs):
+                target = f"mem[{target}]"
+            self.stores_through_pointers = True
+        elif isinstance(lhs, BinaryOp):
+            assert lhs.op.kind == TokenKind.DOT
+            target = self.slot(self.localvar_to_idx[lhs.lhs.token.value] + lhs.rhs.offset)
+        else: assert False, f"\n{varassign}"
+        self.emit(f"{target} = {rhs}")
+
+    def gen_python_vardecl(self, vardecl):
+        is_array = vardecl.stack_size > 1 and vardecl.kind.kind != TokenKind.IDENT
+        if is_array:
+            # The elements come first and the variable itself holds a pointer to them
+            self.localvar_idx += vardecl.stack_size - 1
+            idx = self.add_var(vardecl.ident.value)
+            first_elem_idx = idx - (vardecl.stack_size - 1)
+            for slot in range(first_elem_idx, idx):
+                self.in_memory.add(slot)
+
+            self.emit(f"{self.slot(idx)} = bp + {first_elem_idx}")
+        else:
+            idx = self.add_var(vardecl.ident.value, vardecl.stack_size)
+            if vardecl.expr != None:
+                self.emit(f"{self.slot(idx)} = {self.gen_python_expr(vardecl.expr)}")
+                return
+
+            # Python locals have to be bound before they are read
+            for slot in range(idx, idx + vardecl.stack_size):
+                self.emit(f"{self.slot(slot)} = 0")
+
+    def gen_python_expr(self, expr):
+        if isinstance(expr, Literal):
+            return self.gen_python_literal(expr)
+        elif isinstance(expr, FuncCall):
+            return self.gen_python_funccall(expr)
+        elif expr.eval_kind == EvalKind.INT:
+            return self.gen_python_arith_expr(expr)
+        elif expr.eval_kind == EvalKind.PTR:
+            return self.gen_python_ptr_expr(expr)
+        else: raise NotCompilable(f"expression of kind {expr.eval_kind}")
+
+    def gen_python_arith_expr(self, expr):
+        if isinstance(expr, UnaryOp):
+            return self.gen_python_arith_unaryop(expr)
+        elif isinstance(expr, BinaryOp):
+            return self.gen_python_arith_binaryop(expr)
+        else: assert False, f"\n{expr}"
+
+    def gen_python_ptr_expr(self, expr):
+        if isinstance(expr, UnaryOp):
+            return self.gen_python_ptr_unaryop(expr)
+        else: assert False
+
+    def gen_python_literal(self, literal):
+        if literal.token.kind == TokenKind.IDENT:
+            var = self.var_slot(literal.token.value)
+            if literal.offset != None:
+                return f"mem[{var} + {literal.offset}]"
+            return var
+        elif literal.token.kind == TokenKind.INT_LITERAL:
+            return str(literal.token.value)
+        else: assert False
+
+    def gen_python_arith_unaryop(self, unaryop):
+        expr = self.gen_python_expr(unaryop.expr)
+        if unaryop.op.kind == TokenKind.MINUS:
+            return f"(-{expr})"
+        elif unaryop.op.kind == TokenKind.LESS_THAN:
+            return f"mem[{expr}]"
+        else: assert False, f"\n{unaryop}"
+
+    def gen_python_arith_binaryop(self, binaryop):
+        if binaryop.op.kind == TokenKind.DOT:
+            idx = self.localvar_to_idx[binaryop.lhs.token.value]
+            return self.slot(idx + binaryop.rhs.offset)
+
+        if binaryop.op.kind not in ARITH_TO_PYTHON:
+            # The VMs have no division either
+            raise NotCompilable(f"operator {binaryop.op.kind}")
+
+        lhs = self.gen_python_expr(binaryop.lhs)
+        rhs = self.gen_python_expr(binaryop.rhs)
+        return f"({lhs} {ARITH_TO_PYTHON[binaryop.op.kind]} {rhs})"
+
+    def gen_python_ptr_unaryop(self, unaryop):
+        if isinstance(unaryop.expr, Literal):
+            idx = self.localvar_to_idx[unaryop.expr.token.value]
+            if unaryop.expr.offset != None:
+                return f"({self.slot(idx)} + {unaryop.expr.offset})"
+
+            self.mark_in_memory(idx)
+            return f"(bp + {idx})"
+        elif isinstance(unaryop.expr, BinaryOp):
+            idx = self.localvar_to_idx[unaryop.expr.lhs.token.value]
+            self.mark_in_memory(idx)
+            return f"(bp + {idx + unaryop.expr.rhs.offset})"
+        else: assert False, f"\n{unaryop}"
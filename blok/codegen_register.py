@@ -0,0 +1,438 @@
+from blok.register_code import RegisterCode
+from blok.scopes import SymbolTable
+from blok.token import TokenKind
+from blok.trace import NO_TRACE, TraceLevel
+from blok.typechecker import EvalKind
+from blok.astnodes import (
+    ReturnStatement,
+    FuncCall,
+    Block,
+    ForLoop,
+    WhileLoop,
+    LoopControl,
+    LoopControlKind,
+    IfStatement,
+    VarDecl,
+    Literal,
+    UnaryOp,
+    BinaryOp
+)
+
+
+# The jump taken when a comparison is false, as register/register and
+# register/constant instructions
+COMPARISON_TO_JUMPS = {
+    TokenKind.TWO_EQUAL:            (RegisterCode.JUMP_IF_NOT_EQUAL,
+                                     RegisterCode.JUMP_IF_NOT_EQUAL_CONST),
+    TokenKind.EXMARK_EQUAL:         (RegisterCode.JUMP_IF_EQUAL,
+                                     RegisterCode.JUMP_IF_EQUAL_CONST),
+    TokenKind.LESS_THAN:            (RegisterCode.JUMP_IF_GREATER_THAN_EQUAL,
+                                     RegisterCode.JUMP_IF_GREATER_THAN_EQUAL_CONST),
+    TokenKind.LESS_THAN_EQUAL:      (RegisterCode.JUMP_IF_GREATER_THAN,
+                                     RegisterCode.JUMP_IF_GREATER_THAN_CONST),
+    TokenKind.GREATER_THAN:         (RegisterCode.JUMP_IF_LESS_THAN_EQUAL,
+                                     RegisterCode.JUMP_IF_LESS_THAN_EQUAL_CONST),
+    TokenKind.GREATER_THAN_EQUAL:   (RegisterCode.JUMP_IF_LESS_THAN,
+                                     RegisterCode.JUMP_IF_LESS_THAN_CONST),
+}
+
+# The comparison that holds when the operands are swapped
+SWAPPED_COMPARISONS = {
+    TokenKind.TWO_EQUAL:            TokenKind.TWO_EQUAL,
+    TokenKind.EXMARK_EQUAL:         TokenKind.EXMARK_EQUAL,
+    TokenKind.LESS_THAN:            TokenKind.GREATER_THAN,
+    TokenKind.LESS_THAN_EQUAL:      TokenKind.GREATER_THAN_EQUAL,
+    TokenKind.GREATER_THAN:         TokenKind.LESS_THAN,
+    TokenKind.GREATER_THAN_EQUAL:   TokenKind.LESS_THAN_EQUAL,
+}
+
+# Register/register and register/constant instructions of the arithmetic
+# operators, and whether the operands may be swapped
+ARITH_OPS = {
+    TokenKind.PLUS:     (RegisterCode.ADD, RegisterCode.ADD_CONST, True),
+    TokenKind.MINUS:    (RegisterCode.SUB, RegisterCode.SUB_CONST, False),
+    TokenKind.STAR:     (RegisterCode.MUL, RegisterCode.MUL_CONST, True),
+    TokenKind.SLASH:    (RegisterCode.DIV, None, False),
+}
+
+
+def is_int_literal(expr):
+    return isinstance(expr, Literal) and expr.token.kind == TokenKind.INT_LITERAL
+
+
+# Generates register code from the same typed AST as CodeGenByteCode. Every
+# local gets the register of the stack slot CodeGenByteCode gives it, and
+# temporaries are allocated above the locals, one statement at a time.
+class CodeGenRegister:
+    def __init__(self, ast, tracer=NO_TRACE):
+        self.ast = ast
+        self.tracer = tracer
+        self.localvar_idx = 0
+        self.code = []
+        self.locals = SymbolTable()
+        # Lookups go straight to the dict, see SymbolTable
+        self.localvar_to_idx = self.locals.bindings
+        self.funcident_to_label = {}
+        self.label_to_idx = {}
+        self.idx_to_funcident = {}
+        self.first_temp = 0
+        self.next_temp = 0
+        self.frame_size = 0
+
+    def replace_labels_by_idx(self):
+        assembled = []
+        fixups = []
+        for code in self.code:
+            if code[0] == RegisterCode.LABEL:
+                self.label_to_idx[code[1]] = len(assembled)
+                continue
+
+            if code[0] == RegisterCode.CALL:
+                code = (code[0], self.funcident_to_label[code[1]]) + code[2:]
+
+            if len(code) > 1 and isinstance(code[1], str):
+                fixups.append(len(assembled))
+
+            assembled.append(code)
+
+        for i in fixups:
+            code = assembled[i]
+            assembled[i] = (code[0], self.label_to_idx[code[1]]) + code[2:]
+
+        self.code = assembled
+        for ident, label in self.funcident_to_label.items():
+            self.idx_to_funcident[self.label_to_idx[label]] = ident
+
+    def add_var(self, ident, offset=1):
+        idx = self.localvar_idx
+        self.localvar_idx += offset
+        self.locals.bind(ident, idx)
+        return idx
+
+    def get_new_label(self):
+        label_name = f"L{len(self.label_to_idx)}"
+        self.label_to_idx[label_name] = 0
+        return label_name
+
+    def new_temp(self, num_regs=1):
+        reg = self.next_temp
+        self.next_temp += num_regs
+        self.frame_size = max(self.frame_size, self.next_temp)
+        return reg
+
+    def gen_code(self):
+        main = next(funcdecl for funcdecl in self.ast.funcdecls
+                    if funcdecl.ident.value == "Main")
+        num_results = 0 if main.return_token.kind == TokenKind.VOID else 1
+        # The caller of Main has an empty frame at bp = 0, so Main returns
+        # its result into stack slot 0
+        self.code = [
+            (RegisterCode.CALL, "Main", 0, 0),
+            (RegisterCode.STOP, num_results)
+        ]
+
+        for funcdecl in self.ast.funcdecls:
+            self.gen_code_funcdecl(funcdecl)
+
+        self.trace_code("REGISTER CODE")
+        self.replace_labels_by_idx()
+        return self.code
+
+    def trace_code(self, title):
+        if not self.tracer.is_enabled(TraceLevel.PHASE):
+            return
+
+        self.tracer.emit(f"\n{'-'*10} {title} {'-'*10}\n")
+        for i, code in enumerate(self.code):
+            self.tracer.emit(f"{i} {code}")
+
+    def gen_code_funcdecl(self, funcdecl):
+        self.localvar_idx = 0
+        self.locals.clear()
+        self.first_temp = funcdecl.stack_size
+        self.next_temp = self.first_temp
+        self.frame_size = self.first_temp
+        start_label = self.get_new_label()
+        self.funcident_to_label[funcdecl.ident.value] = start_label
+        self.code += [(RegisterCode.LABEL, start_label)]
+        frame_idx = len(self.code)
+        self.code += [(RegisterCode.FRAME, 0)]
+
+        for param in funcdecl.params:
+            self.add_var(param.ident.value)
+
+        self.gen_code_block(funcdecl.block)
+        self.code[frame_idx] = (RegisterCode.FRAME, self.frame_size)
+
+    def gen_code_block(self, block):
+        self.locals.push_scope()
+        for statement in block.statements:
+            # Temporaries never live across statements
+            self.next_temp = self.first_temp
+            if isinstance(statement, VarDecl):
+                self.gen_code_vardecl(statement)
+            elif isinstance(statement, BinaryOp):
+                self.gen_code_varassign(statement)
+            elif isinstance(statement, IfStatement):
+                self.gen_code_if_statement(statement)
+            elif isinstance(statement, WhileLoop):
+                self.gen_code_while_loop(statement)
+            elif isinstance(statement, ForLoop):
+                self.gen_code_for_loop(statement)
+            elif isinstance(statement, FuncCall):
+                self.gen_code_funccall(statement)
+            elif isinstance(statement, ReturnStatement):
+                self.gen_code_return_statement(statement)
+            elif isinstance(statement, LoopControl):
+                self.gen_code_loopcontrol(statement)
+            else: assert False
+
+        self.locals.pop_scope()
+
+    def gen_code_return_statement(self, return_statement):
+        if return_statement.expr == None:
+            self.code += [(RegisterCode.RETURN_VOID,)]
+            return
+
+        reg = self.gen_code_expr(return_statement.expr)
+        self.code += [(RegisterCode.RETURN, reg)]
+
+    # The arguments are evaluated straight into the callee's parameter
+    # registers, which start two slots above base to leave room for the
+    # saved pc and bp
+    def gen_code_funccall(self, funccall, dst=None):
+        base = self.new_temp(2 + len(funccall.args))
+        for i, arg in enumerate(funccall.args):
+            self.gen_code_expr(arg, base + 2 + i)
+
+        if dst == None:
+            dst = base
+
+        self.code += [(RegisterCode.CALL, funccall.ident.value, base, dst)]
+        return dst
+
+    def gen_code_for_loop(self, for_loop):
+        idx = self.add_var(for_loop.var_ident.value)
+        self.gen_code_expr(for_loop.start, idx)
+        for_loop.start_label = self.get_new_label()
+        for_loop.end_label = self.get_new_label()
+        self.code += [(RegisterCode.LABEL, for_loop.start_label)]
+        self.gen_code_jump_if_false(TokenKind.LESS_THAN_EQUAL, idx, for_loop.stop,
+                                    for_loop.end_label)
+
+        for_loop.step_label = self.get_new_label()
+        self.gen_code_block(for_loop.block)
+        self.next_temp = self.first_temp
+        self.code += [(RegisterCode.LABEL, for_loop.step_label)]
+        if is_int_literal(for_loop.step):
+            self.code += [(RegisterCode.ADD_CONST, idx, idx, for_loop.step.token.value)]
+        else:
+            step = self.gen_code_expr(for_loop.step)
+            self.code += [(RegisterCode.ADD, idx, idx, step)]
+
+        self.code += [
+            (RegisterCode.JUMP, for_loop.start_label),
+            (RegisterCode.LABEL, for_loop.end_label)
+        ]
+
+    def gen_code_while_loop(self, while_loop):
+        while_loop.start_label = self.get_new_label()
+        while_loop.end_label = self.get_new_label()
+        self.code += [(RegisterCode.LABEL, while_loop.start_label)]
+        self.gen_code_condition(while_loop.condition, while_loop.end_label)
+        self.gen_code_block(while_loop.block)
+        self.code += [(RegisterCode.JUMP, while_loop.start_label)]
+        self.code += [(RegisterCode.LABEL, while_loop.end_label)]
+
+    def gen_code_loopcontrol(self, loopcontrol):
+        if loopcontrol.kind == LoopControlKind.BREAK:
+            self.code += [(RegisterCode.JUMP, loopcontrol.parent_loop.end_label)]
+        elif loopcontrol.kind == LoopControlKind.CONTINUE:
+            self.code += [(RegisterCode.JUMP, loopcontrol.parent_loop.step_label)]
+
+    def gen_code_if_statement(self, if_statement):
+        else_label = self.get_new_label()
+        self.gen_code_condition(if_statement.condition, else_label)
+        self.gen_code_block(if_statement.block)
+        is_else_block_none = if_statement.else_block == None
+        if not is_else_block_none:
+            end_label = self.get_new_label()
+            self.code += [(RegisterCode.JUMP, end_label)]
+
+        self.code += [(RegisterCode.LABEL, else_label)]
+        if isinstance(if_statement.else_block, IfStatement):
+            self.next_temp = self.first_temp
+            self.gen_code_if_statement(if_statement.else_block)
+        elif isinstance(if_statement.else_block, Block):
+            self.gen_code_block(if_statement.else_block)
+
+        if not is_else_block_none:
+            self.code += [(RegisterCode.LABEL, end_label)]
+
+    def gen_code_condition(self, condition, false_label):
+        assert isinstance(condition, BinaryOp), f"\n{condition}"
+        op_kind = condition.op.kind
+        lhs = condition.lhs
+        rhs = condition.rhs
+        if is_int_literal(lhs) and not is_int_literal(rhs):
+            lhs, rhs = rhs, lhs
+            op_kind = SWAPPED_COMPARISONS[op_kind]
+
+        self.gen_code_jump_if_false(op_kind, self.gen_code_expr(lhs), rhs, false_label)
+
+    # Jumps to false_label unless 'lhs_reg op rhs' holds
+    def gen_code_jump_if_false(self, op_kind, lhs_reg, rhs, false_label):
+        jump_code, jump_const_code = COMPARISON_TO_JUMPS[op_kind]
+        if is_int_literal(rhs):
+            self.code += [(jump_const_code, false_label, lhs_reg, rhs.token.value)]
+        else:
+            rhs_reg = self.gen_code_expr(rhs)
+            self.code += [(jump_code, false_label, lhs_reg, rhs_reg)]
+
+    def gen_code_varassign(self, varassign):
+        lhs = varassign.lhs
+        if isinstance(lhs, Literal) and lhs.offset == None:
+            self.gen_code_expr(varassign.rhs, self.localvar_to_idx[lhs.token.value])
+            return
+
+        if isinstance(lhs, BinaryOp):
+            assert lhs.op.kind == TokenKind.DOT
+            local_idx = self.localvar_to_idx[lhs.lhs.token.value]
+            self.gen_code_expr(varassign.rhs, local_idx + lhs.rhs.offset)
+            return
+
+        src = self.gen_code_expr(varassign.rhs)
+        if isinstance(lhs, Literal):
+            # Stores through the pointer held in the variable
+            ptr = self.localvar_to_idx[lhs.token.value]
+            self.code += [(RegisterCode.STORE_OFFSET, ptr, src, lhs.offset)]
+        elif isinstance(lhs, UnaryOp):
+            num_derefs = 0
+            while isinstance(lhs, UnaryOp):
+                num_derefs += 1
+                lhs = lhs.expr
+
+            ptr = self.localvar_to_idx[lhs.token.value]
+            for _ in range(num_derefs - 1):
+                reg = self.new_temp()
+                self.code += [(RegisterCode.LOAD, reg, ptr)]
+                ptr = reg
+
+            self.code += [(RegisterCode.STORE, ptr, src)]
+        else: assert False, f"\n{varassign}"
+
+    def gen_code_vardecl(self, vardecl):
+        is_array = vardecl.stack_size > 1 and vardecl.kind.kind != TokenKind.IDENT
+        if is_array:
+            # The elements come first and the variable itself holds a pointer to them
+            self.localvar_idx += vardecl.stack_size - 1
+            idx = self.add_var(vardecl.ident.value)
+            first_elem_idx = idx - (vardecl.stack_size - 1)
+            self.code += [(RegisterCode.ADDR, idx, first_elem_idx)]
+        else:
+            idx = self.add_var(vardecl.ident.value, vardecl.stack_size)
+            if vardecl.expr != None:
+                self.gen_code_expr(vardecl.expr, idx)
+
+    # Returns the register holding the value of expr. If dst is given the value
+    # ends up in dst, otherwise it may be left in the register of a local.
+    def gen_code_expr(self, expr, dst=None):
+        if isinstance(expr, Literal):
+            reg = self.gen_code_literal(expr, dst)
+        elif isinstance(expr, FuncCall):
+            reg = self.gen_code_funccall(expr, dst)
+        elif expr.eval_kind == EvalKind.INT:
+            reg = self.gen_code_arith_expr(expr, dst)
+        elif expr.eval_kind == EvalKind.PTR:
+            reg = self.gen_code_ptr_expr(expr, dst)
+        else: assert False, f"\n{expr}"
+
+        if dst != None and reg != dst:
+            self.code += [(RegisterCode.MOVE, dst, reg)]
+            return dst
+
+        return reg
+
+    def gen_code_arith_expr(self, expr, dst):
+        if isinstance(expr, UnaryOp):
+            return self.gen_code_arith_unaryop(expr, dst)
+        elif isinstance(expr, BinaryOp):
+            return self.gen_code_arith_binaryop(expr, dst)
+        else: assert False, f"\n{expr}"
+
+    def gen_code_ptr_expr(self, expr, dst):
+        if isinstance(expr, UnaryOp):
+            return self.gen_code_ptr_unaryop(expr, dst)
+        else: assert False
+
+    def gen_code_literal(self, literal, dst):
+        if literal.token.kind == TokenKind.IDENT:
+            idx = self.localvar_to_idx[literal.token.value]
+            if literal.offset == None:
+                return idx
+
+            dst = self.new_temp() if dst == None else dst
+            self.code += [(RegisterCode.LOAD_OFFSET, dst, idx, literal.offset)]
+            return dst
+        elif literal.token.kind == TokenKind.INT_LITERAL:
+            dst = self.new_temp() if dst == None else dst
+            self.code += [(RegisterCode.MOVE_CONST, dst, literal.token.value)]
+            return dst
+        else: assert False
+
+    def gen_code_arith_unaryop(self, unaryop, dst):
+        if unaryop.op.kind == TokenKind.MINUS and is_int_literal(unaryop.expr):
+            dst = self.new_temp() if dst == None else dst
+            self.code += [(RegisterCode.MOVE_CONST, dst, -unaryop.expr.token.value)]
+            return dst
+
+        src = self.gen_code_expr(unaryop.expr)
+        dst = self.new_temp() if dst == None else dst
+        if unaryop.op.kind == TokenKind.MINUS:
+            self.code += [(RegisterCode.NEG, dst, src)]
+        elif unaryop.op.kind == TokenKind.LESS_THAN:
+            self.code += [(RegisterCode.LOAD, dst, src)]
+        else: assert False, f"\n{unaryop}"
+        return dst
+
+    def gen_code_arith_binaryop(self, binaryop, dst):
+        if binaryop.op.kind == TokenKind.DOT:
+            # Struct fields are registers of their own
+            idx = self.localvar_to_idx[binaryop.lhs.token.value]
+            return idx + binaryop.rhs.offset
+
+        if binaryop.op.kind not in ARITH_OPS:
+            assert False, f"\n{binaryop}"
+
+        code, const_code, is_commutative = ARITH_OPS[binaryop.op.kind]
+        lhs = binaryop.lhs
+        rhs = binaryop.rhs
+        if is_commutative and is_int_literal(lhs) and not is_int_literal(rhs):
+            lhs, rhs = rhs, lhs
+
+        lhs_reg = self.gen_code_expr(lhs)
+        if const_code != None and is_int_literal(rhs):
+            dst = self.new_temp() if dst == None else dst
+            self.code += [(const_code, dst, lhs_reg, rhs.token.value)]
+            return dst
+
+        rhs_reg = self.gen_code_expr(rhs)
+        dst = self.new_temp() if dst == None else dst
+        self.code += [(code, dst, lhs_reg, rhs_reg)]
+        return dst
+
+    def gen_code_ptr_unaryop(self, unaryop, dst):
+        if isinstance(unaryop.expr, Literal):
+            var_idx = self.localvar_to_idx[unaryop.expr.token.value]
+            var_offset = unaryop.expr.offset
+            dst = self.new_temp() if dst == None else dst
+            if var_offset == None:
+                self.code += [(RegisterCode.ADDR, dst, var_idx)]
+            else:
+                self.code += [(RegisterCode.ADD_CONST, dst, var_idx, var_offset)]
+        elif isinstance(unaryop.expr, BinaryOp):
+            var_idx = self.localvar_to_idx[unaryop.expr.lhs.token.value]
+            dst = self.new_temp() if dst == None else dst
+            self.code += [(RegisterCode.ADDR, dst, var_idx + unaryop.expr.rhs.offset)]
+        else: assert False, f"\n{unaryop}"
+        return dst
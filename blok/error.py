@@ -1,27 +1,26 @@
-import sys
-
-
-errors = []
-
-def report_errors():
+# Each compilation collects its errors in a list of its own, which the lexer
+# holds, so compiling again never sees the errors of an earlier source.
+# Errors from modules already know their file.
+def report_errors(errors, filename="Main.blk"):
     print("Could not compile")
     for err in errors:
-        err.filename = "Main.blk"
+        if err.filename == None:
+            err.filename = filename
         print(err)
 
 
-def report_exit():
-    report_errors()
-    sys.exit()
+def add_err(errors, line, msg):
+    errors.append(CompileError(None, line, msg))
 
 
-def add_err(line, msg):
-    errors.append(CompileError(None, line, msg))
+# Stops the compilation at an error there is no carrying on from
+def fail(errors):
+    raise CompileFailed(errors)
 
 
-def add_err_exit(line, msg):
-    add_err(line, msg)
-    report_exit()
+def add_err_fail(errors, line, msg):
+    add_err(errors, line, msg)
+    fail(errors)
 
 
 class CompileError:
@@ -31,4 +30,23 @@ class CompileError:
         self.msg = msg
 
     def __str__(self):
-        return f"{self.filename}({self.line}) error: {self.msg}"
\ No newline at end of file
+        return f"{self.filename}({self.line}) error: {self.msg}"
+
+class CompileFailed(Exception):
+    def __init__(self, errors):
+        super().__init__("\n".join(str(err) for err in errors))
+        self.errors = errors
+
+
+class VMError(Exception):
+    def __init__(self, msg, call_trace):
+        super().__init__(msg)
+        self.msg = msg
+        self.call_trace = call_trace
+
+    def __str__(self):
+        result = f"runtime error: {self.msg}"
+        for line in self.call_trace:
+            result += f"\n    {line}"
+
+        return result
@@ -0,0 +1,249 @@
+import os
+import re
+from blok.astnodes import BlkProgram, FuncDecl
+from blok.blok_vm import INSTR_WIDTH
+from blok.bytecode_cache import COMPILER_VERSION, load_pickle, save_pickle_atomically
+from blok.error import CompileFailed
+from blok.lexer import Lexer
+from blok.modules import (
+    ModuleCode,
+    gen_module_code,
+    get_signature,
+    hash_bytes,
+    link
+)
+from blok.parsing import parse_blkprogram
+from blok.token import TK_IDENT, Token
+from blok.typechecker import TypeChecker
+
+
+# Recompiles only the functions of a file that changed, or that depend on a
+# function signature or struct layout that changed.
+#
+# The text is split into items, one struct or function each, at the braces
+# that close at the top level, without lexing it. An item's fingerprint is a
+# hash of its text, so moving it around does not change it. The code of a
+# function is kept in the cache with the fingerprint and with the signatures
+# of the functions it calls and the layouts of the structs it uses, and is
+# reused as long as all of them are the same. The functions that have to be
+# compiled again are type checked against the signatures and layouts of the
+# whole file and generated together, and the code of each one is then linked
+# with the cached code of the rest like a module, see blok/modules.py.
+INCREMENTAL_CACHE_SUFFIX = ".blki"
+
+BRACE_REGEX = re.compile(r"//[^\n]*|[{}]")
+COMMENT_REGEX = re.compile(r"//[^\n]*")
+
+
+# Raised for text that has to be compiled as a whole, such as text with
+# errors, which the full compile reports properly
+class NotIncremental(Exception):
+    pass
+
+
+class Item:
+    def __init__(self, key):
+        # Hash of the item's text
+        self.key = key
+        self.struct = None
+        # A function is kept as plain values, which load much faster than its
+        # AST, and is only parsed again when it has to be compiled
+        self.ident = None
+        self.return_kind = None
+        self.num_params = 0
+        self.signature = None
+        # Identifiers in the function, among them those of the functions it
+        # calls and of the structs it has variables of
+        self.dependencies = []
+        self.code_key = None
+        self.code = None
+
+
+class IncrementalBuild:
+    def __init__(self, code, func_names, num_params, num_items, recompiled):
+        self.code = code
+        self.func_names = func_names
+        # Number of parameters of Main
+        self.num_params = num_params
+        self.num_items = num_items
+        # Identifiers of the functions whose code was not in the cache
+        self.recompiled = recompiled
+
+
+def incremental_cache_path_for(filename):
+    return os.path.splitext(filename)[0] + INCREMENTAL_CACHE_SUFFIX
+
+
+# Returns the items' text, each with the blank lines and comments before it
+def split_items(text):
+    chunks = []
+    depth = 0
+    start = 0
+    for match in BRACE_REGEX.finditer(text):
+        brace = match.group()
+        if brace == "{":
+            depth += 1
+        elif brace == "}":
+            depth -= 1
+            if depth == 0:
+                chunks.append(text[start:match.end()])
+                start = match.end()
+            elif depth < 0:
+                raise NotIncremental("unbalanced braces")
+
+    if COMMENT_REGEX.sub("", text[start:]).strip() != "":
+        raise NotIncremental("text after the last item")
+
+    return chunks
+
+
+# Returns the item's struct or function
+def parse_item(item, chunk):
+    lexer = Lexer(chunk)
+    try:
+        ast = parse_blkprogram(lexer)
+    except CompileFailed:
+        raise NotIncremental("the item does not parse") from None
+
+    if len(lexer.errors) > 0 or len(ast.imports) > 0 or \
+       len(ast.structs) + len(ast.funcdecls) != 1:
+        raise NotIncremental("the item is not a single struct or function")
+
+    if len(ast.structs) > 0:
+        item.struct = ast.structs[0]
+        return item.struct
+
+    funcdecl = ast.funcdecls[0]
+    item.ident = funcdecl.ident.value
+    item.return_kind = int(funcdecl.return_token.kind)
+    item.num_params = len(funcdecl.params)
+    item.signature = get_signature(funcdecl)
+    # Taking every identifier is cheaper than finding the calls and variables
+    # in the AST, and only makes the function depend on a few more names
+    item.dependencies = sorted({value for kind, value in zip(lexer.kinds, lexer.values)
+                                if kind == TK_IDENT})
+    return funcdecl
+
+
+# A function with neither parameters nor block, enough to be called
+def make_declaration(item):
+    declaration = FuncDecl()
+    declaration.return_token = Token(item.return_kind, "", 0)
+    declaration.ident = Token(TK_IDENT, item.ident, 0)
+    return declaration
+
+
+# Cuts the code of functions compiled together into a ModuleCode per function.
+# The relocations and call sites are in the order of the code, so each
+# function takes the next of them up to its end.
+def split_functions(module_code):
+    starts = sorted((idx, ident) for ident, idx in module_code.funcident_to_idx.items())
+    ends = [idx for idx, _ in starts[1:]] + [len(module_code.code) // INSTR_WIDTH]
+    relocations = module_code.relocations
+    call_sites = module_code.call_sites
+    relocation_idx = 0
+    call_site_idx = 0
+    functions = {}
+    for (start, ident), end in zip(starts, ends):
+        code = module_code.code[start * INSTR_WIDTH:end * INSTR_WIDTH]
+        # Jumps never leave their function
+        function_relocations = []
+        while relocation_idx < len(relocations) and relocations[relocation_idx] < end:
+            idx = relocations[relocation_idx] - start
+            function_relocations.append(idx)
+            code[idx * INSTR_WIDTH + 1] -= start
+            relocation_idx += 1
+
+        function_call_sites = []
+        while call_site_idx < len(call_sites) and call_sites[call_site_idx][0] < end:
+            idx, callee = call_sites[call_site_idx]
+            function_call_sites.append((idx - start, callee))
+            call_site_idx += 1
+
+        functions[ident] = ModuleCode(code, function_relocations, function_call_sites,
+                                      {ident: 0})
+
+    return functions
+
+
+def load_item_cache(path):
+    cache = load_pickle(path)
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_item_cache(path, items):
+    try:
+        save_pickle_atomically(path, {item.key: item for item in items})
+    except OSError:
+        pass # Compiling without a cache is fine
+
+
+def compile_incremental(text, cache_path):
+    chunks = split_items(text)
+    cache = load_item_cache(cache_path)
+    items = []
+    key_to_funcdecl = {}
+    for chunk in chunks:
+        key = hash_bytes(f"{COMPILER_VERSION}\0{chunk}".encode())
+        item = cache.get(key)
+        if item == None:
+            item = Item(key)
+            key_to_funcdecl[key] = parse_item(item, chunk)
+
+        items.append(item)
+
+    # Everything a function's code can depend on, by identifier
+    dependency_keys = {}
+    interface = BlkProgram()
+    for item in items:
+        if item.struct != None:
+            ident = item.struct.ident.value
+            dependency_key = item.struct.tostr()
+            interface.structs.append(item.struct)
+        else:
+            ident = item.ident
+            dependency_key = item.signature
+
+        if ident in dependency_keys:
+            raise NotIncremental(f"'{ident}' is defined twice")
+        dependency_keys[ident] = dependency_key
+
+    if "Main" not in dependency_keys:
+        raise NotIncremental("there is no Main")
+
+    to_compile = []
+    for item, chunk in zip(items, chunks):
+        if item.ident == None:
+            continue
+
+        dependencies = "\n".join(dependency_keys[ident] for ident in item.dependencies
+                                 if ident in dependency_keys)
+        code_key = hash_bytes(item.key + dependencies.encode())
+        if item.code != None and item.code_key == code_key:
+            continue
+
+        item.code_key = code_key
+        if item.key not in key_to_funcdecl:
+            key_to_funcdecl[item.key] = parse_item(item, chunk)
+        to_compile.append(item)
+
+    if len(to_compile) > 0:
+        # The type checker only needs the return kinds of the other functions
+        for item in items:
+            if item.ident != None:
+                interface.funcdecls.append(make_declaration(item))
+
+        program = BlkProgram()
+        program.funcdecls = [key_to_funcdecl[item.key] for item in to_compile]
+        TypeChecker(program, imports=[interface])
+        functions = split_functions(gen_module_code(program))
+        for item in to_compile:
+            item.code = functions[item.ident]
+
+    if len(key_to_funcdecl) > 0 or len(cache) != len(items):
+        save_item_cache(cache_path, items)
+
+    code, func_names = link([item.code for item in items if item.ident != None])
+    main = next(item for item in items if item.ident == "Main")
+    return IncrementalBuild(code, func_names, main.num_params, len(items),
+                            [item.ident for item in to_compile])
@@ -1,32 +1,171 @@
-from blok.error import add_err, CompileError
+import codecs
+import re
+from array import array
+from blok.error import add_err
 from blok.token import Token, TokenKind
 
 
+KEYWORDS = {
+    "if":       TokenKind.IF,
+    "else":     TokenKind.ELSE,
+    "while":    TokenKind.WHILE,
+    "for":      TokenKind.FOR,
+    "step":     TokenKind.STEP,
+    "void":     TokenKind.VOID,
+    "return":   TokenKind.RETURN,
+    "break":    TokenKind.BREAK,
+    "continue": TokenKind.CONTINUE,
+    "int":      TokenKind.INT,
+    "struct":   TokenKind.STRUCT,
+    "import":   TokenKind.IMPORT,
+}
+
+PUNCTUATION = {
+    "+":  TokenKind.PLUS,             "+=": TokenKind.PLUS_EQUAL,
+    "-":  TokenKind.MINUS,            "-=": TokenKind.MINUS_EQUAL,
+    "*":  TokenKind.STAR,             "*=": TokenKind.STAR_EQUAL,
+    "/":  TokenKind.SLASH,            "/=": TokenKind.SLASH_EQUAL,
+    ".":  TokenKind.DOT,              "..": TokenKind.TWO_DOT,
+    "=":  TokenKind.EQUAL,            "==": TokenKind.TWO_EQUAL,
+    "!":  TokenKind.INVALID,          "!=": TokenKind.EXMARK_EQUAL,
+    "<":  TokenKind.LESS_THAN,        "<=": TokenKind.LESS_THAN_EQUAL,
+    ">":  TokenKind.GREATER_THAN,     ">=": TokenKind.GREATER_THAN_EQUAL,
+    "&":  TokenKind.AMPERSAND,        "&&": TokenKind.TWO_AMPERSAND,
+    "|":  TokenKind.VERT_LINE,        "||": TokenKind.TWO_VERT_LINE,
+    "{":  TokenKind.CURLY_BRAC_LEFT,  "}":  TokenKind.CURLY_BRAC_RIGHT,
+    "(":  TokenKind.ROUND_BRAC_LEFT,  ")":  TokenKind.ROUND_BRAC_RIGHT,
+    "[":  TokenKind.SQUARE_BRAC_LEFT, "]":  TokenKind.SQUARE_BRAC_RIGHT,
+    ";":  TokenKind.SEMICOLON,        ",":  TokenKind.COMMA,
+}
+
+# Every token, keyword and newline as it appears in the text. Only used on
+# text without anything SLOW_TOKEN_REGEX matches, where none of them can have
+# an error.
+TOKEN_REGEX = re.compile(r"\n|[A-Za-z][A-Za-z0-9_]*|[0-9]+|[-+*/=!<>]=|\.\.|&&|\|\||[^ ]")
+TOKEN_TABLE = {**PUNCTUATION, **KEYWORDS}
+TOKEN_KINDS = {kind.value: kind for kind in TokenKind}
+
+# Tokens that are left to the character by character reader, which handles
+# them exactly as it always has: words with non-ASCII characters, numbers with
+# a prefix, with '_' or at the end of the text, comments and invalid characters
+SLOW_WORD = r"[A-Za-z0-9_]*[^\x00-\x7f]|[0-9](?:[bx]|[0-9]*(?:_|\Z))|_"
+SLOW_CHARS = r"//|[^ \nA-Za-z0-9_+\-*/=!<>.&|{}()\[\];,\x80-\U0010ffff]"
+# Words are only matched from their start. The character by character reader
+# can stop in the middle of one, so the token it stops at is checked with
+# SLOW_TOKEN_START_REGEX.
+SLOW_TOKEN_REGEX = re.compile(rf"(?<![A-Za-z0-9_])(?:{SLOW_WORD})|{SLOW_CHARS}")
+SLOW_TOKEN_START_REGEX = re.compile(rf"{SLOW_WORD}|{SLOW_CHARS}")
+
+# Matches when the text holds the whole line of the next token plus a
+# character of the line after it, which is as far as any token reads ahead
+NEXT_LINE_REGEX = re.compile(r"[^ \n][^\n]*\n[\s\S]")
+
+# Number of characters, or bytes, a StreamLexer reads from its source at a time
+STREAM_CHUNK_SIZE = 1 << 16
+# Number of consumed tokens a StreamLexer keeps before dropping them
+STREAM_TOKEN_WINDOW = 1024
+
+
+# The tokens are kept as parallel arrays of kinds and lines and a list of
+# values, and only made into Token objects by peek_token
 class Lexer:
-    def __init__(self, text):
+    def __init__(self, text, fast=True):
         self.text = text
+        self.fast = fast
         self.char_idx = 0
         self.token_idx = 0
         self.line = 1
-        self.tokens = []
+        self.kinds = array("i")
+        self.lines = array("i")
+        self.values = []
+        self.at_end = True # Whether text holds the rest of the source
+        self.errors = [] # Of the whole compilation, the parser adds its own
+
+    def peek_kind(self, forward_amount=0):
+        try:
+            return self.kinds[self.token_idx + forward_amount]
+        except IndexError:
+            self.read_tokens_until(self.token_idx + forward_amount)
+            return self.kinds[self.token_idx + forward_amount]
+
+    # Only valid for a token peek_kind has already read
+    def peek_line(self, forward_amount=0):
+        return self.lines[self.token_idx + forward_amount]
 
     def peek_token(self, forward_amount=0):
-        num_tokens_to_read = (self.token_idx + 1 + forward_amount) - len(self.tokens)
-        for _ in range(num_tokens_to_read):
+        idx = self.token_idx + forward_amount
+        if idx >= len(self.kinds):
+            self.read_tokens_until(idx)
+
+        return Token(TOKEN_KINDS[self.kinds[idx]], self.values[idx], self.lines[idx])
+
+    def read_tokens_until(self, idx):
+        while len(self.kinds) <= idx:
+            self.read_token()
+
+    # Reads the rest of the tokens ahead of the parser and returns the number
+    # of tokens read so far
+    def read_all_tokens(self):
+        while len(self.kinds) == 0 or self.kinds[-1] != TokenKind.EOF:
             self.read_token()
 
-        return self.tokens[self.token_idx + forward_amount]
+        return len(self.kinds)
 
     def eat_next_token(self):
         self.token_idx += 1
 
     def err(self, msg):
-        add_err(self.line, msg)
+        add_err(self.errors, self.line, msg)
 
     def add_token(self, kind, value=""):
-        self.tokens.append(Token(kind, value, self.line))
+        self.kinds.append(kind)
+        self.lines.append(self.line)
+        self.values.append(value)
 
     def read_token(self):
+        if not self.fast or self.read_tokens_fast() == 0:
+            self.read_token_by_char()
+
+    # Reads all tokens up to the next one SLOW_TOKEN_REGEX matches, or up to
+    # the end of the text, with a single TOKEN_REGEX pass. Only that slow token
+    # can have errors, so they are still reported when the parser gets to it.
+    # Returns the number of tokens read.
+    def read_tokens_fast(self):
+        if SLOW_TOKEN_START_REGEX.match(self.text, self.char_idx) != None:
+            return 0
+
+        slow_token = SLOW_TOKEN_REGEX.search(self.text, self.char_idx)
+        end = len(self.text) if slow_token == None else slow_token.start()
+        kinds = self.kinds
+        lines = self.lines
+        values = self.values
+        num_tokens = len(kinds)
+        line = self.line
+        for word in TOKEN_REGEX.findall(self.text, self.char_idx, end):
+            kind = TOKEN_TABLE.get(word)
+            if kind != None:
+                kinds.append(kind)
+                values.append("")
+            elif word == "\n":
+                line += 1
+                continue
+            elif word[0] <= "9":
+                kinds.append(TokenKind.INT_LITERAL)
+                values.append(int(word))
+            else:
+                kinds.append(TokenKind.IDENT)
+                values.append(word)
+
+            lines.append(line)
+
+        self.char_idx = end
+        self.line = line
+        if slow_token == None and self.at_end:
+            self.add_token(TokenKind.EOF)
+
+        return len(kinds) - num_tokens
+
+    def read_token_by_char(self):
         while True:
             if self.char_idx == len(self.text):
                 self.add_token(TokenKind.EOF)
@@ -171,15 +310,48 @@ class Lexer:
 
             self.char_idx += 1
 
-        if   ident == "if":       self.add_token(TokenKind.IF)
-        elif ident == "else":     self.add_token(TokenKind.ELSE)
-        elif ident == "while":    self.add_token(TokenKind.WHILE)
-        elif ident == "for":      self.add_token(TokenKind.FOR)
-        elif ident == "step":     self.add_token(TokenKind.STEP)
-        elif ident == "void":     self.add_token(TokenKind.VOID)
-        elif ident == "return":   self.add_token(TokenKind.RETURN)
-        elif ident == "break":    self.add_token(TokenKind.BREAK)
-        elif ident == "continue": self.add_token(TokenKind.CONTINUE)
-        elif ident == "int":      self.add_token(TokenKind.INT)
-        elif ident == "struct":   self.add_token(TokenKind.STRUCT)
-        else:                     self.add_token(TokenKind.IDENT, ident)
\ No newline at end of file
+        kind = KEYWORDS.get(ident)
+        if kind == None:
+            self.add_token(TokenKind.IDENT, ident)
+        else:
+            self.add_token(kind)
+
+
+# Lexes a file object, opened in text or binary mode, or an mmap without
+# reading all of it. text only holds whole lines from the current position
+# up to about chunk_size characters ahead, and consumed tokens are dropped,
+# so memory does not grow with the size of the source.
+class StreamLexer(Lexer):
+    def __init__(self, source, fast=True, chunk_size=STREAM_CHUNK_SIZE):
+        super().__init__("", fast)
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.carry = "" # The start of a line that has not been read completely
+        self.at_end = False
+
+    def eat_next_token(self):
+        self.token_idx += 1
+        if self.token_idx == STREAM_TOKEN_WINDOW:
+            del self.kinds[:self.token_idx]
+            del self.lines[:self.token_idx]
+            del self.values[:self.token_idx]
+            self.token_idx = 0
+
+    def read_token(self):
+        while not self.at_end and NEXT_LINE_REGEX.search(self.text, self.char_idx) == None:
+            self.read_chunk()
+
+        super().read_token()
+
+    def read_chunk(self):
+        chunk = self.source.read(self.chunk_size)
+        self.at_end = len(chunk) == 0
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk, final=self.at_end)
+
+        pending = self.text[self.char_idx:] + self.carry + chunk
+        split = len(pending) if self.at_end else pending.rfind("\n") + 1
+        self.text = pending[:split]
+        self.carry = pending[split:]
+        self.char_idx = 0
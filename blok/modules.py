@@ -0,0 +1,353 @@
+import hashlib
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from blok.astnodes import BlkProgram, FuncDecl
+from blok.blok_vm import INSTR_WIDTH, lower_bytecode
+from blok.bytecode import ByteCode
+from blok.bytecode_cache import COMPILER_VERSION, load_pickle, save_pickle_atomically
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.error import CompileError, CompileFailed
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.token import TK_IMPORT
+from blok.typechecker import TypeChecker
+
+
+# A program can be split over several files. Each file is a module, which
+# imports others with 'import Name;' lines at its top, Name.blk being next to
+# it. A module sees the functions and structs of the modules it imports. All
+# functions share one namespace, and Main can be in any module.
+#
+# A build goes over the modules twice, each time in a pool of worker
+# processes. The first round parses every module for its interface: its
+# imports, structs and function signatures. The second type checks each
+# module against the interfaces of its imports and generates its code, leaving
+# the calls to the linker. The linker lays the modules out one after the other
+# and resolves the calls with the merged funcident_to_idx of all of them.
+#
+# Each module's interface and code are cached in a .blkm file next to it. The
+# code stays valid for as long as the module and the interfaces of its imports
+# do, so editing the body of a function only recompiles that one file.
+SOURCE_SUFFIX = ".blk"
+MODULE_CACHE_SUFFIX = ".blkm"
+
+
+def has_imports(text):
+    return Lexer(text).peek_kind() == TK_IMPORT
+
+
+class Module:
+    def __init__(self, path, text):
+        self.path = path
+        self.text = text
+        self.source_key = hash_bytes(f"{COMPILER_VERSION}\0{text}".encode())
+        self.cache = None
+        self.interface = None
+        self.interface_key = None
+        # Paths of the imported modules
+        self.imports = []
+        self.code_key = None
+        self.code = None
+
+
+# Lowered code of one module. The jump targets are relative to the start of
+# the module and the calls have 0 in place of their target.
+class ModuleCode:
+    def __init__(self, code, relocations, call_sites, funcident_to_idx):
+        self.code = code
+        # Indices of the instructions with a jump target
+        self.relocations = relocations
+        # Pairs of the index of a call and the identifier of its function
+        self.call_sites = call_sites
+        self.funcident_to_idx = funcident_to_idx
+
+
+class Build:
+    def __init__(self, code, func_names, num_params, sources, recompiled):
+        self.code = code
+        self.func_names = func_names
+        # Number of parameters of Main
+        self.num_params = num_params
+        # Text of each module
+        self.sources = sources
+        # Paths of the modules whose code was not in the cache
+        self.recompiled = recompiled
+
+
+# Runs jobs in worker processes, which are only started once there is more
+# than one job to run at a time
+class WorkerPool:
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.executor = None
+
+    def map(self, run, jobs):
+        if len(jobs) <= 1 or self.workers == 1:
+            return [run(*job) for job in jobs]
+
+        if self.executor == None:
+            self.executor = ProcessPoolExecutor(self.workers)
+
+        return list(self.executor.map(run, *zip(*jobs)))
+
+    def shutdown(self):
+        if self.executor != None:
+            self.executor.shutdown()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).digest()
+
+
+# What importers of a module see: its imports, its structs and its functions
+# without their bodies
+def make_interface(blkprogram):
+    interface = BlkProgram()
+    interface.imports = blkprogram.imports
+    interface.structs = blkprogram.structs
+    interface.funcdecls = [make_header(funcdecl) for funcdecl in blkprogram.funcdecls]
+    return interface
+
+
+# The function without its block
+def make_header(funcdecl):
+    header = FuncDecl()
+    header.return_token = funcdecl.return_token
+    header.ident = funcdecl.ident
+    header.params = funcdecl.params
+    header.line = funcdecl.line
+    return header
+
+
+# Changes whenever the code of the modules that import the interface has to
+# change with it
+def get_interface_key(interface):
+    parts = [struct.tostr() for struct in interface.structs]
+    parts += [get_signature(funcdecl) for funcdecl in interface.funcdecls]
+    return hash_bytes("\n".join(parts).encode())
+
+
+def get_signature(funcdecl):
+    params = ",".join(f"{param.kind.kind}:{param.kind.value}" for param in funcdecl.params)
+    return f"{funcdecl.return_token.kind} {funcdecl.ident.value}({params})"
+
+
+# Parses the module for the first round of a build. Returns its interface, or
+# None and the errors.
+def scan_module(path, text):
+    lexer = Lexer(text)
+    try:
+        ast = parse_blkprogram(lexer)
+    except CompileFailed:
+        pass
+
+    if len(lexer.errors) > 0:
+        return None, set_filename(lexer.errors, path)
+
+    return make_interface(ast), []
+
+
+# Compiles the module for the second round of a build, against the interfaces
+# of the modules it imports
+def compile_module(path, text, imports):
+    lexer = Lexer(text)
+    try:
+        ast = parse_blkprogram(lexer)
+        TypeChecker(ast, imports=imports)
+    except CompileFailed:
+        pass
+
+    if len(lexer.errors) > 0:
+        return None, set_filename(lexer.errors, path)
+
+    return gen_module_code(ast), []
+
+
+# The ModuleCode of a type checked AST
+def gen_module_code(ast):
+    codegen = CodeGenByteCode(ast)
+    bytecode = codegen.gen_module_bytecode()
+    call_sites = []
+    for idx in codegen.call_sites:
+        code = bytecode[idx]
+        call_sites.append((idx, code[1]))
+        bytecode[idx] = (code[0], 0, code[2])
+
+    # Packed, as it is sent back to the build and pickled into the cache
+    code = array("q", lower_bytecode(bytecode))
+    funcident_to_idx = {ident: idx for idx, ident in codegen.idx_to_funcident.items()}
+    return ModuleCode(code, codegen.relocations, call_sites, funcident_to_idx)
+
+
+def set_filename(errors, path):
+    for err in errors:
+        err.filename = path
+
+    return errors
+
+
+def cache_path_for_module(path):
+    return os.path.splitext(path)[0] + MODULE_CACHE_SUFFIX
+
+
+# Returns what the cache file holds for the module, or None if the file is
+# missing, damaged or for another version of the module
+def load_module_cache(module):
+    cache = load_pickle(cache_path_for_module(module.path))
+    if not isinstance(cache, dict) or cache.get("source_key") != module.source_key:
+        return None
+
+    return cache
+
+
+def save_module_cache(module):
+    cache = {
+        "source_key": module.source_key,
+        "interface": module.interface,
+        "code_key": module.code_key,
+        "code": module.code,
+    }
+    try:
+        save_pickle_atomically(cache_path_for_module(module.path), cache)
+    except OSError:
+        pass # Building without a cache is fine
+
+
+def read_module(path):
+    with open(path) as blkfile:
+        return Module(path, blkfile.read())
+
+
+# Finds the modules path imports, directly and through other modules, and
+# fills in their interfaces. Returns the modules by path, path's first.
+def scan_modules(path, pool, use_cache, errors):
+    modules = {path: read_module(path)}
+    pending = [path]
+    while len(pending) > 0:
+        to_scan = []
+        for module_path in pending:
+            module = modules[module_path]
+            module.cache = load_module_cache(module) if use_cache else None
+            if module.cache != None:
+                module.interface = module.cache["interface"]
+            else:
+                to_scan.append(module)
+
+        results = pool.map(scan_module, [(module.path, module.text) for module in to_scan])
+        for module, (interface, module_errors) in zip(to_scan, results):
+            module.interface = interface
+            errors += module_errors
+
+        scanned = pending
+        pending = []
+        for module_path in scanned:
+            module = modules[module_path]
+            if module.interface == None:
+                continue
+
+            module.interface_key = get_interface_key(module.interface)
+            for token in module.interface.imports:
+                import_path = os.path.join(os.path.dirname(module_path),
+                                           token.value + SOURCE_SUFFIX)
+                if import_path not in modules:
+                    try:
+                        modules[import_path] = read_module(import_path)
+                    except OSError:
+                        errors.append(CompileError(module_path, token.line,
+                                                   f"cannot find module '{token.value}'"))
+                        continue
+
+                    pending.append(import_path)
+
+                module.imports.append(import_path)
+
+    return modules
+
+
+def check_functions(modules, main_path, errors):
+    funcident_to_path = {}
+    for module in modules.values():
+        for funcdecl in module.interface.funcdecls:
+            ident = funcdecl.ident.value
+            if ident in funcident_to_path:
+                errors.append(CompileError(module.path, funcdecl.line,
+                                           f"function '{ident}' is also defined in "
+                                           f"{funcident_to_path[ident]}"))
+            else:
+                funcident_to_path[ident] = module.path
+
+    if "Main" not in funcident_to_path:
+        errors.append(CompileError(main_path, 1, "no function 'Main'"))
+
+
+def link(module_codes):
+    code = lower_bytecode([(ByteCode.CALL_PROCEDURE, 0, 0), (ByteCode.STOP,)])
+    call_sites = [(0, "Main")]
+    funcident_to_idx = {}
+    for module_code in module_codes:
+        base = len(code) // INSTR_WIDTH
+        relocated = list(module_code.code)
+        for idx in module_code.relocations:
+            relocated[idx * INSTR_WIDTH + 1] += base
+
+        code += relocated
+        call_sites += [(base + idx, ident) for idx, ident in module_code.call_sites]
+        for ident, idx in module_code.funcident_to_idx.items():
+            funcident_to_idx[ident] = base + idx
+
+    for idx, ident in call_sites:
+        code[idx * INSTR_WIDTH + 1] = funcident_to_idx[ident]
+
+    return code, {idx: ident for ident, idx in funcident_to_idx.items()}
+
+
+# Builds the program whose Main is in the module at path, or in one of the
+# modules it imports. Raises CompileFailed with the errors of all modules.
+def build(path, workers=None, use_cache=True):
+    path = os.path.normpath(path)
+    errors = []
+    pool = WorkerPool(workers)
+    try:
+        modules = scan_modules(path, pool, use_cache, errors)
+        if len(errors) > 0:
+            raise CompileFailed(errors)
+
+        check_functions(modules, path, errors)
+        if len(errors) > 0:
+            raise CompileFailed(errors)
+
+        to_compile = []
+        for module in modules.values():
+            import_keys = b"".join(modules[import_path].interface_key
+                                   for import_path in module.imports)
+            module.code_key = hash_bytes(module.source_key + import_keys)
+            if module.cache != None and module.cache["code_key"] == module.code_key:
+                module.code = module.cache["code"]
+            else:
+                to_compile.append(module)
+
+        jobs = [(module.path, module.text, [modules[import_path].interface
+                                            for import_path in module.imports])
+                for module in to_compile]
+        results = pool.map(compile_module, jobs)
+    finally:
+        pool.shutdown()
+
+    for module, (code, module_errors) in zip(to_compile, results):
+        module.code = code
+        errors += module_errors
+
+    if len(errors) > 0:
+        raise CompileFailed(errors)
+
+    if use_cache:
+        for module in to_compile:
+            save_module_cache(module)
+
+    code, func_names = link([module.code for module in modules.values()])
+    main = next(funcdecl for module in modules.values()
+                for funcdecl in module.interface.funcdecls if funcdecl.ident.value == "Main")
+    sources = [module.text for module in modules.values()]
+    return Build(code, func_names, len(main.params), sources,
+                 [module.path for module in to_compile])
@@ -1,7 +1,52 @@
 import sys
 import blok.astnodes
-from blok.error import add_err_exit, report_exit
-from blok.token import Token, TokenKind
+from blok.error import add_err_fail, fail
+from blok.token import (
+    Token,
+    TokenKind,
+    TK_EOF,
+    TK_INVALID,
+    TK_IDENT,
+    TK_INT_LITERAL,
+    TK_BREAK,
+    TK_CONTINUE,
+    TK_PLUS,
+    TK_PLUS_EQUAL,
+    TK_MINUS,
+    TK_MINUS_EQUAL,
+    TK_STAR,
+    TK_STAR_EQUAL,
+    TK_SLASH,
+    TK_SLASH_EQUAL,
+    TK_EQUAL,
+    TK_TWO_EQUAL,
+    TK_EXMARK_EQUAL,
+    TK_LESS_THAN,
+    TK_LESS_THAN_EQUAL,
+    TK_GREATER_THAN,
+    TK_GREATER_THAN_EQUAL,
+    TK_TWO_AMPERSAND,
+    TK_TWO_VERT_LINE,
+    TK_IF,
+    TK_ELSE,
+    TK_WHILE,
+    TK_FOR,
+    TK_STEP,
+    TK_DOT,
+    TK_TWO_DOT,
+    TK_RETURN,
+    TK_INT,
+    TK_VOID,
+    TK_STRUCT,
+    TK_IMPORT,
+    TK_SEMICOLON,
+    TK_COMMA,
+    TK_CURLY_BRAC_LEFT,
+    TK_CURLY_BRAC_RIGHT,
+    TK_ROUND_BRAC_LEFT,
+    TK_ROUND_BRAC_RIGHT,
+    TK_SQUARE_BRAC_LEFT
+)
 from blok.astnodes import (
     BlkProgram,
     Struct,
@@ -21,60 +66,87 @@ from blok.astnodes import (
 )
 
 
+# Binding strength of the binary operators. Anything else ends an expression.
+PRECEDENCE = {
+    TK_DOT:                60,
+    TK_STAR:               50,
+    TK_SLASH:              50,
+    TK_PLUS:               40,
+    TK_MINUS:              40,
+    TK_LESS_THAN:          30,
+    TK_LESS_THAN_EQUAL:    30,
+    TK_GREATER_THAN:       30,
+    TK_GREATER_THAN_EQUAL: 30,
+    TK_TWO_EQUAL:          20,
+    TK_EXMARK_EQUAL:       20,
+    TK_TWO_AMPERSAND:      10,
+    TK_TWO_VERT_LINE:      10,
+}
+# Prefix operators bind tighter than every binary operator but '.', so '>v.x'
+# takes the address of the member and '-a * b' negates a
+UNARY_PRECEDENCE = 55
+# An open parenthesis on the operator stack, which nothing reduces past
+GROUP_PRECEDENCE = -2
+
+
 def get_precedence(op_kind):
-    if op_kind == TokenKind.DOT:                return 60
-    if op_kind == TokenKind.STAR or \
-       op_kind == TokenKind.SLASH:              return 50
-    if op_kind == TokenKind.PLUS or \
-       op_kind == TokenKind.MINUS:              return 40
-    if op_kind == TokenKind.LESS_THAN or \
-       op_kind == TokenKind.LESS_THAN_EQUAL or \
-       op_kind == TokenKind.GREATER_THAN or \
-       op_kind == TokenKind.GREATER_THAN_EQUAL: return 30
-    if op_kind == TokenKind.TWO_EQUAL or \
-       op_kind == TokenKind.EXMARK_EQUAL:       return 20
-    if op_kind == TokenKind.TWO_AMPERSAND or \
-       op_kind == TokenKind.TWO_VERT_LINE:      return 10
-    return -1
+    return PRECEDENCE.get(op_kind, -1)
 
 
 def expect(lexer, kind):
-    token = lexer.peek_token()
-    if not token.kind == kind:
-        if token.kind == TokenKind.INVALID:
-            report_exit()
+    if lexer.peek_kind() != kind:
+        token = lexer.peek_token()
+        if token.kind == TK_INVALID:
+            fail(lexer.errors)
         else:
-            add_err_exit(token.line, f"expected '{kind}' but got '{token.kind}'")
+            add_err_fail(lexer.errors, token.line, f"expected '{TokenKind(kind)}' but got '{token.kind}'")
 
     lexer.eat_next_token()
-    return token
 
 
 def parse_blkprogram(lexer):
     blkprogram = BlkProgram()
-    peek = lexer.peek_token()
-    while peek.kind != TokenKind.EOF:
-        if peek.kind == TokenKind.STRUCT:
+    blkprogram.imports = parse_imports(lexer)
+    peek = lexer.peek_kind()
+    while peek != TK_EOF:
+        if peek == TK_STRUCT:
             blkprogram.structs.append(parse_struct(lexer))
-        elif peek.kind == TokenKind.VOID or peek == TokenKind.INT:
+        elif peek == TK_VOID or peek == TK_INT:
             blkprogram.funcdecls.append(parse_funcdecl(lexer))
-        elif peek.kind == TokenKind.INVALID:
-            report_exit()
+        elif peek == TK_INVALID:
+            fail(lexer.errors)
         else:
-            add_err_exit(peek.line, f"invalid statement in global scope '{peek.value}'")
+            token = lexer.peek_token()
+            add_err_fail(lexer.errors, token.line, f"invalid statement in global scope '{token.value}'")
 
-        peek = lexer.peek_token()
+        peek = lexer.peek_kind()
 
     return blkprogram
 
 
+# Imports come before anything else in a file, so the modules a file needs can
+# be found without parsing the rest of it
+def parse_imports(lexer):
+    imports = []
+    while lexer.peek_kind() == TK_IMPORT:
+        lexer.eat_next_token()
+        if lexer.peek_kind() != TK_IDENT:
+            expect(lexer, TK_IDENT)
+
+        imports.append(lexer.peek_token())
+        lexer.eat_next_token()
+        expect(lexer, TK_SEMICOLON)
+
+    return imports
+
+
 def parse_struct(lexer):
     struct = Struct()
     lexer.eat_next_token()
     struct.ident = lexer.peek_token()
     lexer.eat_next_token()
     lexer.eat_next_token() # {
-    while lexer.peek_token().kind != TokenKind.CURLY_BRAC_RIGHT:
+    while lexer.peek_kind() != TK_CURLY_BRAC_RIGHT:
         struct.vardecls.append(parse_vardecl(lexer))
 
     for vardecl in struct.vardecls:
@@ -87,7 +159,7 @@ def parse_struct(lexer):
 def parse_return_statement(lexer):
     return_statement = ReturnStatement()
     lexer.eat_next_token()
-    if lexer.peek_token().kind != TokenKind.SEMICOLON:
+    if lexer.peek_kind() != TK_SEMICOLON:
         return_statement.expr = parse_expr(lexer)
 
     lexer.eat_next_token() # ;
@@ -99,8 +171,8 @@ def parse_funccall(lexer):
     funccall.ident = lexer.peek_token()
     lexer.eat_next_token()
     lexer.eat_next_token() # (
-    while lexer.peek_token().kind != TokenKind.ROUND_BRAC_RIGHT:
-        if lexer.peek_token().kind == TokenKind.COMMA and len(funccall.args) > 0:
+    while lexer.peek_kind() != TK_ROUND_BRAC_RIGHT:
+        if lexer.peek_kind() == TK_COMMA and len(funccall.args) > 0:
             lexer.eat_next_token()
 
         funccall.args.append(parse_expr(lexer))
@@ -112,17 +184,18 @@ def parse_funccall(lexer):
 def parse_funcdecl(lexer):
     funcdecl = FuncDecl()
     funcdecl.return_token = lexer.peek_token()
+    funcdecl.line = funcdecl.return_token.line
     lexer.eat_next_token()
     funcdecl.ident = lexer.peek_token()
     lexer.eat_next_token()
-    expect(lexer, TokenKind.ROUND_BRAC_LEFT)
-    while lexer.peek_token().kind != TokenKind.ROUND_BRAC_RIGHT:
-        if lexer.peek_token().kind == TokenKind.COMMA and len(funcdecl.params) > 0:
+    expect(lexer, TK_ROUND_BRAC_LEFT)
+    while lexer.peek_kind() != TK_ROUND_BRAC_RIGHT:
+        if lexer.peek_kind() == TK_COMMA and len(funcdecl.params) > 0:
             lexer.eat_next_token()
 
         funcdecl.params.append(parse_vardecl(lexer, False, False))
 
-    expect(lexer, TokenKind.ROUND_BRAC_RIGHT)
+    expect(lexer, TK_ROUND_BRAC_RIGHT)
     funcdecl.block = parse_block(lexer, funcdecl)
     return funcdecl
 
@@ -130,55 +203,60 @@ def parse_funcdecl(lexer):
 def parse_block(lexer, parent):
     block = Block()
     block.parent = parent
-    expect(lexer, TokenKind.CURLY_BRAC_LEFT)
-    while lexer.peek_token().kind != TokenKind.CURLY_BRAC_RIGHT:
-        peek = lexer.peek_token()
-        if peek.kind == TokenKind.IDENT:
-            peek1 = lexer.peek_token(1)
-            if peek1.kind == TokenKind.ROUND_BRAC_LEFT:
+    expect(lexer, TK_CURLY_BRAC_LEFT)
+    while lexer.peek_kind() != TK_CURLY_BRAC_RIGHT:
+        peek = lexer.peek_kind()
+        line = lexer.peek_line()
+        if peek == TK_IDENT:
+            peek1 = lexer.peek_kind(1)
+            if peek1 == TK_ROUND_BRAC_LEFT:
                 block.statements.append(parse_funccall(lexer))
                 lexer.eat_next_token() # ;
-            elif peek1.kind == TokenKind.EQUAL or \
-                 peek1.kind == TokenKind.PLUS_EQUAL or \
-                 peek1.kind == TokenKind.MINUS_EQUAL or \
-                 peek1.kind == TokenKind.STAR_EQUAL or \
-                 peek1.kind == TokenKind.SLASH_EQUAL or \
-                 peek1.kind == TokenKind.SQUARE_BRAC_LEFT or \
-                 peek1.kind == TokenKind.DOT:
+            elif peek1 == TK_EQUAL or \
+                 peek1 == TK_PLUS_EQUAL or \
+                 peek1 == TK_MINUS_EQUAL or \
+                 peek1 == TK_STAR_EQUAL or \
+                 peek1 == TK_SLASH_EQUAL or \
+                 peek1 == TK_SQUARE_BRAC_LEFT or \
+                 peek1 == TK_DOT:
                 block.statements.append(parse_varassign(lexer))
             else: # It is a struct-variable
                 block.statements.append(parse_vardecl(lexer))
-        elif peek.kind == TokenKind.LESS_THAN:
+        elif peek == TK_LESS_THAN:
             block.statements.append(parse_varassign(lexer))
-        elif peek.kind == TokenKind.INT:
+        elif peek == TK_INT:
             block.statements.append(parse_vardecl(lexer))
-        elif peek.kind == TokenKind.IF:
+        elif peek == TK_IF:
             block.statements.append(parse_if_statement(lexer, block))
-        elif peek.kind == TokenKind.WHILE:
+        elif peek == TK_WHILE:
             block.statements.append(parse_while_loop(lexer))
-        elif peek.kind == TokenKind.FOR:
+        elif peek == TK_FOR:
             block.statements.append(parse_for_loop(lexer))
-        elif peek.kind == TokenKind.RETURN:
+        elif peek == TK_RETURN:
             block.statements.append(parse_return_statement(lexer))
-        elif peek.kind == TokenKind.BREAK or \
-             peek.kind == TokenKind.CONTINUE:
+        elif peek == TK_BREAK or \
+             peek == TK_CONTINUE:
             block.statements.append(parse_loopcontrol(lexer, block))
-        else: add_err_exit(peek.line, f"invalid statement starting with '{peek.kind}'")
+        else:
+            token = lexer.peek_token()
+            add_err_fail(lexer.errors, token.line, f"invalid statement starting with '{token.kind}'")
+
+        block.statements[-1].line = line
 
-    expect(lexer, TokenKind.CURLY_BRAC_RIGHT)
+    expect(lexer, TK_CURLY_BRAC_RIGHT)
     return block
 
 
 def parse_for_loop(lexer):
     for_loop = ForLoop()
-    expect(lexer, TokenKind.FOR)
+    expect(lexer, TK_FOR)
     for_loop.var_ident = lexer.peek_token()
     lexer.eat_next_token()
-    expect(lexer, TokenKind.EQUAL)
+    expect(lexer, TK_EQUAL)
     for_loop.start = parse_expr(lexer)
-    expect(lexer, TokenKind.TWO_DOT)
+    expect(lexer, TK_TWO_DOT)
     for_loop.stop = parse_expr(lexer)
-    expect(lexer, TokenKind.STEP)
+    expect(lexer, TK_STEP)
     for_loop.step = parse_expr(lexer)
     for_loop.block = parse_block(lexer, for_loop)
     return for_loop
@@ -186,7 +264,7 @@ def parse_for_loop(lexer):
 
 def parse_while_loop(lexer):
     while_loop = WhileLoop()
-    expect(lexer, TokenKind.WHILE)
+    expect(lexer, TK_WHILE)
     while_loop.condition = parse_expr(lexer)
     while_loop.block = parse_block(lexer, while_loop)
     return while_loop
@@ -195,13 +273,13 @@ def parse_while_loop(lexer):
 def parse_loopcontrol(lexer, parent):
     loopcontrol = LoopControl()
     loopcontrol.parent = parent
-    if lexer.peek_token().kind == TokenKind.BREAK:
+    if lexer.peek_kind() == TK_BREAK:
         loopcontrol.kind = LoopControlKind.BREAK
     else:
         loopcontrol.kind = LoopControlKind.CONTINUE
 
     lexer.eat_next_token()
-    expect(lexer, TokenKind.SEMICOLON)
+    expect(lexer, TK_SEMICOLON)
     loopcontrol.parent_loop = parent
     while True:
         if isinstance(loopcontrol.parent_loop, ForLoop) or \
@@ -216,18 +294,20 @@ def parse_loopcontrol(lexer, parent):
 def parse_if_statement(lexer, parent):
     if_statement = IfStatement()
     if_statement.parent = parent
-    expect(lexer, TokenKind.IF)
+    expect(lexer, TK_IF)
     if_statement.condition = parse_expr(lexer)
     if_statement.block = parse_block(lexer, if_statement)
-    if lexer.peek_token().kind == TokenKind.ELSE:
+    if lexer.peek_kind() == TK_ELSE:
         lexer.eat_next_token()
-        if lexer.peek_token().kind == TokenKind.CURLY_BRAC_LEFT:
+        if lexer.peek_kind() == TK_CURLY_BRAC_LEFT:
             # TODO: if_statement.block and if_statement.else_block are not the same block
             #       but the block will be assigned the same parent
             #       this might cause a problem with loopcontrol
             if_statement.else_block = parse_block(lexer, if_statement)
-        elif lexer.peek_token().kind == TokenKind.IF:
+        elif lexer.peek_kind() == TK_IF:
+            line = lexer.peek_line()
             if_statement.else_block = parse_if_statement(lexer, if_statement)
+            if_statement.else_block.line = line
         else: assert False
 
     return if_statement
@@ -239,7 +319,7 @@ def parse_varassign(lexer):
     varassign.op = lexer.peek_token()
     lexer.eat_next_token()
     varassign.rhs = parse_expr(lexer)
-    expect(lexer, TokenKind.SEMICOLON)
+    expect(lexer, TK_SEMICOLON)
     return varassign
 
 
@@ -247,24 +327,25 @@ def parse_vardecl(lexer, has_expr=True, eat_semicolon=True):
     vardecl = VarDecl()
     vardecl.kind = lexer.peek_token()
     lexer.eat_next_token()
-    if lexer.peek_token().kind == TokenKind.GREATER_THAN:
-        while lexer.peek_token().kind == TokenKind.GREATER_THAN:
+    if lexer.peek_kind() == TK_GREATER_THAN:
+        while lexer.peek_kind() == TK_GREATER_THAN:
             vardecl.ptr_depth += 1
             lexer.eat_next_token()
-    elif lexer.peek_token().kind == TokenKind.SQUARE_BRAC_LEFT:
+    elif lexer.peek_kind() == TK_SQUARE_BRAC_LEFT:
         lexer.eat_next_token() # [
         vardecl.stack_size = int(lexer.peek_token().value) + 1
         lexer.eat_next_token()
         lexer.eat_next_token() # ]
 
-    vardecl.ident = expect(lexer, TokenKind.IDENT)
-    if lexer.peek_token().kind == TokenKind.SEMICOLON or not has_expr:
+    vardecl.ident = lexer.peek_token()
+    expect(lexer, TK_IDENT)
+    if lexer.peek_kind() == TK_SEMICOLON or not has_expr:
         if eat_semicolon:
             lexer.eat_next_token() # ;
 
         return vardecl
 
-    expect(lexer, TokenKind.EQUAL)
+    expect(lexer, TK_EQUAL)
     vardecl.expr = parse_expr(lexer)
     if eat_semicolon:
         lexer.eat_next_token() # ;
@@ -272,61 +353,66 @@ def parse_vardecl(lexer, has_expr=True, eat_semicolon=True):
     return vardecl
 
 
-# TODO: expression '1*2-3+4' results in -5 and not 3
-def parse_expr(lexer, min_precedence=0):
-    lhs = parse_literal(lexer)
+# Precedence climbing with an explicit stack of the operators still waiting
+# for their right operand, so operator chains and nested parentheses of any
+# depth take no recursion. Operators of equal precedence are left-associative.
+def parse_expr(lexer):
+    pending = []
     while True:
-        token_kind = lexer.peek_token().kind
-        precedence = get_precedence(token_kind)
-        if precedence < min_precedence:
-            break
-
-        binaryop = BinaryOp()
-        binaryop.op = lexer.peek_token()
-        lexer.eat_next_token()
-        binaryop.rhs = parse_expr(lexer, precedence)
-        binaryop.lhs = lhs
-        lhs = binaryop
+        kind = lexer.peek_kind()
+        while kind == TK_PLUS or \
+              kind == TK_MINUS or \
+              kind == TK_LESS_THAN or \
+              kind == TK_GREATER_THAN or \
+              kind == TK_ROUND_BRAC_LEFT:
+            if kind == TK_ROUND_BRAC_LEFT:
+                pending.append((GROUP_PRECEDENCE, None))
+            else:
+                unaryop = UnaryOp()
+                unaryop.op = lexer.peek_token()
+                pending.append((UNARY_PRECEDENCE, unaryop))
 
-    return lhs
+            lexer.eat_next_token()
+            kind = lexer.peek_kind()
+
+        lhs = parse_literal(lexer)
+        while True:
+            kind = lexer.peek_kind()
+            precedence = PRECEDENCE.get(kind, -1)
+            while len(pending) > 0 and pending[-1][0] >= precedence:
+                op = pending.pop()[1]
+                if isinstance(op, UnaryOp):
+                    op.expr = lhs
+                else:
+                    op.rhs = lhs
+                lhs = op
+
+            if precedence > 0:
+                binaryop = BinaryOp()
+                binaryop.op = lexer.peek_token()
+                binaryop.lhs = lhs
+                lexer.eat_next_token()
+                pending.append((precedence, binaryop))
+                break
+
+            if len(pending) == 0:
+                return lhs
+
+            # Only an open parenthesis is left on top
+            expect(lexer, TK_ROUND_BRAC_RIGHT)
+            pending.pop()
 
 
 def parse_literal(lexer):
     token = lexer.peek_token()
-    if token.kind == TokenKind.PLUS or \
-       token.kind == TokenKind.MINUS or \
-       token.kind == TokenKind.LESS_THAN:
-        lexer.eat_next_token()
-        unaryop = UnaryOp()
-        unaryop.op = token
-        unaryop.expr = parse_literal(lexer)
-        return unaryop
-
-    if token.kind == TokenKind.GREATER_THAN:
-        lexer.eat_next_token()
-        unaryop = UnaryOp()
-        unaryop.op = token
-        if lexer.peek_token(1).kind == TokenKind.DOT:
-            unaryop.expr = parse_expr(lexer)
-        else:
-            unaryop.expr = parse_literal(lexer)
-
-        return unaryop
-
-    if token.kind == TokenKind.ROUND_BRAC_LEFT:
-        lexer.eat_next_token() # (
-        expr = parse_expr(lexer)
-        lexer.eat_next_token() # )
-        return expr
-
-    if lexer.peek_token(1).kind == TokenKind.ROUND_BRAC_LEFT:
+    if lexer.peek_kind(1) == TK_ROUND_BRAC_LEFT:
         return parse_funccall(lexer)
 
-    if token.kind == TokenKind.INT_LITERAL:
+    if token.kind == TK_INT_LITERAL:
         literal = Literal()
         literal.token = token
         lexer.eat_next_token()
-        if lexer.peek_token().kind == TokenKind.SQUARE_BRAC_LEFT:
+        if lexer.peek_kind() == TK_SQUARE_BRAC_LEFT:
             lexer.eat_next_token() # [
             literal.offset = int(lexer.peek_token().value)
             lexer.eat_next_token()
@@ -334,11 +420,11 @@ def parse_literal(lexer):
 
         return literal
 
-    if token.kind == TokenKind.IDENT:
+    if token.kind == TK_IDENT:
         literal = Literal()
         literal.token = token
         lexer.eat_next_token()
-        if lexer.peek_token().kind == TokenKind.SQUARE_BRAC_LEFT:
+        if lexer.peek_kind() == TK_SQUARE_BRAC_LEFT:
             lexer.eat_next_token() # [
             literal.offset = int(lexer.peek_token().value)
             lexer.eat_next_token()
@@ -346,4 +432,4 @@ def parse_literal(lexer):
 
         return literal
 
-    add_err_exit(token.line, f"unexpected literal '{token.kind}'")
+    add_err_fail(lexer.errors, token.line, f"unexpected literal '{token.kind}'")
@@ -0,0 +1,420 @@
+from blok.bytecode import ByteCode
+
+
+JUMP_CODES = {
+    ByteCode.JUMP,
+    ByteCode.JUMP_IF_EQUAL,
+    ByteCode.JUMP_IF_NOT_EQUAL,
+    ByteCode.JUMP_IF_LESS_THAN,
+    ByteCode.JUMP_IF_LESS_THAN_EQUAL,
+    ByteCode.JUMP_IF_GREATER_THAN,
+    ByteCode.JUMP_IF_GREATER_THAN_EQUAL,
+}
+
+# Pseudo-instructions, which are dropped when the labels are resolved
+MARKER_CODES = {
+    ByteCode.LABEL,
+    ByteCode.LINE,
+}
+
+# Control never falls through these, so everything up to the next label that
+# is jumped to can be removed
+TERMINATOR_CODES = {
+    ByteCode.JUMP,
+    ByteCode.RETURN,
+    ByteCode.STOP,
+}
+
+# Instructions that push exactly one value without popping anything
+PUSH_CODES = {
+    ByteCode.PUSH_CONST,
+    ByteCode.LOAD_BASE_POINTER,
+    ByteCode.LOAD_LOCAL,
+    ByteCode.LOAD_LOCAL_OFFSET,
+}
+
+INVERTED_JUMPS = {
+    ByteCode.JUMP_IF_EQUAL:                 ByteCode.JUMP_IF_NOT_EQUAL,
+    ByteCode.JUMP_IF_NOT_EQUAL:             ByteCode.JUMP_IF_EQUAL,
+    ByteCode.JUMP_IF_LESS_THAN:             ByteCode.JUMP_IF_GREATER_THAN_EQUAL,
+    ByteCode.JUMP_IF_GREATER_THAN_EQUAL:    ByteCode.JUMP_IF_LESS_THAN,
+    ByteCode.JUMP_IF_LESS_THAN_EQUAL:       ByteCode.JUMP_IF_GREATER_THAN,
+    ByteCode.JUMP_IF_GREATER_THAN:          ByteCode.JUMP_IF_LESS_THAN_EQUAL,
+}
+
+FOLDABLE_BINARYOPS = {
+    ByteCode.BINARYOP_ADD: lambda lhs, rhs: lhs + rhs,
+    ByteCode.BINARYOP_SUB: lambda lhs, rhs: lhs - rhs,
+    ByteCode.BINARYOP_MUL: lambda lhs, rhs: lhs * rhs,
+}
+
+
+class PeepholeRule:
+    def __init__(self, name, size, last_codes, rewrite):
+        self.name = name
+        self.size = size
+        self.last_codes = last_codes
+        self.rewrite = rewrite
+
+
+# Local rules look at the last `size` instructions emitted so far and return
+# the instructions to replace them with, or None if the rule does not apply.
+# `last_codes` lists the instructions a matching window can end with, so only
+# a few rules have to be tried after each instruction. Rules are tried in the
+# order they are registered.
+PEEPHOLE_RULES = []
+
+# Rules that fuse instructions into superinstructions. They come after the
+# other rules so constants are folded before they are fused.
+SUPERINSTRUCTION_RULES = []
+
+
+def peephole_rule(name, size, last_codes, registry=PEEPHOLE_RULES):
+    def register(rewrite):
+        registry.append(PeepholeRule(name, size, last_codes, rewrite))
+        return rewrite
+
+    return register
+
+
+def is_push_const(code, value=None):
+    return code[0] == ByteCode.PUSH_CONST and (value == None or code[1] == value)
+
+
+# Returns the frame slot if the instructions compute the address bp + slot
+def local_slot(window):
+    if len(window) == 1 and window[0][0] == ByteCode.LOAD_BASE_POINTER:
+        return 0
+    if len(window) == 3 and \
+       window[0][0] == ByteCode.LOAD_BASE_POINTER and \
+       is_push_const(window[1]) and \
+       window[2][0] == ByteCode.BINARYOP_ADD:
+        return window[1][1]
+    return None
+
+
+@peephole_rule("add_zero", 2, {ByteCode.BINARYOP_ADD})
+def rewrite_add_zero(window):
+    if is_push_const(window[0], 0):
+        return []
+    return None
+
+
+@peephole_rule("zero_add", 3, {ByteCode.BINARYOP_ADD})
+def rewrite_zero_add(window):
+    if is_push_const(window[0], 0) and window[1][0] in PUSH_CODES:
+        return [window[1]]
+    return None
+
+
+@peephole_rule("incr_stack_by_zero", 1, {ByteCode.INCR_STACK_BY_CONST})
+def rewrite_incr_stack_by_zero(window):
+    if window[0][1] == 0:
+        return []
+    return None
+
+
+@peephole_rule("fold_binaryop", 3, set(FOLDABLE_BINARYOPS))
+def rewrite_fold_binaryop(window):
+    if is_push_const(window[0]) and is_push_const(window[1]):
+        value = FOLDABLE_BINARYOPS[window[2][0]](window[0][1], window[1][1])
+        return [(ByteCode.PUSH_CONST, value)]
+    return None
+
+
+@peephole_rule("fold_neg", 2, {ByteCode.UNARYOP_NEG})
+def rewrite_fold_neg(window):
+    if is_push_const(window[0]):
+        return [(ByteCode.PUSH_CONST, -window[0][1])]
+    return None
+
+
+# x + a + b becomes x + (a + b), which folds the offsets of struct fields and
+# array elements into the offset of the variable
+@peephole_rule("fold_add_chain", 4, {ByteCode.BINARYOP_ADD})
+def rewrite_fold_add_chain(window):
+    if is_push_const(window[0]) and \
+       window[1][0] == ByteCode.BINARYOP_ADD and \
+       is_push_const(window[2]):
+        return [(ByteCode.PUSH_CONST, window[0][1] + window[2][1]), window[1]]
+    return None
+
+
+# Loading a local and storing it straight back into the same slot does nothing
+def rewrite_self_assign(window, addr_size):
+    load_slot = local_slot(window[:addr_size])
+    store_slot = local_slot(window[addr_size + 1:-1])
+    if load_slot != None and load_slot == store_slot and \
+       window[addr_size][0] == ByteCode.LOAD_VALUE_AT_IDX:
+        return []
+    return None
+
+
+@peephole_rule("self_assign", 4, {ByteCode.STORE_VALUE_AT_IDX})
+def rewrite_self_assign_first_slot(window):
+    return rewrite_self_assign(window, 1)
+
+
+@peephole_rule("self_assign", 8, {ByteCode.STORE_VALUE_AT_IDX})
+def rewrite_self_assign_any_slot(window):
+    return rewrite_self_assign(window, 3)
+
+
+@peephole_rule("add_const", 2, {ByteCode.BINARYOP_ADD}, SUPERINSTRUCTION_RULES)
+def rewrite_add_const(window):
+    if is_push_const(window[0]):
+        return [(ByteCode.ADD_CONST, window[0][1])]
+    return None
+
+
+@peephole_rule("add_const_commute", 3, {ByteCode.BINARYOP_ADD}, SUPERINSTRUCTION_RULES)
+def rewrite_add_const_commute(window):
+    if is_push_const(window[0]) and window[1][0] in PUSH_CODES:
+        return [window[1], (ByteCode.ADD_CONST, window[0][1])]
+    return None
+
+
+@peephole_rule("fold_add_const", 2, {ByteCode.ADD_CONST}, SUPERINSTRUCTION_RULES)
+def rewrite_fold_add_const(window):
+    if window[0][0] == ByteCode.ADD_CONST:
+        return [(ByteCode.ADD_CONST, window[0][1] + window[1][1])]
+    if is_push_const(window[0]):
+        return [(ByteCode.PUSH_CONST, window[0][1] + window[1][1])]
+    return None
+
+
+@peephole_rule("add_const_zero", 1, {ByteCode.ADD_CONST}, SUPERINSTRUCTION_RULES)
+def rewrite_add_const_zero(window):
+    if window[0][1] == 0:
+        return []
+    return None
+
+
+# Returns the frame slot if the instructions compute the address bp + slot
+# once ADD_CONST has been fused
+def fused_local_slot(window):
+    if len(window) == 1 and window[0][0] == ByteCode.LOAD_BASE_POINTER:
+        return 0
+    if len(window) == 2 and \
+       window[0][0] == ByteCode.LOAD_BASE_POINTER and \
+       window[1][0] == ByteCode.ADD_CONST:
+        return window[1][1]
+    return None
+
+
+def rewrite_local_access(window, fused_code):
+    slot = fused_local_slot(window[:-1])
+    if slot != None:
+        return [(fused_code, slot)]
+    return None
+
+
+@peephole_rule("load_local", 2, {ByteCode.LOAD_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_load_local_first_slot(window):
+    return rewrite_local_access(window, ByteCode.LOAD_LOCAL)
+
+
+@peephole_rule("load_local", 3, {ByteCode.LOAD_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_load_local_any_slot(window):
+    return rewrite_local_access(window, ByteCode.LOAD_LOCAL)
+
+
+@peephole_rule("store_local", 2, {ByteCode.STORE_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_store_local_first_slot(window):
+    return rewrite_local_access(window, ByteCode.STORE_LOCAL)
+
+
+@peephole_rule("store_local", 3, {ByteCode.STORE_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_store_local_any_slot(window):
+    return rewrite_local_access(window, ByteCode.STORE_LOCAL)
+
+
+# Dereferencing a pointer held in a local, such as '<p' or a field of a struct
+# pointed to by a parameter
+@peephole_rule("load_local_offset", 2, {ByteCode.LOAD_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_load_local_offset(window):
+    if window[0][0] == ByteCode.LOAD_LOCAL:
+        return [(ByteCode.LOAD_LOCAL_OFFSET, window[0][1], 0)]
+    return None
+
+
+@peephole_rule("load_local_offset", 3, {ByteCode.LOAD_VALUE_AT_IDX}, SUPERINSTRUCTION_RULES)
+def rewrite_load_local_offset_add(window):
+    if window[0][0] == ByteCode.LOAD_LOCAL and window[1][0] == ByteCode.ADD_CONST:
+        return [(ByteCode.LOAD_LOCAL_OFFSET, window[0][1], window[1][1])]
+    return None
+
+
+@peephole_rule("self_assign", 2, {ByteCode.STORE_LOCAL}, SUPERINSTRUCTION_RULES)
+def rewrite_self_assign_local(window):
+    if window[0] == (ByteCode.LOAD_LOCAL, window[1][1]):
+        return []
+    return None
+
+
+class PeepholeOptimizer:
+    def __init__(self, pinned_labels=(), rules=PEEPHOLE_RULES):
+        # Labels that are referenced from outside the bytecode, such as the
+        # entry labels of procedures, are never removed
+        self.pinned_labels = set(pinned_labels)
+        self.rules_by_last_code = {}
+        for rule in rules:
+            for code in rule.last_codes:
+                self.rules_by_last_code.setdefault(code, []).append(rule)
+
+        self.stats = {}
+        for name in [rule.name for rule in rules] + [
+            "thread_jump",
+            "invert_branch",
+            "jump_to_next",
+            "unreachable_code",
+            "unused_label",
+        ]:
+            self.stats[name] = [0, 0] # hits, instructions removed
+
+    def record(self, name, num_removed):
+        self.stats[name][0] += 1
+        self.stats[name][1] += num_removed
+
+    def optimize(self, bytecode):
+        while True:
+            num_hits = sum(hits for hits, _ in self.stats.values())
+            bytecode = self.apply_local_rules(bytecode)
+            bytecode = self.thread_jumps(bytecode)
+            bytecode = self.invert_branches(bytecode)
+            bytecode = self.remove_jumps_to_next(bytecode)
+            bytecode = self.remove_unused_labels(bytecode)
+            bytecode = self.remove_unreachable_code(bytecode)
+            if sum(hits for hits, _ in self.stats.values()) == num_hits:
+                return bytecode
+
+    def apply_local_rules(self, bytecode):
+        optimized = []
+        for code in bytecode:
+            optimized.append(code)
+            self.rewrite_tail(optimized)
+
+        return optimized
+
+    def rewrite_tail(self, optimized):
+        while len(optimized) > 0:
+            for rule in self.rules_by_last_code.get(optimized[-1][0], ()):
+                if len(optimized) < rule.size:
+                    continue
+
+                replacement = rule.rewrite(optimized[-rule.size:])
+                if replacement != None:
+                    del optimized[-rule.size:]
+                    optimized += replacement
+                    self.record(rule.name, rule.size - len(replacement))
+                    break
+            else:
+                return
+
+    def label_positions(self, bytecode):
+        positions = {}
+        for i, code in enumerate(bytecode):
+            if code[0] == ByteCode.LABEL:
+                positions[code[1]] = i
+
+        return positions
+
+    # Returns the first real instruction at or after idx
+    def next_instr(self, bytecode, idx):
+        while idx < len(bytecode) and bytecode[idx][0] in MARKER_CODES:
+            idx += 1
+
+        return bytecode[idx] if idx < len(bytecode) else None
+
+    def thread_jumps(self, bytecode):
+        positions = self.label_positions(bytecode)
+        threaded = []
+        for code in bytecode:
+            if code[0] in JUMP_CODES:
+                target = code[1]
+                visited = {target}
+                while True:
+                    next_code = self.next_instr(bytecode, positions[target])
+                    if next_code == None or next_code[0] != ByteCode.JUMP or \
+                       next_code[1] in visited:
+                        break
+
+                    target = next_code[1]
+                    visited.add(target)
+
+                if target != code[1]:
+                    code = (code[0], target)
+                    self.record("thread_jump", 0)
+
+            threaded.append(code)
+
+        return threaded
+
+    # Turns 'JUMP_IF_X L1; JUMP L2; LABEL L1' into 'JUMP_IF_NOT_X L2; LABEL L1',
+    # which is how break and continue inside an if end up
+    def invert_branches(self, bytecode):
+        result = []
+        i = 0
+        while i < len(bytecode):
+            code = bytecode[i]
+            if code[0] in INVERTED_JUMPS and i + 2 < len(bytecode) and \
+               bytecode[i + 1][0] == ByteCode.JUMP and \
+               bytecode[i + 2] == (ByteCode.LABEL, code[1]):
+                result.append((INVERTED_JUMPS[code[0]], bytecode[i + 1][1]))
+                self.record("invert_branch", 1)
+                i += 2
+                continue
+
+            result.append(code)
+            i += 1
+
+        return result
+
+    def remove_jumps_to_next(self, bytecode):
+        result = []
+        for i, code in enumerate(bytecode):
+            if code[0] == ByteCode.JUMP:
+                idx = i + 1
+                while idx < len(bytecode) and bytecode[idx][0] in MARKER_CODES and \
+                      bytecode[idx] != (ByteCode.LABEL, code[1]):
+                    idx += 1
+
+                if idx < len(bytecode) and bytecode[idx] == (ByteCode.LABEL, code[1]):
+                    self.record("jump_to_next", 1)
+                    continue
+
+            result.append(code)
+
+        return result
+
+    def remove_unused_labels(self, bytecode):
+        used_labels = set(self.pinned_labels)
+        for code in bytecode:
+            if code[0] in JUMP_CODES:
+                used_labels.add(code[1])
+
+        result = []
+        for code in bytecode:
+            if code[0] == ByteCode.LABEL and code[1] not in used_labels:
+                self.record("unused_label", 0)
+                continue
+
+            result.append(code)
+
+        return result
+
+    def remove_unreachable_code(self, bytecode):
+        result = []
+        is_reachable = True
+        for code in bytecode:
+            if code[0] == ByteCode.LABEL:
+                is_reachable = True
+            elif not is_reachable:
+                self.record("unreachable_code", 1)
+                continue
+
+            result.append(code)
+            if code[0] in TERMINATOR_CODES:
+                is_reachable = False
+
+        return result
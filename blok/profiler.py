@@ -0,0 +1,168 @@
+from blok.blok_vm import OPCODE_TO_NAME, OPCODES_WITH_ARG, OP_CALL_PROCEDURE, OP_LOAD_LOCAL_OFFSET
+
+
+# Stands for the instructions before the first function, which call Main
+TOP_LEVEL = "[top]"
+NUM_HOT_SPOTS = 10
+
+
+# Where the time of a run of interp_profiled went. The counts and times are
+# kept per instruction and only added up per function, line and opcode when a
+# report is made. Times are in nanoseconds.
+class Profile:
+    def __init__(self, idx_to_line=None):
+        # Source lines from CodeGenByteCode.idx_to_line, which it fills in
+        # when made with line_info
+        self.idx_to_line = idx_to_line if idx_to_line != None else {}
+        self.ops = []
+        self.args1 = []
+        self.args2 = []
+        self.func_idents = []
+        self.lines = []
+        self.counts = []
+        self.times = []
+        # Number of times each pair of opcodes ran one after the other
+        self.pair_counts = {}
+        # Time spent in each call stack, written as the functions on it
+        # separated by ';'
+        self.stack_times = {}
+
+    # Called by interp_profiled before it runs the code. Returns the function
+    # each instruction belongs to.
+    def start(self, ops, args1, args2, func_names):
+        self.ops = ops
+        self.args1 = args1
+        self.args2 = args2
+        self.func_idents = spread(func_names if func_names != None else {}, len(ops), TOP_LEVEL)
+        self.lines = spread(self.idx_to_line, len(ops), None)
+        self.counts = [0] * len(ops)
+        self.times = [0] * len(ops)
+        self.pair_counts = {}
+        self.stack_times = {self.func_idents[0]: 0}
+        return self.func_idents
+
+    def total_time(self):
+        return sum(self.times)
+
+    # Rows of function, calls, instructions executed, time spent in its own
+    # instructions and time including its callees
+    def function_rows(self):
+        rows = {}
+        for pc, ident in enumerate(self.func_idents):
+            row = rows.setdefault(ident, [ident, 0, 0, 0, 0])
+            row[2] += self.counts[pc]
+            row[3] += self.times[pc]
+            if self.ops[pc] == OP_CALL_PROCEDURE:
+                callee = self.func_idents[self.args1[pc]]
+                rows.setdefault(callee, [callee, 0, 0, 0, 0])[1] += self.counts[pc]
+
+        for call_stack, time in self.stack_times.items():
+            # A recursive function counts once per stack
+            for ident in set(call_stack.split(";")):
+                rows[ident][4] += time
+
+        return sorted(rows.values(), key=lambda row: row[3], reverse=True)
+
+    # Rows of line, function, instructions executed and time
+    def line_rows(self):
+        rows = {}
+        for pc, line in enumerate(self.lines):
+            if line == None:
+                continue
+
+            row = rows.setdefault(line, [line, self.func_idents[pc], 0, 0])
+            row[2] += self.counts[pc]
+            row[3] += self.times[pc]
+
+        return sorted(rows.values(), key=lambda row: row[3], reverse=True)
+
+    # Rows of opcode name, instructions executed and time
+    def opcode_rows(self):
+        rows = {}
+        for pc, op in enumerate(self.ops):
+            row = rows.setdefault(op, [OPCODE_TO_NAME[op], 0, 0])
+            row[1] += self.counts[pc]
+            row[2] += self.times[pc]
+
+        return sorted(rows.values(), key=lambda row: row[2], reverse=True)
+
+    # Rows of offset, instruction, function, line, instructions executed and time
+    def offset_rows(self):
+        rows = []
+        for pc, op in enumerate(self.ops):
+            if self.counts[pc] == 0:
+                continue
+
+            instr = OPCODE_TO_NAME[op]
+            if op in OPCODES_WITH_ARG:
+                instr += f" {self.args1[pc]}"
+            if op == OP_LOAD_LOCAL_OFFSET:
+                instr += f" {self.args2[pc]}"
+
+            rows.append([pc, instr, self.func_idents[pc], self.lines[pc],
+                         self.counts[pc], self.times[pc]])
+
+        return sorted(rows, key=lambda row: row[5], reverse=True)
+
+    # Rows of the two opcode names and how often they ran one after the other
+    def pair_rows(self):
+        rows = [[OPCODE_TO_NAME[first], OPCODE_TO_NAME[second], count]
+                for (first, second), count in self.pair_counts.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    # Returns the hot spots as lines of text. With the source, the text of the
+    # hottest lines is shown next to them.
+    def format_report(self, source=None, limit=NUM_HOT_SPOTS):
+        source_lines = source.splitlines() if source != None else []
+        total_time = max(self.total_time(), 1)
+        num_instrs = max(sum(self.counts), 1)
+        def percent(time):
+            return f"{time / total_time * 100:.1f}%"
+
+        report = [f"{sum(self.counts)} instructions in {total_time / 1e6:.1f}ms of profiled time", ""]
+        report.append(f"{'function':<24}{'calls':>10}{'instrs':>12}{'self':>8}{'total':>8}")
+        for ident, calls, count, time, cumulative_time in self.function_rows()[:limit]:
+            report.append(f"{ident:<24}{calls:>10}{count:>12}{percent(time):>8}"
+                          f"{percent(cumulative_time):>8}")
+
+        report += ["", f"{'line':>6}  {'function':<24}{'instrs':>12}{'time':>8}  source"]
+        for line, ident, count, time in self.line_rows()[:limit]:
+            text = source_lines[line - 1].strip() if line <= len(source_lines) else ""
+            report.append(f"{line:>6}  {ident:<24}{count:>12}{percent(time):>8}  {text}")
+
+        report += ["", f"{'opcode':<28}{'instrs':>12}{'share':>8}{'time':>8}{'ns/instr':>10}"]
+        for name, count, time in self.opcode_rows()[:limit]:
+            share = f"{count / num_instrs * 100:.1f}%"
+            per_instr = time / count if count > 0 else 0
+            report.append(f"{name:<28}{count:>12}{share:>8}{percent(time):>8}{per_instr:>10.0f}")
+
+        report += ["", f"{'offset':>6}  {'instruction':<30}{'function':<24}{'line':>6}"
+                       f"{'instrs':>12}{'time':>8}"]
+        for pc, instr, ident, line, count, time in self.offset_rows()[:limit]:
+            line = "" if line == None else line
+            report.append(f"{pc:>6}  {instr:<30}{ident:<24}{line:>6}{count:>12}{percent(time):>8}")
+
+        report += ["", f"{'opcode pair':<56}{'instrs':>12}"]
+        for first, second, count in self.pair_rows()[:limit]:
+            report.append(f"{first + ' ' + second:<56}{count:>12}")
+
+        return report
+
+    # Writes one line per call stack with the nanoseconds spent in it, the
+    # collapsed-stack format flamegraph.pl, speedscope and friends read
+    def write_collapsed(self, file):
+        for call_stack, time in sorted(self.stack_times.items()):
+            if time > 0:
+                file.write(f"{call_stack} {time}\n")
+
+
+# Returns a list with the value of the closest index at or before each index,
+# or default before the first one
+def spread(idx_to_value, length, default):
+    values = []
+    value = default
+    for idx in range(length):
+        value = idx_to_value.get(idx, value)
+        values.append(value)
+
+    return values
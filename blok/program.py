@@ -0,0 +1,86 @@
+from blok.blok_vm import Execution, interp_lowered, lower_bytecode
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.error import CompileFailed, add_err_fail, fail
+from blok.lexer import Lexer
+from blok.modules import build
+from blok.parsing import parse_blkprogram
+from blok.trace import NO_TRACE
+from blok.typechecker import TypeChecker
+from blok.vm_stack import DEFAULT_MAX_STACK_SIZE, DEFAULT_STACK_SIZE, StackConfig
+
+
+# Library entry point for running Blok in a long-lived process: compile once,
+# then run the Program as often as needed. All state of a compilation lives
+# in its lexer and code generator, and all state of a run in its stack, so
+# neither leaves anything behind for the next one.
+#
+# Raises CompileFailed with the errors, their filename set, if source does
+# not compile
+def compile(source, filename="Main.blk", tracer=NO_TRACE):
+    lexer = Lexer(source)
+    try:
+        ast = parse_blkprogram(lexer)
+        if len(lexer.errors) > 0:
+            fail(lexer.errors)
+
+        if len(ast.imports) > 0:
+            add_err_fail(lexer.errors, ast.imports[0].line,
+                         "imports are only found when compiling a file, see compile_file")
+
+        main = None
+        for funcdecl in ast.funcdecls:
+            if funcdecl.ident.value == "Main":
+                main = funcdecl
+
+        if main == None:
+            add_err_fail(lexer.errors, 1, "no function 'Main'")
+
+        TypeChecker(ast, tracer)
+        if len(lexer.errors) > 0:
+            fail(lexer.errors)
+    except CompileFailed as err:
+        for compile_error in err.errors:
+            compile_error.filename = filename
+        raise CompileFailed(err.errors) from None
+
+    codegen = CodeGenByteCode(ast, tracer)
+    code = lower_bytecode(codegen.gen_bytecode())
+    return Program(code, codegen.idx_to_funcident, len(main.params))
+
+
+# Like compile, for the program in the file at path and the modules it
+# imports, see blok/modules.py. Modules are compiled by up to workers processes.
+def compile_file(path, workers=None, use_cache=True):
+    built = build(path, workers, use_cache)
+    return Program(built.code, built.func_names, built.num_params)
+
+
+class Program:
+    def __init__(self, code, func_names, num_params):
+        self.code = code
+        self.func_names = func_names
+        self.num_params = num_params
+
+    # Calls Main with args and returns the VMResult. A fresh stack is made for
+    # every run, so a Program can be run any number of times. Raises VMError
+    # if the run goes over max_instrs instructions or max_seconds seconds.
+    def run(self, args=(), stack_size=DEFAULT_STACK_SIZE, max_stack_size=DEFAULT_MAX_STACK_SIZE,
+            stack_backing="list", tracer=NO_TRACE, max_instrs=None, max_seconds=None):
+        self.check_args(args)
+        stack_config = StackConfig(stack_size, max_stack_size, stack_backing)
+        return interp_lowered(self.code, tracer, stack_config, self.func_names, args, max_instrs,
+                              max_seconds)
+
+    # Like run, but returns the Execution before it executes anything, to be
+    # run a slice at a time with run_lowered or next to others with
+    # run_round_robin, see blok/scheduler.py
+    def start(self, args=(), stack_size=DEFAULT_STACK_SIZE,
+              max_stack_size=DEFAULT_MAX_STACK_SIZE, stack_backing="list", max_instrs=None,
+              max_seconds=None):
+        self.check_args(args)
+        stack_config = StackConfig(stack_size, max_stack_size, stack_backing)
+        return Execution(self.code, stack_config, self.func_names, args, max_instrs, max_seconds)
+
+    def check_args(self, args):
+        if len(args) != self.num_params:
+            raise TypeError(f"Main takes {self.num_params} arguments but {len(args)} were given")
@@ -0,0 +1,47 @@
+import sys
+from blok.blok_vm import VMResult
+from blok.error import VMError
+from blok.trace import NO_TRACE
+from blok.vm_stack import DEFAULT_STACK_CONFIG, STACK_GROWTH_FACTOR
+
+
+# Every Blok call is a Python call, so deep Blok recursion needs a higher
+# limit than Python's default. Programs that still hit it are run by the
+# interpreter instead.
+PYTHON_RECURSION_LIMIT = 100000
+
+
+def make_grow(stack_config):
+    # Extends the memory in place, since every frame holds a reference to it
+    def grow(mem, min_size):
+        if min_size > stack_config.max_size:
+            raise VMError("stack overflow", [])
+
+        new_size = max(min_size, min(len(mem) * STACK_GROWTH_FACTOR, stack_config.max_size))
+        mem.extend([0] * (new_size - len(mem)))
+
+    return grow
+
+
+def load_python_program(source, stack_config=DEFAULT_STACK_CONFIG):
+    namespace = {"grow": make_grow(stack_config)}
+    exec(compile(source, "<blok>", "exec"), namespace)
+    return namespace["f_Main"]
+
+
+# Runs source generated by CodeGenPython. Memory is always a list, whatever
+# backing the stack config asks for. Nothing is dispatched, so no instruction
+# count is reported.
+def interp_python(source, tracer=NO_TRACE, stack_config=DEFAULT_STACK_CONFIG, func_names=None):
+    main = load_python_program(source, stack_config)
+    mem = [0] * stack_config.size
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, PYTHON_RECURSION_LIMIT))
+    try:
+        result = main(mem, 0)
+    except IndexError:
+        raise VMError("stack access out of bounds", []) from None
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    return VMResult([] if result == None else [result], None)
@@ -0,0 +1,49 @@
+from enum import Enum
+
+
+# Three-address instructions over the registers of the current frame. Register
+# r is the stack slot bp + r, so locals, struct fields and array elements live
+# in registers and pointers into the frame stay plain stack indices. Operands
+# named k are constants and L is an instruction index.
+class RegisterCode(Enum):
+    STOP                                =  0 # STOP num_results
+    FRAME                               =  1 # FRAME num_registers, starts every procedure
+    LABEL                               =  2
+    MOVE                                =  3 # MOVE d a
+    MOVE_CONST                          =  4 # MOVE_CONST d k
+    ADDR                                =  5 # ADDR d k: d = bp + k
+    NEG                                 =  6 # NEG d a
+    ADD                                 =  7 # ADD d a b
+    ADD_CONST                           =  8 # ADD_CONST d a k
+    SUB                                 =  9
+    SUB_CONST                           = 10
+    MUL                                 = 11
+    MUL_CONST                           = 12
+    DIV                                 = 13
+    LOAD                                = 14 # LOAD d a: d = *a
+    LOAD_OFFSET                         = 15 # LOAD_OFFSET d a k: d = *(a + k)
+    STORE                               = 16 # STORE a b: *a = b
+    STORE_OFFSET                        = 17 # STORE_OFFSET a b k: *(a + k) = b
+    JUMP                                = 18 # JUMP L
+    JUMP_IF_EQUAL                       = 19 # JUMP_IF_EQUAL L a b
+    JUMP_IF_NOT_EQUAL                   = 20
+    JUMP_IF_LESS_THAN                   = 21
+    JUMP_IF_LESS_THAN_EQUAL             = 22
+    JUMP_IF_GREATER_THAN                = 23
+    JUMP_IF_GREATER_THAN_EQUAL          = 24
+    JUMP_IF_EQUAL_CONST                 = 25 # JUMP_IF_EQUAL_CONST L a k
+    JUMP_IF_NOT_EQUAL_CONST             = 26
+    JUMP_IF_LESS_THAN_CONST             = 27
+    JUMP_IF_LESS_THAN_EQUAL_CONST       = 28
+    JUMP_IF_GREATER_THAN_CONST          = 29
+    JUMP_IF_GREATER_THAN_EQUAL_CONST    = 30
+    CALL                                = 31 # CALL L base d, arguments start at base + 2
+    RETURN                              = 32 # RETURN a
+    RETURN_VOID                         = 33
+
+
+    def __repr__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name
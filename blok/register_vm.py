@@ -0,0 +1,202 @@
+from blok.blok_vm import VMResult, grow_stack_or_overflow, make_call_trace
+from blok.error import VMError
+from blok.register_code import RegisterCode
+from blok.trace import NO_TRACE, TraceLevel
+from blok.vm_stack import DEFAULT_STACK_CONFIG, make_stack, stack_values
+
+
+OP_STOP                             = RegisterCode.STOP.value
+OP_FRAME                            = RegisterCode.FRAME.value
+OP_MOVE                             = RegisterCode.MOVE.value
+OP_MOVE_CONST                       = RegisterCode.MOVE_CONST.value
+OP_ADDR                             = RegisterCode.ADDR.value
+OP_NEG                              = RegisterCode.NEG.value
+OP_ADD                              = RegisterCode.ADD.value
+OP_ADD_CONST                        = RegisterCode.ADD_CONST.value
+OP_SUB                              = RegisterCode.SUB.value
+OP_SUB_CONST                        = RegisterCode.SUB_CONST.value
+OP_MUL                              = RegisterCode.MUL.value
+OP_MUL_CONST                        = RegisterCode.MUL_CONST.value
+OP_LOAD                             = RegisterCode.LOAD.value
+OP_LOAD_OFFSET                      = RegisterCode.LOAD_OFFSET.value
+OP_STORE                            = RegisterCode.STORE.value
+OP_STORE_OFFSET                     = RegisterCode.STORE_OFFSET.value
+OP_JUMP                             = RegisterCode.JUMP.value
+OP_JUMP_IF_EQUAL                    = RegisterCode.JUMP_IF_EQUAL.value
+OP_JUMP_IF_NOT_EQUAL                = RegisterCode.JUMP_IF_NOT_EQUAL.value
+OP_JUMP_IF_LESS_THAN                = RegisterCode.JUMP_IF_LESS_THAN.value
+OP_JUMP_IF_LESS_THAN_EQUAL          = RegisterCode.JUMP_IF_LESS_THAN_EQUAL.value
+OP_JUMP_IF_GREATER_THAN             = RegisterCode.JUMP_IF_GREATER_THAN.value
+OP_JUMP_IF_GREATER_THAN_EQUAL       = RegisterCode.JUMP_IF_GREATER_THAN_EQUAL.value
+OP_JUMP_IF_EQUAL_CONST              = RegisterCode.JUMP_IF_EQUAL_CONST.value
+OP_JUMP_IF_NOT_EQUAL_CONST          = RegisterCode.JUMP_IF_NOT_EQUAL_CONST.value
+OP_JUMP_IF_LESS_THAN_CONST          = RegisterCode.JUMP_IF_LESS_THAN_CONST.value
+OP_JUMP_IF_LESS_THAN_EQUAL_CONST    = RegisterCode.JUMP_IF_LESS_THAN_EQUAL_CONST.value
+OP_JUMP_IF_GREATER_THAN_CONST       = RegisterCode.JUMP_IF_GREATER_THAN_CONST.value
+OP_JUMP_IF_GREATER_THAN_EQUAL_CONST = RegisterCode.JUMP_IF_GREATER_THAN_EQUAL_CONST.value
+OP_CALL                             = RegisterCode.CALL.value
+OP_RETURN                           = RegisterCode.RETURN.value
+OP_RETURN_VOID                      = RegisterCode.RETURN_VOID.value
+
+# Every lowered register instruction is an opcode followed by three operands
+REGISTER_INSTR_WIDTH = 4
+
+
+def lower_register_code(code):
+    lowered = []
+    for instr in code:
+        lowered.append(instr[0].value)
+        for i in range(1, REGISTER_INSTR_WIDTH):
+            lowered.append(instr[i] if len(instr) > i else 0)
+
+    return lowered
+
+
+def split_register_code(code):
+    return [list(code[i::REGISTER_INSTR_WIDTH]) for i in range(REGISTER_INSTR_WIDTH)]
+
+
+# Runs lowered register code. Call frames have the same layout as in the stack
+# VM: the saved pc and bp sit right below the callee's registers, so overflow
+# checks and call traces work the same way.
+def interp_register(code, tracer=NO_TRACE, stack_config=DEFAULT_STACK_CONFIG, func_names=None):
+    ops, a, b, c = split_register_code(code)
+    # Procedures start with FRAME, which gives the number of registers the
+    # frame needs. CALL checks it and jumps past it.
+    frame_sizes = [a[pc] if op == OP_FRAME else 0 for pc, op in enumerate(ops)]
+    trace_calls = tracer.is_enabled(TraceLevel.CALL)
+    if tracer.is_enabled(TraceLevel.INSTR):
+        tracer.emit("the register VM only traces calls and returns")
+
+    pc = 0 # program counter
+    bp = 0 # base pointer
+    stack = make_stack(stack_config.backing, stack_config.size)
+    num_instrs = 0
+    call_depth = 0
+    # The branches are ordered by how often the opcodes are executed
+    try:
+        while True:
+            op = ops[pc]
+            num_instrs += 1
+            if op == OP_ADD_CONST:
+                stack[bp + a[pc]] = stack[bp + b[pc]] + c[pc]
+            elif op == OP_ADD:
+                stack[bp + a[pc]] = stack[bp + b[pc]] + stack[bp + c[pc]]
+            elif op == OP_JUMP:
+                pc = a[pc]
+                continue
+            elif op == OP_JUMP_IF_GREATER_THAN_CONST:
+                if stack[bp + b[pc]] > c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_GREATER_THAN:
+                if stack[bp + b[pc]] > stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_LOAD:
+                stack[bp + a[pc]] = stack[stack[bp + b[pc]]]
+            elif op == OP_STORE:
+                stack[stack[bp + a[pc]]] = stack[bp + b[pc]]
+            elif op == OP_MOVE:
+                stack[bp + a[pc]] = stack[bp + b[pc]]
+            elif op == OP_MOVE_CONST:
+                stack[bp + a[pc]] = b[pc]
+            elif op == OP_SUB_CONST:
+                stack[bp + a[pc]] = stack[bp + b[pc]] - c[pc]
+            elif op == OP_SUB:
+                stack[bp + a[pc]] = stack[bp + b[pc]] - stack[bp + c[pc]]
+            elif op == OP_MUL:
+                stack[bp + a[pc]] = stack[bp + b[pc]] * stack[bp + c[pc]]
+            elif op == OP_MUL_CONST:
+                stack[bp + a[pc]] = stack[bp + b[pc]] * c[pc]
+            elif op == OP_JUMP_IF_LESS_THAN_CONST:
+                if stack[bp + b[pc]] < c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_GREATER_THAN_EQUAL_CONST:
+                if stack[bp + b[pc]] >= c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_LESS_THAN_EQUAL_CONST:
+                if stack[bp + b[pc]] <= c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_EQUAL_CONST:
+                if stack[bp + b[pc]] == c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_NOT_EQUAL_CONST:
+                if stack[bp + b[pc]] != c[pc]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_LESS_THAN:
+                if stack[bp + b[pc]] < stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_GREATER_THAN_EQUAL:
+                if stack[bp + b[pc]] >= stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_LESS_THAN_EQUAL:
+                if stack[bp + b[pc]] <= stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_EQUAL:
+                if stack[bp + b[pc]] == stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_JUMP_IF_NOT_EQUAL:
+                if stack[bp + b[pc]] != stack[bp + c[pc]]:
+                    pc = a[pc]
+                    continue
+            elif op == OP_CALL:
+                target = a[pc]
+                new_bp = bp + b[pc] + 2
+                min_size = new_bp + frame_sizes[target]
+                if min_size > len(stack):
+                    stack = grow_stack_or_overflow(stack, stack_config, min_size,
+                                                   target, pc, bp, func_names)
+
+                if trace_calls:
+                    tracer.emit(f"{'  ' * call_depth}call {target} from {pc}")
+                    call_depth += 1
+
+                stack[new_bp - 2] = pc
+                stack[new_bp - 1] = bp
+                bp = new_bp
+                pc = target + 1
+                continue
+            elif op == OP_RETURN:
+                value = stack[bp + a[pc]]
+                new_pc = stack[bp - 2]
+                bp = stack[bp - 1]
+                # The register to return into is the last operand of the CALL
+                stack[bp + c[new_pc]] = value
+                if trace_calls:
+                    call_depth -= 1
+                    tracer.emit(f"{'  ' * call_depth}return to {new_pc} value={value}")
+
+                pc = new_pc
+            elif op == OP_RETURN_VOID:
+                pc = stack[bp - 2]
+                bp = stack[bp - 1]
+                if trace_calls:
+                    call_depth -= 1
+                    tracer.emit(f"{'  ' * call_depth}return to {pc}")
+            elif op == OP_ADDR:
+                stack[bp + a[pc]] = bp + b[pc]
+            elif op == OP_LOAD_OFFSET:
+                stack[bp + a[pc]] = stack[stack[bp + b[pc]] + c[pc]]
+            elif op == OP_STORE_OFFSET:
+                stack[stack[bp + a[pc]] + c[pc]] = stack[bp + b[pc]]
+            elif op == OP_NEG:
+                stack[bp + a[pc]] = -stack[bp + b[pc]]
+            elif op == OP_STOP:
+                return VMResult(stack_values(stack, a[pc]), num_instrs)
+            else:
+                assert False, op
+
+            pc += 1
+    except IndexError:
+        raise VMError("stack access out of bounds",
+                      make_call_trace(stack, pc, bp, func_names)) from None
@@ -0,0 +1,34 @@
+from collections import deque
+from blok.blok_vm import run_lowered
+from blok.error import VMError
+
+
+# Instructions a run executes before it is the next one's turn. Smaller
+# slices share the time more evenly, larger ones switch between runs less.
+DEFAULT_SLICE_INSTRS = 10_000
+
+
+# Runs the executions, see Execution in blok/blok_vm.py, in one process by
+# taking turns: each runs for a slice of about slice_instrs instructions and
+# then waits for all others that have not stopped yet to run theirs. A run
+# that never stops only slows the others down, and is stopped by its own
+# max_instrs or max_seconds, which only counts the time of its own slices.
+# Returns the VMResult or the VMError of each execution, in the order of
+# executions.
+def run_round_robin(executions, slice_instrs=DEFAULT_SLICE_INSTRS):
+    outcomes = [None] * len(executions)
+    ready = deque(range(len(executions)))
+    while len(ready) > 0:
+        idx = ready.popleft()
+        try:
+            result = run_lowered(executions[idx], slice_instrs)
+        except VMError as err:
+            outcomes[idx] = err
+            continue
+
+        if result == None:
+            ready.append(idx)
+        else:
+            outcomes[idx] = result
+
+    return outcomes
@@ -0,0 +1,54 @@
+# Marks an undo log entry for a name that was not bound before
+UNBOUND = object()
+
+
+# Maps names to whatever a compiler phase keeps for them, with nested block
+# scopes. Instead of copying the map on every block entry, bind() logs the
+# binding it shadows and pop_scope() undoes the bindings made since the
+# matching push_scope(). Entering a block is O(1) and leaving it is O(1) per
+# binding made inside it, so a function costs O(number of bindings) no matter
+# how many locals are in scope or how deeply its blocks are nested.
+#
+# `bindings` is a plain dict that is only ever changed in place, so hot code
+# can look names up in it directly.
+class SymbolTable:
+    def __init__(self):
+        self.bindings = {}
+        self.undo_log = []
+        self.scope_starts = []
+
+    def bind(self, ident, value):
+        self.undo_log.append((ident, self.bindings.get(ident, UNBOUND)))
+        self.bindings[ident] = value
+
+    def push_scope(self):
+        self.scope_starts.append(len(self.undo_log))
+
+    def pop_scope(self):
+        start = self.scope_starts.pop()
+        bindings = self.bindings
+        undo_log = self.undo_log
+        while len(undo_log) > start:
+            ident, shadowed = undo_log.pop()
+            if shadowed is UNBOUND:
+                del bindings[ident]
+            else:
+                bindings[ident] = shadowed
+
+    # Drops every binding and scope, for starting on the next function
+    def clear(self):
+        self.bindings.clear()
+        self.undo_log.clear()
+        self.scope_starts.clear()
+
+    def __getitem__(self, ident):
+        return self.bindings[ident]
+
+    def __contains__(self, ident):
+        return ident in self.bindings
+
+    def __len__(self):
+        return len(self.bindings)
+
+    def __str__(self):
+        return str(self.bindings)
@@ -0,0 +1,100 @@
+import gc
+import json
+import time
+import tracemalloc
+from blok.astnodes import AstNode
+
+
+# Attributes of AST nodes that point back up the tree
+BACK_REFERENCES = {"parent", "parent_loop"}
+
+
+# Records what each phase of compiling and running a program cost, plus sizes
+# such as the number of tokens, as JSON for --stats. A phase is timed by
+# handing it to measure(). With track_memory the bytes and blocks allocated by
+# a phase are traced as well, and the objects it left for the garbage
+# collector counted, which slows the phase down considerably.
+class Stats:
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.phases = {}
+        self.counts = {}
+
+    # Runs run() as the phase called name and returns what it returns
+    def measure(self, name, run):
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+
+            # Counting allocates too, so the peak is reset afterwards
+            start_blocks = len(tracemalloc.take_snapshot().traces)
+            start_objects = len(gc.get_objects())
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        try:
+            start_time = time.perf_counter()
+            start_cpu_time = time.process_time()
+            result = run()
+            phase = {
+                "wall_time": time.perf_counter() - start_time,
+                "cpu_time": time.process_time() - start_cpu_time,
+            }
+
+            if self.track_memory:
+                memory, peak_memory = tracemalloc.get_traced_memory()
+                # Memory still allocated at the end of the phase, and the most
+                # that was allocated during it
+                phase["allocated_bytes"] = memory - start_memory
+                phase["peak_bytes"] = peak_memory - start_memory
+                phase["allocated_blocks"] = len(tracemalloc.take_snapshot().traces) - start_blocks
+                phase["gc_objects"] = len(gc.get_objects()) - start_objects
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        self.phases[name] = phase
+        return result
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def to_dict(self):
+        return {"phases": self.phases, **self.counts}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+
+# Runs the phases without recording anything
+class NoStats:
+    def measure(self, name, run):
+        return run()
+
+    def count(self, name, value):
+        pass
+
+
+NO_STATS = NoStats()
+
+
+def count_nodes(root):
+    num_nodes = 0
+    worklist = [root]
+    while len(worklist) > 0:
+        node = worklist.pop()
+        num_nodes += 1
+        for cls in type(node).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if name in BACK_REFERENCES:
+                    continue
+
+                value = getattr(node, name, None)
+                if isinstance(value, AstNode):
+                    worklist.append(value)
+                elif isinstance(value, list):
+                    worklist += [child for child in value if isinstance(child, AstNode)]
+
+    return num_nodes
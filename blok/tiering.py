@@ -0,0 +1,162 @@
+import sys
+from blok.astnodes import BlkProgram
+from blok.codegen_python import CodeGenPython, NotCompilable
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.python_vm import PYTHON_RECURSION_LIMIT, make_grow
+from blok.trace import NO_TRACE, TraceLevel
+from blok.typechecker import TypeChecker
+from blok.vm_stack import DEFAULT_STACK_CONFIG
+from blok.blok_vm import (
+    OP_CALL_COMPILED,
+    OP_CALL_PROCEDURE,
+    Execution,
+    interp_traced,
+    run_lowered
+)
+
+
+# Instructions the VM runs between two looks at which function is running
+SAMPLE_INSTRS = 1000
+# Times a function is found running after which it is compiled to Python
+DEFAULT_HOT_THRESHOLD = 10
+
+
+# Compiles hot functions to Python with CodeGenPython. Nothing is parsed or
+# generated until the first function gets hot, so cold programs never pay for
+# it. The compiled functions use the VM stack as their memory, with their
+# frames where the VM would have put them, so pointers mean the same thing in
+# both tiers. sources holds the text of every module of the program, see
+# blok/modules.py, or just the one file.
+class HotFunctionCompiler:
+    def __init__(self, sources, stack_config=DEFAULT_STACK_CONFIG, tracer=NO_TRACE):
+        self.sources = sources
+        self.stack_config = stack_config
+        self.tracer = tracer
+        self.codegen = None
+        # Compiled functions grow the memory in place, which numpy arrays cannot do
+        self.compilable = stack_config.backing != "numpy"
+        self.namespace = {"grow": make_grow(stack_config)}
+        self.loaded = set()
+        self.promoted = []
+
+    # All functions share one namespace, so the modules can be compiled as one
+    # program
+    def generate(self):
+        ast = BlkProgram()
+        for text in self.sources:
+            module = parse_blkprogram(Lexer(text))
+            ast.structs += module.structs
+            ast.funcdecls += module.funcdecls
+
+        TypeChecker(ast)
+        self.codegen = CodeGenPython(ast)
+        self.codegen.gen_source()
+
+    def reachable(self, ident):
+        reached = {ident}
+        worklist = [ident]
+        while len(worklist) > 0:
+            for callee in self.codegen.func_callees[worklist.pop()]:
+                if callee not in reached:
+                    reached.add(callee)
+                    worklist.append(callee)
+
+        return reached
+
+    def is_recursive(self, ident):
+        return any(ident in self.reachable(callee)
+                   for callee in self.codegen.func_callees[ident])
+
+    # A compiled function that recurses too deeply raises RecursionError
+    # halfway through. The VM can only run the call again from the start if
+    # nothing it reaches writes through a pointer into the caller's memory.
+    def can_promote(self, ident):
+        reached = self.reachable(ident)
+        if not any(self.is_recursive(callee) for callee in reached):
+            return True
+
+        return not any(self.codegen.func_stores_through_pointers[callee] for callee in reached)
+
+    # Returns the compiled function, or None if it has to stay in the VM
+    def promote(self, ident):
+        if self.compilable and self.codegen == None:
+            try:
+                self.generate()
+            except NotCompilable as err:
+                self.compilable = False
+                if self.tracer.is_enabled(TraceLevel.PHASE):
+                    self.tracer.emit(f"keeping every function in the VM: {err}")
+
+        if not self.compilable or not self.can_promote(ident):
+            return None
+
+        for callee in self.reachable(ident) - self.loaded:
+            exec(compile(self.codegen.func_sources[callee], f"<blok {callee}>", "exec"),
+                 self.namespace)
+            self.loaded.add(callee)
+
+        self.promoted.append(ident)
+        if self.tracer.is_enabled(TraceLevel.PHASE):
+            self.tracer.emit(f"promoted {ident} to the Python tier")
+
+        return self.namespace[f"f_{ident}"]
+
+
+# Runs the code like interp_lowered, a slice of SAMPLE_INSTRS instructions at
+# a time. Each slice stops after a jump or a call, and the function it stopped
+# in gets warmer. Once a function has been stopped in hot_threshold times, its
+# calls are patched to call the compiled function instead. A function that gets
+# hot in a loop is promoted for its next call, since the VM cannot leave a
+# running frame. Promoted functions run as Python, which counts no
+# instructions, so the result only has num_instrs if nothing was promoted.
+# Nor can they be stopped, so a run with max_instrs or max_seconds stays in the
+# VM.
+def interp_tiered(code, hot_compiler, func_names, tracer=NO_TRACE,
+                  stack_config=DEFAULT_STACK_CONFIG, hot_threshold=DEFAULT_HOT_THRESHOLD,
+                  args=(), max_instrs=None, max_seconds=None):
+    if tracer.is_enabled(TraceLevel.CALL):
+        return interp_traced(code, tracer, stack_config, func_names, args, max_instrs,
+                             max_seconds)
+
+    execution = Execution(code, stack_config, func_names, args, max_instrs, max_seconds)
+    if max_instrs != None or max_seconds != None:
+        return run_lowered(execution)
+
+    ops = execution.ops
+    entries = sorted(func_names)
+    # The entry pc of the function every instruction belongs to
+    func_entry = [None] * len(ops)
+    for i, entry in enumerate(entries):
+        end = entries[i + 1] if i + 1 < len(entries) else len(ops)
+        func_entry[entry:end] = [entry] * (end - entry)
+
+    call_sites = {entry: [] for entry in entries}
+    for pc, op in enumerate(ops):
+        if op == OP_CALL_PROCEDURE:
+            call_sites[execution.args1[pc]].append(pc)
+
+    heat = {entry: 0 for entry in entries}
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, PYTHON_RECURSION_LIMIT))
+    try:
+        result = run_lowered(execution, SAMPLE_INSTRS)
+        while result == None:
+            entry = func_entry[execution.pc]
+            if entry != None and heat[entry] < hot_threshold:
+                heat[entry] += 1
+                if heat[entry] == hot_threshold:
+                    func = hot_compiler.promote(func_names[entry])
+                    if func != None:
+                        execution.compiled[entry] = func
+                        for pc in call_sites[entry]:
+                            ops[pc] = OP_CALL_COMPILED
+
+            result = run_lowered(execution, SAMPLE_INSTRS)
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    if len(hot_compiler.promoted) > 0:
+        result.num_instrs = None
+
+    return result
@@ -2,6 +2,8 @@ from enum import Enum
 
 
 class Token:
+    __slots__ = ("kind", "value", "line")
+
     def __init__(self, kind, value, line):
         self.kind = kind
         self.value = value
@@ -11,7 +13,9 @@ class Token:
         return f"<Token kind=\"{self.kind}\" value=\"{self.value}\" line=\"{self.line}\"/>"
 
 
-class TokenKind(Enum):
+# The kinds are ints, so the lexer can keep them in an array and the parser
+# compares them as ints
+class TokenKind(int, Enum):
     EOF                 = 100
     INVALID             = 101
     IDENT               = 102
@@ -50,6 +54,7 @@ class TokenKind(Enum):
     INT                 = 308
     VOID                = 309
     STRUCT              = 310
+    IMPORT              = 311
     # Separators
     SEMICOLON           = 400
     COMMA               = 401
@@ -58,4 +63,50 @@ class TokenKind(Enum):
     ROUND_BRAC_LEFT     = 404
     ROUND_BRAC_RIGHT    = 405
     SQUARE_BRAC_LEFT    = 406
-    SQUARE_BRAC_RIGHT   = 407
\ No newline at end of file
+    SQUARE_BRAC_RIGHT   = 407
+
+
+# The token kinds as plain ints, which are much faster to look up and compare
+# than the TokenKind members
+TK_EOF                = TokenKind.EOF.value
+TK_INVALID            = TokenKind.INVALID.value
+TK_IDENT              = TokenKind.IDENT.value
+TK_INT_LITERAL        = TokenKind.INT_LITERAL.value
+TK_BREAK              = TokenKind.BREAK.value
+TK_CONTINUE           = TokenKind.CONTINUE.value
+TK_PLUS               = TokenKind.PLUS.value
+TK_PLUS_EQUAL         = TokenKind.PLUS_EQUAL.value
+TK_MINUS              = TokenKind.MINUS.value
+TK_MINUS_EQUAL        = TokenKind.MINUS_EQUAL.value
+TK_STAR               = TokenKind.STAR.value
+TK_STAR_EQUAL         = TokenKind.STAR_EQUAL.value
+TK_SLASH              = TokenKind.SLASH.value
+TK_SLASH_EQUAL        = TokenKind.SLASH_EQUAL.value
+TK_EQUAL              = TokenKind.EQUAL.value
+TK_TWO_EQUAL          = TokenKind.TWO_EQUAL.value
+TK_EXMARK_EQUAL       = TokenKind.EXMARK_EQUAL.value
+TK_LESS_THAN          = TokenKind.LESS_THAN.value
+TK_LESS_THAN_EQUAL    = TokenKind.LESS_THAN_EQUAL.value
+TK_GREATER_THAN       = TokenKind.GREATER_THAN.value
+TK_GREATER_THAN_EQUAL = TokenKind.GREATER_THAN_EQUAL.value
+TK_TWO_AMPERSAND      = TokenKind.TWO_AMPERSAND.value
+TK_TWO_VERT_LINE      = TokenKind.TWO_VERT_LINE.value
+TK_IF                 = TokenKind.IF.value
+TK_ELSE               = TokenKind.ELSE.value
+TK_WHILE              = TokenKind.WHILE.value
+TK_FOR                = TokenKind.FOR.value
+TK_STEP               = TokenKind.STEP.value
+TK_DOT                = TokenKind.DOT.value
+TK_TWO_DOT            = TokenKind.TWO_DOT.value
+TK_RETURN             = TokenKind.RETURN.value
+TK_INT                = TokenKind.INT.value
+TK_VOID               = TokenKind.VOID.value
+TK_STRUCT             = TokenKind.STRUCT.value
+TK_IMPORT             = TokenKind.IMPORT.value
+TK_SEMICOLON          = TokenKind.SEMICOLON.value
+TK_COMMA              = TokenKind.COMMA.value
+TK_CURLY_BRAC_LEFT    = TokenKind.CURLY_BRAC_LEFT.value
+TK_CURLY_BRAC_RIGHT   = TokenKind.CURLY_BRAC_RIGHT.value
+TK_ROUND_BRAC_LEFT    = TokenKind.ROUND_BRAC_LEFT.value
+TK_ROUND_BRAC_RIGHT   = TokenKind.ROUND_BRAC_RIGHT.value
+TK_SQUARE_BRAC_LEFT   = TokenKind.SQUARE_BRAC_LEFT.value
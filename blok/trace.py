@@ -0,0 +1,55 @@
+import sys
+from collections import deque
+from enum import Enum
+
+
+class TraceLevel(Enum):
+    NONE    = 0
+    PHASE   = 1 # Compiler tables and the program before/after optimization
+    CALL    = 2 # Every procedure call and return in the VM
+    INSTR   = 3 # Every instruction executed by the VM and the stack after it
+
+    def __str__(self):
+        return self.name.lower()
+
+
+class FileSink:
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, line):
+        self.file.write(line + "\n")
+
+
+class RingBufferSink:
+    def __init__(self, capacity):
+        self.buffer = deque(maxlen=capacity)
+
+    def write(self, line):
+        self.buffer.append(line)
+
+    def lines(self):
+        return list(self.buffer)
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, line):
+        self.callback(line)
+
+
+class Tracer:
+    def __init__(self, level=TraceLevel.NONE, sink=None):
+        self.level = level
+        self.sink = sink if sink != None else FileSink(sys.stdout)
+
+    def is_enabled(self, level):
+        return self.level.value >= level.value
+
+    def emit(self, line):
+        self.sink.write(line)
+
+
+NO_TRACE = Tracer()
@@ -1,5 +1,32 @@
 from enum import Enum
-from blok.token import Token, TokenKind
+from blok.scopes import SymbolTable
+from blok.token import (
+    Token,
+    TokenKind,
+    TK_DOT,
+    TK_EQUAL,
+    TK_EXMARK_EQUAL,
+    TK_GREATER_THAN,
+    TK_GREATER_THAN_EQUAL,
+    TK_IDENT,
+    TK_INT,
+    TK_INT_LITERAL,
+    TK_LESS_THAN,
+    TK_LESS_THAN_EQUAL,
+    TK_MINUS,
+    TK_MINUS_EQUAL,
+    TK_PLUS,
+    TK_PLUS_EQUAL,
+    TK_SLASH_EQUAL,
+    TK_STAR,
+    TK_STAR_EQUAL,
+    TK_TWO_AMPERSAND,
+    TK_TWO_EQUAL,
+    TK_TWO_VERT_LINE,
+    TK_VOID
+)
+from blok.trace import NO_TRACE, TraceLevel
+from blok.visitor import Visitor
 from blok.astnodes import (
     BlkProgram,
     ReturnStatement,
@@ -18,32 +45,61 @@ from blok.astnodes import (
 )
 
 
-class TypeChecker:
-    def __init__(self, ast):
-        self.varident_to_evalkind = {}
+class TypeChecker(Visitor):
+    # imports holds the interfaces of the modules the program imports, see
+    # make_interface in blok/modules.py
+    def __init__(self, ast, tracer=NO_TRACE, iterative=False, imports=()):
+        super().__init__(iterative)
+        self.tracer = tracer
+        self.imports = imports
+        self.varident_to_evalkind = SymbolTable()
         self.funcident_to_evalkind = {}
         self.structident_to_stacksize = {}
         self.structident_to_varoffset = {}
         self.current_func = None
-        self.typecheck_blkprogram(ast)
-        print(self.varident_to_evalkind)
-        print(self.structident_to_varoffset)
+        self.statement_methods = self.make_dispatch_table({
+            VarDecl:         "typecheck_vardecl",
+            BinaryOp:        "typecheck_varassign",
+            IfStatement:     "typecheck_if_statement",
+            WhileLoop:       "typecheck_while_loop",
+            ForLoop:         "typecheck_for_loop",
+            FuncCall:        "typecheck_funccall",
+            ReturnStatement: "typecheck_return_statement",
+            LoopControl:     "typecheck_loopcontrol",
+            Block:           "typecheck_block",
+        })
+        self.expr_methods = self.make_dispatch_table({
+            Literal:  "typecheck_literal",
+            UnaryOp:  "typecheck_unaryop",
+            BinaryOp: "typecheck_binaryop",
+            FuncCall: "typecheck_funccall",
+        })
+        self.walk(self.typecheck_blkprogram(ast))
+        # Variables go out of scope with their block, so only the structs are left to trace
+        if self.tracer.is_enabled(TraceLevel.PHASE):
+            self.tracer.emit(str(self.structident_to_varoffset))
 
     def typecheck_blkprogram(self, blkprogram):
+        for interface in self.imports:
+            self.declare(interface)
+
+        self.declare(blkprogram)
+        for funcdecl in blkprogram.funcdecls:
+            yield self.typecheck_funcdecl(funcdecl)
+
+    # Makes the functions and structs of a program or of a module interface known
+    def declare(self, blkprogram):
         for funcdecl in blkprogram.funcdecls:
             ident = funcdecl.ident.value
-            if funcdecl.return_token.kind == TokenKind.VOID:
-                self.funcident_to_evalkind[ident] = EvalKind.VOID
-            elif funcdecl.return_token.kind == TokenKind.INT:
-                self.funcident_to_evalkind[ident] = EvalKind.INT
+            if funcdecl.return_token.kind == TK_VOID:
+                self.funcident_to_evalkind[ident] = EK_VOID
+            elif funcdecl.return_token.kind == TK_INT:
+                self.funcident_to_evalkind[ident] = EK_INT
             else: assert False, f"\n{ident}"
 
         for struct in blkprogram.structs:
             self.typecheck_struct(struct)
 
-        for funcdecl in blkprogram.funcdecls:
-            self.typecheck_funcdecl(funcdecl)
-
     def typecheck_struct(self, struct):
         ident = struct.ident.value
         self.structident_to_stacksize[ident] = struct.stack_size
@@ -55,20 +111,23 @@ class TypeChecker:
 
     def typecheck_return_statement(self, return_statement):
         if return_statement.expr != None:
-            self.typecheck_expr(return_statement.expr)
+            yield self.typecheck_expr(return_statement.expr)
 
     def typecheck_funccall(self, funccall):
         ident = funccall.ident.value
         funccall.eval_kind = self.funcident_to_evalkind[ident]
         for arg in funccall.args:
-            self.typecheck_expr(arg)
+            yield self.typecheck_expr(arg)
 
     def typecheck_funcdecl(self, funcdecl):
         self.current_func = funcdecl
         funcdecl.stack_size = len(funcdecl.params)
+        self.varident_to_evalkind.clear()
+        for param in funcdecl.params:
+            self.bind_var(param)
 
-        self.typecheck_block(funcdecl.block)
-        if funcdecl.return_token.kind == TokenKind.VOID and \
+        yield self.typecheck_block(funcdecl.block)
+        if funcdecl.return_token.kind == TK_VOID and \
            (len(funcdecl.block.statements) == 0 or
             not isinstance(funcdecl.block.statements[-1], ReturnStatement)):
             funcdecl.block.statements.append(ReturnStatement())
@@ -76,114 +135,98 @@ class TypeChecker:
         self.current_func = None
 
     def typecheck_block(self, block):
+        self.varident_to_evalkind.push_scope()
+        statement_methods = self.statement_methods
         for statement in block.statements:
-            if isinstance(statement, VarDecl):
-                self.typecheck_vardecl(statement)
-            elif isinstance(statement, BinaryOp):
-                self.typecheck_varassign(statement)
-            elif isinstance(statement, IfStatement):
-                self.typecheck_if_statement(statement)
-            elif isinstance(statement, WhileLoop):
-                self.typecheck_while_loop(statement)
-            elif isinstance(statement, ForLoop):
-                self.typecheck_for_loop(statement)
-            elif isinstance(statement, FuncCall):
-                self.typecheck_funccall(statement)
-            elif isinstance(statement, ReturnStatement):
-                self.typecheck_return_statement(statement)
-            elif isinstance(statement, LoopControl):
-                self.typecheck_loopcontrol(statement)
-            else: assert False, f"\n{statement}"
+            yield statement_methods[statement.__class__](statement)
+
+        self.varident_to_evalkind.pop_scope()
 
     def typecheck_for_loop(self, for_loop):
         self.current_func.stack_size += 1
-        self.typecheck_expr(for_loop.start)
-        self.typecheck_expr(for_loop.stop)
-        self.typecheck_expr(for_loop.step)
-        self.typecheck_block(for_loop.block)
+        yield self.typecheck_expr(for_loop.start)
+        yield self.typecheck_expr(for_loop.stop)
+        yield self.typecheck_expr(for_loop.step)
+        yield self.typecheck_block(for_loop.block)
 
     def typecheck_while_loop(self, while_loop):
-        self.typecheck_expr(while_loop.condition)
-        self.typecheck_block(while_loop.block)
+        yield self.typecheck_expr(while_loop.condition)
+        yield self.typecheck_block(while_loop.block)
 
     def typecheck_loopcontrol(self, loopcontrol):
         pass
 
     def typecheck_if_statement(self, if_statement):
-        self.typecheck_block(if_statement.block)
-        self.typecheck_expr(if_statement.condition)
-        if isinstance(if_statement.else_block, IfStatement):
-            self.typecheck_if_statement(if_statement.else_block)
-        elif isinstance(if_statement.else_block, Block):
-            self.typecheck_block(if_statement.else_block)
+        yield self.typecheck_block(if_statement.block)
+        yield self.typecheck_expr(if_statement.condition)
+        else_block = if_statement.else_block
+        if else_block != None:
+            yield self.statement_methods[else_block.__class__](else_block)
 
     def typecheck_varassign(self, varassign):
-        self.typecheck_expr(varassign.lhs)
-        self.typecheck_expr(varassign.rhs)
-        if varassign.op.kind != TokenKind.EQUAL:
+        yield self.typecheck_expr(varassign.lhs)
+        yield self.typecheck_expr(varassign.rhs)
+        if varassign.op.kind != TK_EQUAL:
             binaryop = BinaryOp()
             binaryop.lhs = varassign.lhs
             binaryop.rhs = varassign.rhs
-            binaryop.eval_kind = EvalKind.INT
+            binaryop.eval_kind = EK_INT
             op = varassign.op.kind
-            if   op == TokenKind.PLUS_EQUAL:  op = TokenKind.PLUS
-            elif op == TokenKind.MINUS_EQUAL: op = TokenKind.MINUS
-            elif op == TokenKind.STAR_EQUAL:  op = TokenKind.STAR
-            elif op == TokenKind.SLASH_EQUAL: op = TokenKind.SLASH
+            if   op == TK_PLUS_EQUAL:  op = TokenKind.PLUS
+            elif op == TK_MINUS_EQUAL: op = TokenKind.MINUS
+            elif op == TK_STAR_EQUAL:  op = TokenKind.STAR
+            elif op == TK_SLASH_EQUAL: op = TokenKind.SLASH
             else: assert False
 
             binaryop.op = Token(op, "", -1)
             varassign.rhs = binaryop
             varassign.op.kind = TokenKind.EQUAL
 
+    # Struct variables are bound to the name of their struct
+    def bind_var(self, vardecl):
+        if vardecl.kind.kind == TK_IDENT:
+            self.varident_to_evalkind.bind(vardecl.ident.value, vardecl.kind.value)
+        else:
+            self.varident_to_evalkind.bind(vardecl.ident.value, vardecl.kind.kind)
+
     def typecheck_vardecl(self, vardecl):
-        if vardecl.kind.kind == TokenKind.IDENT:
+        if vardecl.kind.kind == TK_IDENT:
             stack_size = self.structident_to_stacksize[vardecl.kind.value]
             vardecl.stack_size = stack_size
-            self.varident_to_evalkind[vardecl.ident.value] = vardecl.kind.value
-        else:
-            self.varident_to_evalkind[vardecl.ident.value] = vardecl.kind.kind
+
+        self.bind_var(vardecl)
 
         self.current_func.stack_size += vardecl.stack_size
         if vardecl.expr != None:
-            self.typecheck_expr(vardecl.expr)
+            yield self.typecheck_expr(vardecl.expr)
 
     def typecheck_expr(self, expr):
-        if isinstance(expr, Literal):
-            self.typecheck_literal(expr)
-        elif isinstance(expr, UnaryOp):
-            self.typecheck_unaryop(expr)
-        elif isinstance(expr, BinaryOp):
-            self.typecheck_binaryop(expr)
-        elif isinstance(expr, FuncCall):
-            self.typecheck_funccall(expr)
-        else: assert False, f"\n{expr}"
+        return self.expr_methods[expr.__class__](expr)
 
     def typecheck_literal(self, literal):
-        if literal.token.kind == TokenKind.INT_LITERAL:
-            literal.eval_kind = EvalKind.INT
-        elif literal.token.kind == TokenKind.IDENT:
+        if literal.token.kind == TK_INT_LITERAL:
+            literal.eval_kind = EK_INT
+        elif literal.token.kind == TK_IDENT:
             # TODO: Fix this temporary solution
-            literal.eval_kind = EvalKind.INT
+            literal.eval_kind = EK_INT
         else: assert False, f"\n{literal}"
 
     def typecheck_unaryop(self, unaryop):
-        self.typecheck_expr(unaryop.expr)
+        yield self.typecheck_expr(unaryop.expr)
         op_kind = unaryop.op.kind
-        if op_kind == TokenKind.PLUS or \
-           op_kind == TokenKind.MINUS:
-            unaryop.eval_kind = EvalKind.INT
-        elif op_kind == TokenKind.LESS_THAN:
-            unaryop.eval_kind = EvalKind.INT
-        elif op_kind == TokenKind.GREATER_THAN:
-            unaryop.eval_kind = EvalKind.PTR
+        if op_kind == TK_PLUS or \
+           op_kind == TK_MINUS:
+            unaryop.eval_kind = EK_INT
+        elif op_kind == TK_LESS_THAN:
+            unaryop.eval_kind = EK_INT
+        elif op_kind == TK_GREATER_THAN:
+            unaryop.eval_kind = EK_PTR
         else: assert False, f"\n{unaryop}"
 
     def typecheck_binaryop(self, binaryop):
         op_kind = binaryop.op.kind
-        if op_kind == TokenKind.DOT:
-            print(binaryop)
-            binaryop.eval_kind = EvalKind.INT
+        if op_kind == TK_DOT:
+            binaryop.eval_kind = EK_INT
             var_name = binaryop.lhs.token.value
             struct_ident = self.varident_to_evalkind[var_name]
             var_offsets = self.structident_to_varoffset[struct_ident]
@@ -192,21 +235,21 @@ class TypeChecker:
                     binaryop.rhs.offset  = i
                     return
 
-        self.typecheck_expr(binaryop.lhs)
-        self.typecheck_expr(binaryop.rhs)
-        if op_kind == TokenKind.PLUS or \
-           op_kind == TokenKind.MINUS or \
-           op_kind == TokenKind.STAR:
-            binaryop.eval_kind = EvalKind.INT
-        elif op_kind == TokenKind.TWO_EQUAL or \
-             op_kind == TokenKind.EXMARK_EQUAL or \
-             op_kind == TokenKind.LESS_THAN or \
-             op_kind == TokenKind.LESS_THAN_EQUAL or \
-             op_kind == TokenKind.GREATER_THAN or \
-             op_kind == TokenKind.GREATER_THAN_EQUAL or \
-             op_kind == TokenKind.TWO_AMPERSAND or \
-             op_kind == TokenKind.TWO_VERT_LINE:
-            binaryop.eval_kind = EvalKind.BOOL
+        yield self.typecheck_expr(binaryop.lhs)
+        yield self.typecheck_expr(binaryop.rhs)
+        if op_kind == TK_PLUS or \
+           op_kind == TK_MINUS or \
+           op_kind == TK_STAR:
+            binaryop.eval_kind = EK_INT
+        elif op_kind == TK_TWO_EQUAL or \
+             op_kind == TK_EXMARK_EQUAL or \
+             op_kind == TK_LESS_THAN or \
+             op_kind == TK_LESS_THAN_EQUAL or \
+             op_kind == TK_GREATER_THAN or \
+             op_kind == TK_GREATER_THAN_EQUAL or \
+             op_kind == TK_TWO_AMPERSAND or \
+             op_kind == TK_TWO_VERT_LINE:
+            binaryop.eval_kind = EK_BOOL
         else: assert False, f"\n{binaryop}"
 
 
@@ -217,3 +260,11 @@ class EvalKind(Enum):
     PTR     = 3
     def __str__(self):
         return self.name
+
+
+# The members as module globals, which are much faster to look up than
+# EvalKind.INT and friends
+EK_INT  = EvalKind.INT
+EK_BOOL = EvalKind.BOOL
+EK_VOID = EvalKind.VOID
+EK_PTR  = EvalKind.PTR
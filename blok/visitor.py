@@ -0,0 +1,53 @@
+# Nesting depth after which a recursive walk carries on iteratively, which
+# keeps it well below Python's default recursion limit of 1000
+MAX_RECURSIVE_DEPTH = 200
+
+
+# Base class of the passes over the AST. A pass finds the method for a node
+# through a table keyed by the node's class instead of a chain of isinstance
+# checks. A method that has to visit children is a generator: it yields the
+# visit of each child and carries on once that child has been visited
+# completely. Methods for nodes without children return None.
+#
+# walk() runs the yielded visits recursively, which is the fastest way for the
+# usual shallow ASTs, and switches to an explicit stack of suspended
+# generators for subtrees nested deeper than MAX_RECURSIVE_DEPTH. Setting
+# iterative uses the explicit stack for the whole AST.
+class Visitor:
+    def __init__(self, iterative=False):
+        self.iterative = iterative
+
+    def make_dispatch_table(self, method_names):
+        return {node_class: getattr(self, name) for node_class, name in method_names.items()}
+
+    def walk(self, visit):
+        if visit == None:
+            return
+
+        if self.iterative:
+            walk_iterative(visit)
+        else:
+            walk_recursive(visit, 0)
+
+
+def walk_recursive(visit, depth):
+    for child in visit:
+        if child == None:
+            continue
+
+        if depth < MAX_RECURSIVE_DEPTH:
+            walk_recursive(child, depth + 1)
+        else:
+            walk_iterative(child)
+
+
+def walk_iterative(visit):
+    stack = [visit]
+    while len(stack) > 0:
+        # Breaking out of the loop leaves the generator suspended
+        for child in stack[-1]:
+            if child != None:
+                stack.append(child)
+                break
+        else:
+            stack.pop()
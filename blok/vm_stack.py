@@ -0,0 +1,69 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DEFAULT_STACK_SIZE = 1024
+DEFAULT_MAX_STACK_SIZE = 1 << 24
+STACK_GROWTH_FACTOR = 2
+STACK_BACKINGS = ["list", "array", "numpy"]
+
+
+class StackConfig:
+    def __init__(self, size=DEFAULT_STACK_SIZE, max_size=DEFAULT_MAX_STACK_SIZE, backing="list"):
+        assert backing in STACK_BACKINGS, backing
+        # grow_stack doubles the size, which never gets past 0
+        if size < 1:
+            raise ValueError(f"the stack size must be at least 1, not {size}")
+        if backing == "numpy" and numpy == None:
+            raise ImportError("the numpy stack backing requires numpy to be installed")
+
+        self.size = size
+        self.max_size = max(size, max_size)
+        self.backing = backing
+
+
+DEFAULT_STACK_CONFIG = StackConfig()
+
+
+def make_stack(backing, size):
+    if backing == "list":
+        return [0] * size
+    if backing == "array":
+        return array("q", bytes(8 * size))
+    if backing == "numpy":
+        return numpy.zeros(size, dtype=numpy.int64)
+    assert False, backing
+
+
+# Stack for a run that passes args to Main. The call to Main saves pc and bp
+# in the first two slots and its frame, which starts with the parameters,
+# follows them. Main does not clear its frame, so the arguments are simply
+# left where its parameters go.
+def make_entry_stack(config, args):
+    stack = make_stack(config.backing, max(config.size, 2 + len(args)))
+    for idx, arg in enumerate(args):
+        stack[2 + idx] = arg
+
+    return stack
+
+
+def grow_stack(stack, config, min_size):
+    size = len(stack)
+    while size < min_size:
+        size *= STACK_GROWTH_FACTOR
+
+    size = min(size, config.max_size)
+    if size < min_size:
+        return None
+
+    new_stack = make_stack(config.backing, size)
+    new_stack[:len(stack)] = stack
+    return new_stack
+
+
+def stack_values(stack, sp):
+    return [int(value) for value in stack[:sp]]
@@ -1,28 +1,412 @@
+import argparse
+import time
+from blok.batch import DEFAULT_CHUNKSIZE, run_batch
+from blok.bytecode_cache import cache_key, cache_path_for, load_cache, save_cache
 from blok.codegen_bytecode import CodeGenByteCode
-from blok.blok_vm import interp_bytecode
-from blok.error import report_errors, errors
+from blok.codegen_python import CodeGenPython, NotCompilable
+from blok.codegen_register import CodeGenRegister
+from blok.blok_vm import (
+    interp_bytecode,
+    interp_lowered,
+    interp_profiled,
+    lift_lowered,
+    lower_bytecode
+)
+from blok.error import CompileFailed, report_errors, VMError
+from blok.incremental import NotIncremental, compile_incremental, incremental_cache_path_for
 from blok.lexer import Lexer
+from blok.modules import build, has_imports
 from blok.parsing import parse_blkprogram
+from blok.program import compile
+from blok.profiler import Profile
+from blok.python_vm import interp_python
+from blok.register_vm import interp_register, lower_register_code
+from blok.stats import NO_STATS, Stats, count_nodes
+from blok.tiering import (
+    DEFAULT_HOT_THRESHOLD,
+    SAMPLE_INSTRS,
+    HotFunctionCompiler,
+    interp_tiered
+)
+from blok.trace import FileSink, Tracer, TraceLevel
 from blok.typechecker import TypeChecker
+from blok.vm_stack import (
+    DEFAULT_STACK_SIZE,
+    DEFAULT_MAX_STACK_SIZE,
+    STACK_BACKINGS,
+    StackConfig
+)
 
 
-def main():
-    filename = "Main.blk"
-    text = ""
-    blkfile = open(filename)
-    for line in blkfile:
-        text += line
+def interp_loop(code, tracer, stack_config, func_names, max_instrs=None, max_seconds=None):
+    return interp_bytecode(lift_lowered(code), tracer, stack_config, func_names, max_instrs,
+                           max_seconds)
+
+
+ENGINES = {
+    "loop": interp_loop,
+    "fast": interp_lowered,
+}
+# Runs like "fast" and compiles hot functions to Python, see blok/tiering.py
+TIERED_ENGINE = "tiered"
+
+BACKENDS = ["stack", "register", "python"]
+# Used for programs the Python backend cannot compile or run
+FALLBACK_BACKEND = "stack"
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+
+    return value
+
 
-    blkfile.close()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile and run Main.blk")
+    parser.add_argument("--backend", choices=BACKENDS, default="stack",
+                        help="compile to stack machine bytecode, to register code or to "
+                             "Python functions")
+    parser.add_argument("--engine", choices=[*ENGINES, TIERED_ENGINE], default="loop",
+                        help="bytecode interpreter to execute stack machine bytecode with")
+    parser.add_argument("--hot-threshold", type=int, default=DEFAULT_HOT_THRESHOLD,
+                        help="number of times the tiered engine finds a function running, "
+                             f"looking every {SAMPLE_INSTRS} instructions, before it compiles the "
+                             "function to Python")
+    parser.add_argument("--ips", action="store_true",
+                        help="report the number of instructions executed per second")
+    parser.add_argument("--trace", choices=[str(level) for level in TraceLevel], default="none",
+                        help="how much of the compilation and execution to trace")
+    parser.add_argument("--trace-file",
+                        help="write the trace to this file instead of stdout")
+    parser.add_argument("--stack-size", type=positive_int, default=DEFAULT_STACK_SIZE,
+                        help="initial number of slots in the VM stack")
+    parser.add_argument("--max-stack-size", type=positive_int, default=DEFAULT_MAX_STACK_SIZE,
+                        help="number of slots the VM stack may grow to before overflowing")
+    parser.add_argument("--stack-backing", choices=STACK_BACKINGS, default="list",
+                        help="storage used for the VM stack")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always compile and do not read or write the .blkc bytecode cache")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the time and memory each phase took, and the sizes of the "
+                             "program in tokens, AST nodes and instructions, as JSON")
+    parser.add_argument("--stats-file",
+                        help="write the --stats JSON to this file instead of stdout")
+    parser.add_argument("--stats-no-memory", action="store_true",
+                        help="leave the allocations out of --stats, as tracing them slows "
+                             "every phase down")
+    parser.add_argument("--profile", action="store_true",
+                        help="run stack machine bytecode on a loop that times every "
+                             "instruction and print the hottest functions, lines and opcodes")
+    parser.add_argument("--flamegraph",
+                        help="profile like --profile and write the time spent in each call "
+                             "stack to this file in the collapsed-stack format")
+    parser.add_argument("--batch",
+                        help="instead of Main.blk, run the jobs in this file in parallel and "
+                             "print their results in order. Each line holds a .blk file and "
+                             "the integers to pass to its Main.")
+    parser.add_argument("--workers", type=int,
+                        help="number of processes --batch runs jobs in and the modules of a "
+                             "program are compiled in, one per core by default")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="number of --batch jobs handed to a worker at a time")
+    parser.add_argument("--max-instrs", type=int,
+                        help="stop the program, or each --batch job, after it executes about "
+                             "this many instructions. Only stack machine bytecode, without "
+                             "profiling, is stopped.")
+    parser.add_argument("--max-seconds", type=float,
+                        help="stop the program, or each --batch job, after it runs for about "
+                             "this many seconds. Only stack machine bytecode, without "
+                             "profiling, is stopped.")
+    return parser.parse_args()
+
+
+def compile_text(text, tracer, backend="stack", stats=NO_STATS, profile=None):
     lexer = Lexer(text)
-    ast = parse_blkprogram(lexer)
-    TypeChecker(ast)
-    if len(errors) > 0:
-        report_errors()
+    if stats != NO_STATS:
+        # The parser would otherwise lex as it goes
+        stats.count("tokens", stats.measure("lex", lexer.read_all_tokens))
+
+    try:
+        ast = stats.measure("parse", lambda: parse_blkprogram(lexer))
+    except CompileFailed as err:
+        report_errors(err.errors)
+        return None
+
+    if stats != NO_STATS:
+        stats.count("ast_nodes", count_nodes(ast))
+
+    stats.measure("typecheck", lambda: TypeChecker(ast, tracer))
+    if len(lexer.errors) > 0:
+        report_errors(lexer.errors)
+        return None
+
+    if backend == "register":
+        codegen = CodeGenRegister(ast, tracer)
+        code = stats.measure("codegen", codegen.gen_code)
+        return lower_register_code(code), codegen.idx_to_funcident
+
+    if backend == "python":
+        # Raises NotCompilable for programs the Python backend does not handle
+        return stats.measure("codegen", CodeGenPython(ast, tracer).gen_source), None
+
+    codegen = CodeGenByteCode(ast, tracer, line_info=profile != None)
+    bytecode = stats.measure("codegen", codegen.gen_bytecode)
+    if profile != None:
+        profile.idx_to_line = codegen.idx_to_line
+
+    stats.count("bytecode_before_optimization", codegen.unoptimized_length)
+    stats.count("bytecode_after_optimization", codegen.optimized_length)
+    return lower_bytecode(bytecode), codegen.idx_to_funcident
+
+
+# Only the stack backend has a per-function cache, and it skips the phases that
+# are traced, measured or profiled
+def can_compile_incrementally(tracer, backend, stats, profile):
+    return backend == "stack" and stats == NO_STATS and profile == None and \
+           not tracer.is_enabled(TraceLevel.PHASE)
+
+
+# The .blkc cache only holds lowered instructions, so the Python backend
+# always compiles
+def load_or_compile(filename, text, tracer, backend, use_cache, stats=NO_STATS, profile=None):
+    stats.count("backend", backend)
+    if backend == "python":
+        return compile_text(text, tracer, backend, stats)
+
+    cache_path = cache_path_for(filename, backend)
+    key = cache_key(text, backend)
+    compiled = load_cache(cache_path, key) if use_cache else None
+    # Nothing is compiled on a cache hit, so there are no compiler phases to report
+    stats.count("cached", compiled != None)
+    if compiled != None:
+        return compiled
+
+    if use_cache and can_compile_incrementally(tracer, backend, stats, profile):
+        try:
+            built = compile_incremental(text, incremental_cache_path_for(filename))
+            compiled = built.code, built.func_names
+        except NotIncremental:
+            pass # The full compile below reports any errors
+
+    if compiled == None:
+        compiled = compile_text(text, tracer, backend, stats, profile)
+
+    if compiled != None and use_cache:
+        try:
+            save_cache(cache_path, key, *compiled)
+        except OSError:
+            pass # Running without a cache is fine
+
+    return compiled
+
+
+# Every file is compiled once, however many jobs run it
+def main_batch(args):
+    with open(args.batch) as batchfile:
+        lines = [(line_num, line.split()) for line_num, line in enumerate(batchfile, 1)
+                 if line.strip() != ""]
+
+    programs = []
+    filename_to_idx = {}
+    jobs = []
+    for line_num, (filename, *job_args) in lines:
+        main_args = []
+        for arg in job_args:
+            try:
+                main_args.append(int(arg))
+            except ValueError:
+                print(f"{args.batch}({line_num}) error: argument '{arg}' is not an integer")
+                return
+
+        if filename not in filename_to_idx:
+            with open(filename) as blkfile:
+                text = blkfile.read()
+
+            try:
+                programs.append(compile(text, filename))
+            except CompileFailed as err:
+                report_errors(err.errors, filename)
+                return
+
+            filename_to_idx[filename] = len(programs) - 1
+
+        jobs.append((filename_to_idx[filename], main_args))
+
+    try:
+        stack_config = StackConfig(args.stack_size, args.max_stack_size, args.stack_backing)
+        results = run_batch(programs, jobs, args.workers, args.chunksize, args.max_instrs,
+                            stack_config, args.max_seconds)
+    except (ImportError, TypeError, ValueError) as err:
+        print(err)
+        return
+
+    for (_, (filename, *job_args)), result in zip(lines, results):
+        job = " ".join([filename, *job_args])
+        if result.error != None:
+            print(f"{job}: {result.error}")
+        else:
+            print(f"{job}: {' '.join(str(value) for value in result.values)}")
+
+
+# Programs with imports are built module by module with their own cache, see
+# blok/modules.py
+def build_modules(filename, workers, backend, use_cache, stats, profile):
+    if backend != "stack" or profile != None:
+        print("programs with imports can only be compiled to stack machine bytecode, "
+              "without profiling")
+        return None
+
+    stats.count("backend", backend)
+    try:
+        built = stats.measure("build", lambda: build(filename, workers, use_cache))
+    except CompileFailed as err:
+        report_errors(err.errors)
+        return None
+
+    stats.count("modules", len(built.sources))
+    stats.count("modules_recompiled", len(built.recompiled))
+    return built
+
+
+def trace_fallback(tracer, reason):
+    if tracer.is_enabled(TraceLevel.PHASE):
+        tracer.emit(f"running on the {FALLBACK_BACKEND} backend instead: {reason}")
+
+
+def main_file(args, tracer):
+    filename = "Main.blk"
+    with open(filename) as blkfile:
+        text = blkfile.read()
+
+    backend = args.backend
+    use_cache = not args.no_cache
+    stats = NO_STATS
+    if args.stats or args.stats_file != None:
+        stats = Stats(track_memory=not args.stats_no_memory)
+
+    profile = None
+    if args.profile or args.flamegraph != None:
+        if backend != "stack":
+            print("only stack machine bytecode can be profiled")
+            return
+
+        profile = Profile()
+        # The cache has no source lines
+        use_cache = False
+
+    # The register VM, the Python backend and the profiling loop do not count
+    # instructions or read the clock
+    if (args.max_instrs != None or args.max_seconds != None) and \
+       (backend != "stack" or profile != None):
+        print("--max-instrs and --max-seconds only apply to stack machine bytecode, "
+              "without profiling")
+        return
+
+    # The tiered engine compiles hot functions from the source again
+    sources = [text]
+    if has_imports(text):
+        built = build_modules(filename, args.workers, backend, use_cache, stats, profile)
+        if built == None:
+            return
+
+        compiled = built.code, built.func_names
+        sources = built.sources
+    else:
+        try:
+            compiled = load_or_compile(filename, text, tracer, backend, use_cache, stats, profile)
+        except NotCompilable as err:
+            trace_fallback(tracer, err)
+            backend = FALLBACK_BACKEND
+            compiled = load_or_compile(filename, text, tracer, backend, use_cache, stats)
+
+    if compiled == None:
+        return
+
+    code, func_names = compiled
+    try:
+        stack_config = StackConfig(args.stack_size, args.max_stack_size, args.stack_backing)
+    except (ImportError, ValueError) as err:
+        print(err)
+        return
+
+    start_time = time.perf_counter()
+    try:
+        if backend == "python":
+            try:
+                result = stats.measure("execute",
+                                       lambda: interp_python(code, tracer, stack_config))
+            except RecursionError:
+                trace_fallback(tracer, "the recursion is too deep for Python")
+                backend = FALLBACK_BACKEND
+                code, func_names = load_or_compile(filename, text, tracer, backend, use_cache,
+                                                   stats)
+                start_time = time.perf_counter()
+
+        if profile != None:
+            result = stats.measure("execute",
+                                   lambda: interp_profiled(code, profile, stack_config, func_names))
+        elif backend == "register":
+            result = stats.measure("execute",
+                                   lambda: interp_register(code, tracer, stack_config, func_names))
+        elif backend != "python" and args.engine == TIERED_ENGINE:
+            hot_compiler = HotFunctionCompiler(sources, stack_config, tracer)
+            result = stats.measure("execute",
+                                   lambda: interp_tiered(code, hot_compiler, func_names, tracer,
+                                                         stack_config, args.hot_threshold,
+                                                         max_instrs=args.max_instrs,
+                                                         max_seconds=args.max_seconds))
+        elif backend != "python":
+            engine = ENGINES[args.engine]
+            result = stats.measure("execute",
+                                   lambda: engine(code, tracer, stack_config, func_names,
+                                                  max_instrs=args.max_instrs,
+                                                  max_seconds=args.max_seconds))
+    except VMError as err:
+        print(err)
+        return
+
+    elapsed = time.perf_counter() - start_time
+    print(" ".join(str(value) for value in result.values))
+    stats.count("instructions_executed", result.num_instrs)
+    if args.stats_file != None:
+        with open(args.stats_file, "w") as stats_file:
+            stats_file.write(stats.to_json() + "\n")
+    elif args.stats:
+        print(stats.to_json())
+
+    if args.flamegraph != None:
+        with open(args.flamegraph, "w") as flamegraph_file:
+            profile.write_collapsed(flamegraph_file)
+    if args.profile:
+        for line in profile.format_report(text):
+            print(line)
+
+    if args.ips and result.num_instrs == None and backend == "python":
+        print(f"ran in {elapsed:.3f}s, the {backend} backend does not count instructions")
+    elif args.ips and result.num_instrs == None:
+        print(f"ran in {elapsed:.3f}s, functions compiled by the {TIERED_ENGINE} engine do not "
+              f"count instructions")
+    elif args.ips:
+        print(f"executed {result.num_instrs} instructions in {elapsed:.3f}s "
+              f"({result.num_instrs / elapsed:.0f} instructions/s)")
+
+
+def main():
+    args = parse_args()
+    if args.batch != None:
+        main_batch(args)
+        return
+
+    level = TraceLevel[args.trace.upper()]
+    if args.trace_file == None:
+        main_file(args, Tracer(level))
         return
 
-    bytecode = CodeGenByteCode(ast).gen_bytecode()
-    interp_bytecode(bytecode)
+    # Closing the file flushes the trace, also when the run crashes
+    with open(args.trace_file, "w") as trace_file:
+        main_file(args, Tracer(level, FileSink(trace_file)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import pytest
+from blok.program import compile
+
+
+# Nesting far beyond Python's recursion limit, which the parser, type
+# checker and code generator have to handle without recursing
+DEEP = 20_000
+
+
+def run_expr(expr):
+    return compile(f"int Main() {{\n    int a = {expr};\n    return a;\n}}\n").run().values[0]
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("10 - 3 - 2", 5),
+    ("2 - 3 + 4", 3),
+    ("100 - 10 * 2 - 3", 77),
+    ("2 * 3 - 4 * 5 - 6", -20),
+    ("1 - 2 * 3 + 4", -1),
+    ("(10 - 3) - 2", 5),
+    ("10 - (3 - 2)", 9),
+    ("-2 - -3", 1),
+])
+def test_operators_are_left_associative(expr, expected):
+    assert run_expr(expr) == expected
+
+
+def test_deep_chain():
+    digits = [i % 10 for i in range(DEEP)]
+    expr = " - ".join(str(digit) for digit in digits)
+    assert run_expr(expr) == digits[0] - sum(digits[1:])
+
+
+def test_deep_mixed_precedence():
+    terms = [(i % 10, i % 7) for i in range(DEEP // 3)]
+    expr = " + ".join(f"{a} * ({b} - 1)" for a, b in terms)
+    assert run_expr(expr) == sum(a * (b - 1) for a, b in terms)
+
+
+def test_deep_parens():
+    assert run_expr("(" * DEEP + "7" + ")" * DEEP) == 7
+
+
+def test_deep_unary():
+    assert run_expr("-" * DEEP + "7") == 7
+    assert run_expr("-" * (DEEP + 1) + "7") == -7
@@ -0,0 +1,81 @@
+import io
+import os
+import random
+import pytest
+from blok.error import CompileFailed
+from blok.lexer import Lexer, StreamLexer
+from blok.token import TokenKind
+
+
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "benchmarks", "programs")
+
+
+# Words and characters that take every path through the fast and the
+# character by character readers, errors among them
+PIECES = [
+    "int", "if", "else", "x", "abc_1", "Main", "step", "for", "_x", "a1_", "12ab", "é", "²",
+    "0", "1", "42", "9", "0x1f", "0b101", "1_000", "1__0", "1_", "0x", "0b", "1b", "2x",
+    "+", "+=", "-", "=", "==", "!", "!=", "<", "<=", ".", "..", "&&", "|", "{", "}", "(", ")",
+    "[", "]", ";", ",", "/", "/=", "//", "// comment\n", "a//b", "\n", "x\n", " ", "  ", "\t",
+    "@", "\r\n",
+]
+
+
+# The tokens the parser would see, each with the errors reported up to it,
+# and how the lexer stopped. The character by character reader reads past the
+# end of a text whose last line is a comment, which the others have to match.
+def read_tokens(lexer):
+    tokens = []
+    try:
+        while True:
+            token = lexer.peek_token()
+            errors = [(err.line, err.msg) for err in lexer.errors]
+            tokens.append((token.kind, token.value, token.line, errors))
+            if token.kind == TokenKind.EOF:
+                return tokens
+            lexer.eat_next_token()
+    except CompileFailed as failed:
+        tokens.append([(err.line, err.msg) for err in failed.errors])
+        return tokens
+    except IndexError:
+        tokens.append("IndexError")
+        return tokens
+
+
+def random_texts(seed, count, max_pieces):
+    rand = random.Random(seed)
+    return ["".join(rand.choice(PIECES) for _ in range(rand.randint(0, max_pieces)))
+            for _ in range(count)]
+
+
+def program_texts():
+    texts = []
+    for name in sorted(os.listdir(PROGRAMS_DIR)):
+        with open(os.path.join(PROGRAMS_DIR, name)) as blkfile:
+            texts.append(blkfile.read())
+
+    return texts
+
+
+def test_fast_lexer_matches_slow_lexer():
+    for text in program_texts() + random_texts(0, 2000, 30):
+        expected = read_tokens(Lexer(text, fast=False))
+        assert read_tokens(Lexer(text, fast=True)) == expected, repr(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+@pytest.mark.parametrize("binary", [False, True])
+def test_stream_lexer_matches_lexer(chunk_size, binary):
+    for text in program_texts() + random_texts(chunk_size, 300, 40):
+        source = io.BytesIO(text.encode()) if binary else io.StringIO(text)
+        expected = read_tokens(Lexer(text, fast=False))
+        assert read_tokens(StreamLexer(source, True, chunk_size)) == expected, repr(text)
+
+
+def test_stream_lexer_drops_consumed_tokens():
+    text = "int x;\n" * 5000
+    lexer = StreamLexer(io.StringIO(text), chunk_size=256)
+    num_tokens = len(read_tokens(lexer))
+    assert num_tokens == 3 * 5000 + 1
+    assert len(lexer.kinds) < 3 * 5000
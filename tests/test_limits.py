@@ -0,0 +1,159 @@
+import time
+import pytest
+from blok.batch import run_batch
+from blok.blok_vm import interp_bytecode, interp_lowered, lift_lowered, run_lowered
+from blok.error import VMError
+from blok.program import compile
+from blok.scheduler import run_round_robin
+from blok.tiering import HotFunctionCompiler, interp_tiered
+from blok.vm_stack import StackConfig
+
+
+FIB_PROGRAM = """int Fib(int n) {
+    if n < 2 {
+        return n;
+    }
+
+    return Fib(n - 1) + Fib(n - 2);
+}
+
+int Main(int n) {
+    return Fib(n);
+}
+"""
+
+FOREVER_PROGRAM = """int Step(int x) {
+    return x + 1;
+}
+
+int Main() {
+    int x = 0;
+    while 0 < 1 {
+        x = Step(x);
+    }
+
+    return x;
+}
+"""
+
+
+def run_loop(program, **limits):
+    return interp_bytecode(lift_lowered(program.code), func_names=program.func_names, **limits)
+
+
+def run_fast(program, **limits):
+    return interp_lowered(program.code, func_names=program.func_names, **limits)
+
+
+def run_tiered(program, **limits):
+    return interp_tiered(program.code, HotFunctionCompiler([FOREVER_PROGRAM]),
+                         program.func_names, hot_threshold=1, **limits)
+
+
+@pytest.fixture(scope="module")
+def fib():
+    return compile(FIB_PROGRAM)
+
+
+@pytest.fixture(scope="module")
+def forever():
+    return compile(FOREVER_PROGRAM)
+
+
+def test_instruction_budget(fib):
+    result = fib.run([15])
+    assert fib.run([15], max_instrs=result.num_instrs).values == [610]
+    with pytest.raises(VMError) as failed:
+        fib.run([15], max_instrs=result.num_instrs // 2)
+    assert failed.value.msg == f"instruction budget of {result.num_instrs // 2} exceeded"
+    assert "in Fib" in failed.value.call_trace[0]
+
+
+def test_time_limit(forever):
+    with pytest.raises(VMError) as failed:
+        forever.run(max_seconds=0.05)
+    assert failed.value.msg == "time limit of 0.05 s exceeded"
+
+
+@pytest.mark.parametrize("run", [run_loop, run_fast, run_tiered])
+def test_every_engine_stops(forever, run):
+    with pytest.raises(VMError) as failed:
+        run(forever, max_instrs=100_000)
+    assert failed.value.msg == "instruction budget of 100000 exceeded"
+
+    with pytest.raises(VMError) as failed:
+        run(forever, max_seconds=0.05)
+    assert failed.value.msg == "time limit of 0.05 s exceeded"
+
+
+def test_stack_overflow(fib):
+    with pytest.raises(VMError) as failed:
+        fib.run([15], stack_size=4, max_stack_size=16)
+    assert failed.value.msg == "stack overflow"
+    assert fib.run([15], stack_size=4).values == [610]
+
+
+@pytest.mark.parametrize("size", [0, -1])
+def test_stack_size_must_be_positive(size):
+    with pytest.raises(ValueError):
+        StackConfig(size)
+
+
+def test_wrong_number_of_arguments(fib):
+    with pytest.raises(TypeError):
+        fib.run([1, 2])
+
+
+# The budget is of the whole run, however many slices it is run in
+@pytest.mark.parametrize("slice_instrs", [1, 100, 10_000])
+def test_budget_over_slices(fib, slice_instrs):
+    num_instrs = fib.run([12]).num_instrs
+    execution = fib.start([12], max_instrs=num_instrs)
+    result = None
+    while result == None:
+        result = run_lowered(execution, slice_instrs)
+    assert result.values == [144]
+    assert result.num_instrs == num_instrs
+
+    execution = fib.start([12], max_instrs=num_instrs - 100)
+    with pytest.raises(VMError):
+        while run_lowered(execution, slice_instrs) == None:
+            pass
+
+
+def test_round_robin_stops_only_runs_over_their_limits(fib, forever):
+    executions = [
+        forever.start(max_instrs=100_000),
+        fib.start([15]),
+        forever.start(max_seconds=0.05),
+        fib.start([10], max_instrs=50),
+        fib.start([12]),
+    ]
+    outcomes = run_round_robin(executions, 1000)
+    assert outcomes[0].msg == "instruction budget of 100000 exceeded"
+    assert outcomes[1].values == [610]
+    assert outcomes[2].msg == "time limit of 0.05 s exceeded"
+    assert outcomes[3].msg == "instruction budget of 50 exceeded"
+    assert outcomes[4].values == [144]
+
+
+# Five runs taking turns take five times as long as one, which the limit of
+# each must not count
+def test_time_limit_counts_only_own_turns(fib):
+    start_time = time.perf_counter()
+    expected = fib.run([20])
+    alone = time.perf_counter() - start_time
+    executions = [fib.start([20], max_seconds=3 * alone) for _ in range(5)]
+    start_time = time.perf_counter()
+    outcomes = run_round_robin(executions, 1000)
+    elapsed = time.perf_counter() - start_time
+    assert [outcome.values for outcome in outcomes] == [expected.values] * 5
+    assert sum(execution.seconds_used for execution in executions) <= elapsed
+
+
+def test_batch_reports_errors_per_job(fib):
+    results = run_batch([fib], [(0, [15]), (0, [20]), (0, [5])], workers=1, max_instrs=100_000)
+    assert [result.values for result in results] == [[610], None, [5]]
+    assert results[1].error.startswith("runtime error: instruction budget of 100000 exceeded")
+    with pytest.raises(TypeError):
+        run_batch([fib], [(0, [])], workers=1)
@@ -0,0 +1,43 @@
+import os
+import pytest
+from blok.blok_vm import interp_lowered, lower_bytecode
+from blok.codegen_bytecode import CodeGenByteCode
+from blok.lexer import Lexer
+from blok.parsing import parse_blkprogram
+from blok.typechecker import TypeChecker
+
+
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "benchmarks", "programs")
+PROGRAMS = sorted(name for name in os.listdir(PROGRAMS_DIR) if name.endswith(".blk"))
+
+
+def gen_bytecode(path, **codegen_options):
+    with open(path) as blkfile:
+        lexer = Lexer(blkfile.read())
+
+    ast = parse_blkprogram(lexer)
+    TypeChecker(ast)
+    assert lexer.errors == []
+    codegen = CodeGenByteCode(ast, **codegen_options)
+    return codegen.gen_bytecode(), codegen.idx_to_funcident
+
+
+def run(bytecode, func_names):
+    return interp_lowered(lower_bytecode(bytecode), func_names=func_names).values
+
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_code_gives_unoptimized_results(name):
+    path = os.path.join(PROGRAMS_DIR, name)
+    bytecode, func_names = gen_bytecode(path, superinstructions=False, optimize=False)
+    expected = run(bytecode, func_names)
+    for options in [
+        {"superinstructions": False},
+        {"optimize": False},
+        {},
+    ]:
+        optimized, func_names = gen_bytecode(path, **options)
+        assert len(optimized) < len(bytecode), options
+        assert run(optimized, func_names) == expected, options
+
@@ -0,0 +1,129 @@
+import os
+import pytest
+from blok.blok_vm import interp_lowered
+from blok.incremental import compile_incremental
+from blok.modules import build
+from blok.program import compile
+
+
+VEC_MODULE = """struct Vec {
+    int x;
+    int y;
+}
+
+int Dot(int ax, int ay, int bx, int by) {
+    return ax * bx + ay * by;
+}
+"""
+
+MATH_MODULE = """import Vec;
+
+int Square(int x) {
+    return x * x;
+}
+
+int LengthSquared(int x, int y) {
+    Vec v;
+    v.x = x;
+    v.y = y;
+    return Dot(v.x, v.y, v.x, v.y);
+}
+"""
+
+MAIN_MODULE = """import Vec;
+import Math;
+
+int Main() {
+    Vec v;
+    v.x = 3;
+    v.y = 4;
+    return LengthSquared(v.x, v.y) * 100 + Square(v.x);
+}
+"""
+
+# The modules above as one file
+PROGRAM = "\n".join([
+    VEC_MODULE,
+    MATH_MODULE.replace("import Vec;\n\n", ""),
+    MAIN_MODULE.replace("import Vec;\nimport Math;\n\n", ""),
+])
+
+
+def write_module(directory, name, text):
+    with open(os.path.join(directory, f"{name}.blk"), "w") as blkfile:
+        blkfile.write(text)
+
+
+# Returns the result of Main and the modules that were compiled again
+def build_and_run(directory):
+    built = build(os.path.join(directory, "Main.blk"), workers=1)
+    result = interp_lowered(built.code, func_names=built.func_names)
+    return result.values[0], sorted(os.path.basename(path) for path in built.recompiled)
+
+
+@pytest.fixture
+def modules_dir(tmp_path):
+    write_module(tmp_path, "Vec", VEC_MODULE)
+    write_module(tmp_path, "Math", MATH_MODULE)
+    write_module(tmp_path, "Main", MAIN_MODULE)
+    assert build_and_run(tmp_path) == (2509, ["Main.blk", "Math.blk", "Vec.blk"])
+    assert build_and_run(tmp_path) == (2509, [])
+    return tmp_path
+
+
+def test_module_body_edit(modules_dir):
+    write_module(modules_dir, "Math", MATH_MODULE.replace("return x * x;", "return x * x + 1;"))
+    assert build_and_run(modules_dir) == (2510, ["Math.blk"])
+
+
+# Every module that imports Vec has to use the new field offsets
+def test_module_struct_edit(modules_dir):
+    write_module(modules_dir, "Vec", VEC_MODULE.replace("    int x;\n", "    int z;\n    int x;\n"))
+    assert build_and_run(modules_dir) == (2509, ["Main.blk", "Math.blk", "Vec.blk"])
+
+
+# Main's text is the same, but its calls have to be compiled for the new
+# signature
+def test_module_signature_edit(modules_dir):
+    write_module(modules_dir, "Math", MATH_MODULE.replace(
+        "int Square(int x) {\n    return x * x;", "int Square(int x, int y) {\n    return x * y;"))
+    _, recompiled = build_and_run(modules_dir)
+    assert recompiled == ["Main.blk", "Math.blk"]
+
+    write_module(modules_dir, "Main", MAIN_MODULE.replace("Square(v.x)", "Square(v.x, v.y)"))
+    assert build_and_run(modules_dir) == (2512, ["Main.blk"])
+
+
+# Returns the result of Main, which has to be that of a full compile, and the
+# functions that were compiled again
+def compile_and_run(text, cache_path):
+    built = compile_incremental(text, cache_path)
+    result = interp_lowered(built.code, func_names=built.func_names)
+    assert result.values == compile(text).run().values
+    return result.values[0], sorted(built.recompiled)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    cache_path = str(tmp_path / "Main.blki")
+    assert compile_and_run(PROGRAM, cache_path) == (
+        2509, ["Dot", "LengthSquared", "Main", "Square"])
+    assert compile_and_run(PROGRAM, cache_path) == (2509, [])
+    return cache_path
+
+
+def test_incremental_body_edit(cache_path):
+    text = PROGRAM.replace("return x * x;", "return x * x + 1;")
+    assert compile_and_run(text, cache_path) == (2510, ["Square"])
+
+
+def test_incremental_struct_edit(cache_path):
+    text = PROGRAM.replace("    int x;\n    int y;\n", "    int z;\n    int x;\n    int y;\n")
+    assert compile_and_run(text, cache_path) == (2509, ["LengthSquared", "Main"])
+
+
+def test_incremental_signature_edit(cache_path):
+    text = PROGRAM.replace("int Square(int x) {\n    return x * x;",
+                           "int Square(int x, int y) {\n    return x * y;")
+    text = text.replace("Square(v.x)", "Square(v.x, v.y)")
+    assert compile_and_run(text, cache_path) == (2512, ["Main", "Square"])